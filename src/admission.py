@@ -0,0 +1,199 @@
+from collections import OrderedDict
+from math import ceil
+from threading import Condition, Lock
+from time import monotonic
+from typing import Any, Dict, Hashable, List, Tuple, Union
+
+from .exchange import Exchange
+from .response import Response
+
+"""
+Admission control, checked after a request is routed and before any middleware or handler runs:
+  - token buckets per client (by address, or by a header set by a trusted proxy) and per route
+    pattern answer 429 with the time until the next token in Retry-After
+  - a global concurrency limit answers 503. On the threaded servers a request over the limit waits up
+    to max_queue_delay for a slot, and once the wait for a slot has stayed above target_delay for a
+    whole interval (CoDel), requests that would have to wait are shed straight away until a slot is
+    free on arrival again
+    server.admission = AdmissionControl(client_rate=20, client_burst=40, max_concurrency=64)
+"""
+
+# bucket locks are striped by key so that threads limiting different clients don't contend
+_STRIPES = 64
+
+
+class Rejection:
+    __slots__ = ("status", "reason", "retry_after")
+
+    def __init__(self, status: int, reason: str, retry_after: int):
+        self.status = status
+        self.reason = reason
+        self.retry_after = retry_after
+
+    def send(self, response: Response):
+        response.status(self.status)
+        response.header("Retry-After", str(self.retry_after))
+        response.send_raw(b"Too Many Requests" if self.status == 429 else b"Service Unavailable")
+
+
+class TokenBuckets:
+    """
+    Token buckets holding up to burst tokens and refilled at rate tokens per second, by key. At most
+    max_keys buckets are kept: once a stripe is full, its least recently used bucket is dropped.
+    """
+    def __init__(self, rate: float, burst: float, max_keys: int=100000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        # key -> [tokens, last update], least recently used first, in the stripe the key hashes to
+        self._stripe_keys = max(1, max_keys // _STRIPES)
+        self._buckets: List["OrderedDict[Hashable, List[float]]"] = [OrderedDict() for _ in range(_STRIPES)]
+        self._locks = [Lock() for _ in range(_STRIPES)]
+
+    def take(self, key: Hashable, now: float) -> float:
+        """Takes a token; returns 0.0 if there was one, or else the seconds until there will be"""
+        stripe = hash(key) % _STRIPES
+        buckets = self._buckets[stripe]
+        with self._locks[stripe]:
+            bucket = buckets.get(key)
+            if bucket is None:
+                # the dropped bucket has most likely refilled; if not, its client gets a full one back
+                if len(buckets) >= self._stripe_keys:
+                    buckets.popitem(last=False)
+                bucket = buckets[key] = [self.burst, now]
+            else:
+                buckets.move_to_end(key)
+            tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if tokens >= 1.0:
+                bucket[0] = tokens - 1.0
+                return 0.0
+            bucket[0] = tokens
+            return (1.0 - tokens) / self.rate
+
+    def __len__(self) -> int:
+        return sum(len(buckets) for buckets in self._buckets)
+
+
+class AdmissionControl:
+    def __init__(self, client_rate: Union[float, None]=None, client_burst: Union[float, None]=None, route_limits: Union[Dict[str, Tuple[float, float]], None]=None, max_concurrency: Union[int, None]=None, max_queue_delay: float=0.1, max_queue: int=1024, target_delay: float=0.005, interval: float=0.1, retry_after: int=1, client_header: Union[str, None]=None, max_clients: int=100000):
+        """
+        client_rate/client_burst: requests per second and burst size allowed per client.
+        route_limits: route pattern -> (rate, burst) shared by all clients of that route.
+        max_concurrency: requests dispatched at once; the others wait for a slot (up to max_queue of
+        them, for up to max_queue_delay seconds) or are shed.
+        client_header: identify clients by this header (e.g. X-Forwarded-For) instead of their
+        address; only use it behind a proxy that sets it.
+        """
+        self.clients = TokenBuckets(client_rate, client_burst if client_burst is not None else max(1.0, client_rate), max_clients) if client_rate else None
+        self.routes = {pattern: TokenBuckets(rate, burst) for pattern, (rate, burst) in (route_limits or {}).items()}
+        self.max_concurrency = max_concurrency
+        self.max_queue_delay = max_queue_delay
+        self.max_queue = max_queue
+        self.target_delay = target_delay
+        self.interval = interval
+        self.retry_after = retry_after
+        self.client_header = client_header
+        self.in_flight = 0
+        self.waiting = 0
+        self.rejected: Dict[str, int] = {"client": 0, "route": 0, "concurrency": 0, "shed": 0}
+        # the fast paths take the lock directly, since Condition's own methods are slower
+        self._lock = Lock()
+        self._slots = Condition(self._lock)
+        self._above_since = 0.0
+        self._shedding = False
+        self._stats_lock = Lock()
+
+    def client_key(self, exchange: Exchange) -> Any:
+        if self.client_header is not None:
+            value = exchange.headers.get(self.client_header)
+            if value:
+                return value.split(",", 1)[0].strip()
+        address = exchange.client_address
+        return address[0] if isinstance(address, tuple) else address
+
+    def admit(self, exchange: Exchange, pattern: Union[str, None], wait: bool=True) -> Union[Rejection, None]:
+        """
+        None if the request may be dispatched, in which case release() must be called once its response
+        is written; otherwise the response to send instead. wait=False never blocks (for event loops).
+        """
+        now = monotonic()
+        if self.clients is not None:
+            delay = self.clients.take(self.client_key(exchange), now)
+            if delay:
+                return self._reject("client", 429, delay)
+        if pattern:
+            route = self.routes.get(pattern)
+            if route is not None:
+                delay = route.take(pattern, now)
+                if delay:
+                    return self._reject("route", 429, delay)
+        if self.max_concurrency is not None:
+            reason = self._acquire(now, wait)
+            if reason is not None:
+                return self._reject(reason, 503, self.retry_after)
+        return None
+
+    def release(self):
+        if self.max_concurrency is None:
+            return
+        with self._lock:
+            self.in_flight -= 1
+            if self.waiting:
+                self._slots.notify()
+
+    def _acquire(self, now: float, wait: bool) -> Union[str, None]:
+        # returns None once a slot is taken, or why the request is shed
+        assert self.max_concurrency is not None
+        with self._lock:
+            if self.in_flight < self.max_concurrency:
+                self.in_flight += 1
+                self._queue_delay(0.0, now)
+                return None
+            if not wait or self.max_queue_delay <= 0 or self.waiting >= self.max_queue:
+                return "concurrency"
+            if self._shedding:
+                return "shed"
+            deadline = now + self.max_queue_delay
+            self.waiting += 1
+            try:
+                while self.in_flight >= self.max_concurrency:
+                    remaining = deadline - monotonic()
+                    if remaining <= 0:
+                        self._queue_delay(self.max_queue_delay, monotonic())
+                        return "concurrency"
+                    if self._shedding:
+                        return "shed"
+                    self._slots.wait(remaining)
+            finally:
+                self.waiting -= 1
+            self.in_flight += 1
+            admitted = monotonic()
+            self._queue_delay(admitted - now, admitted)
+            return None
+
+    def _queue_delay(self, delay: float, now: float):
+        # CoDel: shed once the delay has stayed above target for an interval, stop once it drops below
+        if delay < self.target_delay:
+            self._above_since = 0.0
+            self._shedding = False
+        elif not self._above_since:
+            self._above_since = now
+        elif now - self._above_since >= self.interval:
+            self._shedding = True
+
+    def _reject(self, reason: str, status: int, retry_after: float) -> Rejection:
+        with self._stats_lock:
+            self.rejected[reason] += 1
+        return Rejection(status, reason, max(1, ceil(retry_after)))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            rejected = dict(self.rejected)
+        return {
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "shedding": self._shedding,
+            "clients": len(self.clients) if self.clients is not None else 0,
+            "rejected": rejected,
+        }
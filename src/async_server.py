@@ -0,0 +1,354 @@
+from asyncio import get_running_loop, run, start_server, wait_for, TimeoutError as AsyncTimeoutError
+from asyncio.streams import StreamReader, StreamWriter
+from email.message import Message
+from email.utils import formatdate
+from io import BytesIO
+from sys import stderr
+from time import monotonic, perf_counter
+from traceback import print_exc
+from typing import Any, AsyncIterator, Dict, List, Union
+
+from .body import RequestBodyError
+from .deadline import BODY_REJECTIONS, RejectionCounters
+from .dispatch_cache import Dispatch
+from .executor import HandlerExecutor
+from .file_body import FileBody
+from .handler import AnyRequestHandler, HttpMethod, RequestHandler, is_coroutine_handler, run_after_handlers, run_handlers
+from .http_parser import HttpParseError, ParsedRequest, RequestParser
+from .request import Request
+from .response import Response
+from .response_cache import ResponseCache
+from .router import Router
+from .serialize import serialize_head
+from .streaming import LAST_CHUNK, StreamBody, aclose_stream, frame_chunk, is_async_iterable
+from .types import Headers, Params
+
+
+_METHODS: Dict[str, HttpMethod] = {"GET": "get", "HEAD": "head", "PUT": "put", "POST": "post", "PATCH": "patch", "DELETE": "delete"}
+
+
+_PARSE_REJECTIONS = {431: "headers_too_large", 413: "body_too_large"}
+# RequestParser.phase() -> the kind of rejection a read timeout in it counts as. Waiting for a new
+# connection's first request counts as a request line timeout, waiting for a later one is idle time
+_PHASE_REJECTIONS = {"idle": "request_line_timeout", "request_line": "request_line_timeout", "head": "header_timeout", "body": "body_timeout"}
+
+
+class AsyncExchange:
+    """Exchange for a request parsed by RequestParser; the body has already been read, and spooled past spool_threshold"""
+    def __init__(self, parsed: ParsedRequest, client_address: Any=None):
+        self.path = parsed.path
+        self.command = parsed.command
+        self.request_version = parsed.request_version
+        self.headers: Message = parsed.headers
+        self.rfile = parsed.body if parsed.body is not None else BytesIO()
+        self.client_address = client_address
+
+
+class _Connection:
+    # request/response objects reused for every request on a connection
+    __slots__ = ("request", "response", "peer")
+
+    def __init__(self, peer: Any=None):
+        self.request: Union[Request, None] = None
+        self.response: Union[Response, None] = None
+        self.peer = peer
+
+
+class AsyncPyserve(Router):
+    def __init__(self, host: str, port: int, dispatch_cache_size: int=1024, keep_alive: bool=True, keep_alive_timeout: float=5.0, max_keep_alive_requests: int=1000, max_header_size: int=64 * 1024, max_body_size: int=16 * 1024 * 1024, spool_threshold: int=1024 * 1024, read_size: int=64 * 1024, backlog: int=1024, access_log: bool=True, max_workers: Union[int, None]=None, max_queue: Union[int, None]=None, offload_sync_handlers: bool=True, request_line_timeout: float=10.0, header_timeout: float=10.0, body_timeout: float=60.0, write_timeout: float=30.0):
+        super().__init__(dispatch_cache_size)
+        self.host = host
+        self.port = port
+        self.keep_alive = keep_alive
+        self.keep_alive_timeout = keep_alive_timeout
+        self.max_keep_alive_requests = max_keep_alive_requests
+        self.max_header_size = max_header_size
+        self.max_body_size = max_body_size
+        # bodies larger than this are written to a temp file while they arrive instead of kept in memory
+        self.spool_threshold = spool_threshold
+        self.read_size = read_size
+        self.backlog = backlog
+        self.access_log = access_log
+        # sync handlers run on this pool so that they never block the event loop
+        self.executor = HandlerExecutor(max_workers, max_queue)
+        self.offload_sync_handlers = offload_sync_handlers
+        # deadlines (in seconds): for the first bytes of a connection's first request, for a whole
+        # request head once it has started arriving, for a whole body, and for each flush of a response
+        self.request_line_timeout = request_line_timeout
+        self.header_timeout = header_timeout
+        self.body_timeout = body_timeout
+        self.write_timeout = write_timeout
+        self.rejections = RejectionCounters()
+        self.server = None
+
+    def _check_handler(self, handler: AnyRequestHandler):
+        # requests coalesced by a ResponseCache would block pool threads (or the event loop) until the
+        # store hook runs, and that hook is queued on the same pool
+        if isinstance(handler, ResponseCache) and not is_coroutine_handler(handler):
+            raise TypeError(f"{handler!r} blocks while it coalesces requests; use AsyncResponseCache with AsyncPyserve")
+        super()._check_handler(handler)
+
+    def _log(self, writer: StreamWriter, parsed: ParsedRequest, status: int):
+        if not self.access_log:
+            return
+        peer = writer.get_extra_info("peername")
+        client = peer[0] if peer else "-"
+        stderr.write(f'{client} - - [{formatdate(localtime=True)}] "{parsed.command} {parsed.path} {parsed.request_version}" {status} -\n')
+
+    def _write(self, writer: StreamWriter, method: str, status: int, headers: Headers, body: bytes, close: bool, chunked: bool=False, keep_alive: bool=False):
+        head = serialize_head(status, headers, close, keep_alive, chunked)
+        if method == "head" or not body:
+            writer.write(head)
+        else:
+            # one buffer list, so the transport can send head and body with a single writev
+            writer.writelines((head, body))
+
+    async def _drain(self, writer: StreamWriter):
+        try:
+            await wait_for(writer.drain(), self.write_timeout)
+        except AsyncTimeoutError:
+            self.rejections.count("write_timeout")
+            raise
+
+    async def _send_file(self, writer: StreamWriter, file_body: FileBody):
+        try:
+            await self._drain(writer)
+            if file_body.length > 0:
+                # uses os.sendfile when the transport supports it and falls back to chunked reads
+                await get_running_loop().sendfile(writer.transport, file_body.file, file_body.offset, file_body.length)
+        finally:
+            file_body.close()
+
+    async def _stream_chunks(self, stream: StreamBody) -> AsyncIterator[bytes]:
+        if is_async_iterable(stream):
+            async for chunk in stream:  # type: ignore[union-attr]
+                yield chunk
+            return
+        if not self.offload_sync_handlers or isinstance(stream, (bytes, list, tuple)):
+            for chunk in stream:  # type: ignore[union-attr]
+                yield chunk
+            return
+        # a sync generator may block between chunks, so each one is produced on the pool
+        iterator = iter(stream)  # type: ignore[arg-type]
+        while True:
+            chunk = await self.executor.run(next, iterator, None)
+            if chunk is None:
+                return
+            yield chunk
+
+    async def _send_stream(self, writer: StreamWriter, stream: StreamBody, chunked: bool) -> bool:
+        # writes and flushes each chunk as it is produced; returns False if the connection must close
+        try:
+            async for chunk in self._stream_chunks(stream):
+                if chunk:
+                    writer.write(frame_chunk(chunk) if chunked else chunk)
+                    await self._drain(writer)
+            if chunked:
+                writer.write(LAST_CHUNK)
+            return True
+        except (ConnectionError, OSError):
+            return False
+        except Exception:
+            print_exc()
+            return False
+        finally:
+            await aclose_stream(stream)
+
+    def _error(self, writer: StreamWriter, status: int, message: str):
+        body = message.encode()
+        headers = Headers()
+        headers["Content-Length"] = str(len(body))
+        self._write(writer, "", status, headers, body, True)
+
+    async def _run_chain(self, dispatch: Dispatch, request: Request, response: Response, timings: Union[List[float], None]=None):
+        chain = dispatch.chain
+        profiler = self.profiler
+        if profiler is not None:
+            profiler.track(request)
+        # only sync handlers are profiled: a profile of a coroutine would take in whatever else the loop ran
+        profiled = profiler is not None and profiler.wants(request)
+        i = 0
+        while i < len(chain) and not response.hasBeenSent():
+            if dispatch.coroutines[i]:
+                if timings is None:
+                    await chain[i](request, response)  # type: ignore[misc]
+                else:
+                    start = perf_counter()
+                    await chain[i](request, response)  # type: ignore[misc]
+                    timings.append(perf_counter() - start)
+                i += 1
+                continue
+            # consecutive sync handlers share one trip through the pool
+            j = i
+            while j < len(chain) and not dispatch.coroutines[j]:
+                j += 1
+            sync_handlers: List[RequestHandler] = chain[i:j]  # type: ignore[assignment]
+            if profiled:
+                assert profiler is not None
+                if self.offload_sync_handlers:
+                    await self.executor.run(profiler.run, dispatch.pattern, run_handlers, sync_handlers, request, response, timings)
+                else:
+                    profiler.run(dispatch.pattern, run_handlers, sync_handlers, request, response, timings)
+            elif self.offload_sync_handlers:
+                await self.executor.run(run_handlers, sync_handlers, request, response, timings)
+            else:
+                run_handlers(sync_handlers, request, response, timings)
+            i = j
+
+    async def _handle(self, parsed: ParsedRequest, writer: StreamWriter, close: bool, connection: _Connection) -> bool:
+        # runs the chain for one request and buffers its response; returns False if the connection must close
+        method = _METHODS.get(parsed.command)
+        if method is None:
+            self._error(writer, 501, f"Unsupported method {parsed.command}")
+            self._log(writer, parsed, 501)
+            return False
+        metrics = self.metrics
+        started = perf_counter() if metrics is not None else 0.0
+        timings: Union[List[float], None] = [] if metrics is not None else None
+        exchange = AsyncExchange(parsed, connection.peer)
+        if connection.response is None:
+            connection.response = Response(exchange)
+        else:
+            connection.response.reset(exchange)
+        response = connection.response
+        path = parsed.path.split("?", 1)[0]
+        dispatch = self._resolve(path, method)
+        admission = self.admission
+        rejection = admission.admit(exchange, dispatch.pattern if dispatch is not None else None, wait=False) if admission is not None else None
+        try:
+            if rejection is not None:
+                rejection.send(response)
+            elif dispatch is None:
+                response.status(404)
+                response.send_raw(f"cannot {method.upper()} {path}".encode())
+            else:
+                if connection.request is None:
+                    connection.request = Request(dispatch.pattern, exchange, Params(dispatch.params), self.max_body_size, self.spool_threshold)
+                else:
+                    connection.request.reset(dispatch.pattern, exchange, Params(dispatch.params))
+                request = connection.request
+                # closed even if a hook raises or the request is cancelled, so that its on_close callbacks always run
+                try:
+                    try:
+                        await self._run_chain(dispatch, request, response, timings)
+                    except RequestBodyError as e:
+                        if e.status in BODY_REJECTIONS:
+                            self.rejections.count(BODY_REJECTIONS[e.status])
+                        # a response the handler already sent still goes out, on a connection that then closes
+                        if not response.hasBeenSent():
+                            response.status(e.status)
+                            response.send_raw(e.message.encode())
+                        close = True
+                    except Exception:
+                        print_exc()
+                        if not response.hasBeenSent():
+                            response.status(500)
+                            response.send_raw(b"Internal Server Error")
+                        close = True
+                    if not response.hasBeenSent():
+                        response.status(404)
+                        response.send_raw(f"cannot {method.upper()} {path}".encode())
+                    if self.after_handlers:
+                        if self.offload_sync_handlers:
+                            await self.executor.run(run_after_handlers, self.after_handlers, request, response)
+                        else:
+                            run_after_handlers(self.after_handlers, request, response)
+                finally:
+                    request.close()
+            status, headers, body = response.get_response()
+            stream = response.get_stream()
+            # HTTP/1.0 clients don't understand chunked encoding; the stream ends when the connection closes
+            chunked = stream is not None and parsed.request_version != "HTTP/1.0"
+            if stream is not None and not chunked:
+                close = True
+            connection_header = response.get_header("Connection")
+            if connection_header is not None and connection_header.lower() == "close":
+                close = True
+            # a handler's own Connection header is sent as is
+            self._write(writer, method, status, headers, body, close and connection_header is None, chunked, parsed.request_version == "HTTP/1.0" and connection_header is None)
+            file_body = response.get_file()
+            if file_body is not None:
+                if method == "head":
+                    file_body.close()
+                else:
+                    await self._send_file(writer, file_body)
+            if stream is not None:
+                if method == "head":
+                    await aclose_stream(stream)
+                elif not await self._send_stream(writer, stream, chunked):
+                    close = True
+            if metrics is not None:
+                metrics.observe(method, dispatch, status, perf_counter() - started, timings)
+            self._log(writer, parsed, status)
+            return not close
+        finally:
+            if admission is not None and rejection is None:
+                admission.release()
+
+    def _phase_timeout(self, phase: str) -> float:
+        if phase == "idle":
+            return self.keep_alive_timeout
+        if phase == "request_line":
+            return self.request_line_timeout
+        return self.header_timeout if phase == "head" else self.body_timeout
+
+    async def _route(self, reader: StreamReader, writer: StreamWriter):
+        parser = RequestParser(self.max_header_size, self.max_body_size, self.spool_threshold)
+        connection = _Connection(writer.get_extra_info("peername"))
+        requests_handled = 0
+        phase = "idle"
+        phase_deadline = monotonic() + self.request_line_timeout
+        try:
+            while True:
+                try:
+                    data = await wait_for(reader.read(self.read_size), phase_deadline - monotonic())
+                except AsyncTimeoutError:
+                    if phase != "idle" or not requests_handled:
+                        self.rejections.count(_PHASE_REJECTIONS[phase])
+                    return
+                if not data:
+                    return
+                error: Union[HttpParseError, None] = None
+                try:
+                    parsed_requests = parser.feed(data)
+                except HttpParseError as e:
+                    # the requests pipelined before the malformed one are answered first
+                    parsed_requests, error = e.completed, e
+                for parsed in parsed_requests:
+                    requests_handled += 1
+                    close = not self.keep_alive or not parsed.keep_alive or requests_handled >= self.max_keep_alive_requests
+                    try:
+                        keep_open = await self._handle(parsed, writer, close, connection)
+                    finally:
+                        if parsed.body is not None:
+                            parsed.body.close()
+                    if not keep_open:
+                        await self._drain(writer)
+                        return
+                if error is not None:
+                    self.rejections.count(_PARSE_REJECTIONS.get(error.status, "bad_request"))
+                    self._error(writer, error.status, error.message)
+                    await self._drain(writer)
+                    return
+                # responses to a pipelined batch are flushed together
+                await self._drain(writer)
+                current = parser.phase()
+                if current != phase or parsed_requests:
+                    phase = current
+                    phase_deadline = monotonic() + self._phase_timeout(phase)
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            parser.close()
+            writer.close()
+
+    async def listen(self):
+        self.server = await start_server(self._route, host=self.host, port=self.port, backlog=self.backlog)
+        try:
+            async with self.server:
+                await self.server.serve_forever()
+        finally:
+            self.executor.shutdown()
+
+    def run(self):
+        run(self.listen())
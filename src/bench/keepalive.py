@@ -0,0 +1,78 @@
+from http.client import HTTPConnection
+from socket import create_connection
+from time import perf_counter
+
+from ..handler import RequestHandler
+from ..request import Request
+from ..response import Response
+from .server import make_server, start
+
+"""
+Keep-alive benchmark: sequential req/s over a new connection per request, one persistent
+connection, and one persistent connection with pipelined requests.
+Run with `python -m src.bench.keepalive`
+"""
+
+REQUESTS = 5000
+PIPELINE_DEPTH = 16
+
+
+class Hello(RequestHandler):
+    def __call__(self, request: Request, response: Response):
+        response.send_json({"hello": "world"})
+
+
+def bench_close(host: str, port: int) -> float:
+    start_time = perf_counter()
+    for _ in range(REQUESTS):
+        conn = HTTPConnection(host, port)
+        conn.request("GET", "/hello", headers={"Connection": "close"})
+        conn.getresponse().read()
+        conn.close()
+    return REQUESTS / (perf_counter() - start_time)
+
+
+def bench_keep_alive(host: str, port: int) -> float:
+    conn = HTTPConnection(host, port)
+    start_time = perf_counter()
+    for _ in range(REQUESTS):
+        conn.request("GET", "/hello")
+        conn.getresponse().read()
+    elapsed = perf_counter() - start_time
+    conn.close()
+    return REQUESTS / elapsed
+
+
+def bench_pipelined(host: str, port: int) -> float:
+    request = f"GET /hello HTTP/1.1\r\nHost: {host}\r\n\r\n".encode()
+    sock = create_connection((host, port))
+    reader = sock.makefile("rb")
+    start_time = perf_counter()
+    sent = 0
+    while sent < REQUESTS:
+        batch = min(PIPELINE_DEPTH, REQUESTS - sent)
+        sock.sendall(request * batch)
+        for _ in range(batch):
+            content_length = 0
+            while True:
+                line = reader.readline()
+                if line in (b"\r\n", b""):
+                    break
+                if line.lower().startswith(b"content-length:"):
+                    content_length = int(line.split(b":", 1)[1])
+            reader.read(content_length)
+        sent += batch
+    elapsed = perf_counter() - start_time
+    sock.close()
+    return REQUESTS / elapsed
+
+
+if __name__ == "__main__":
+    server = make_server(max_keep_alive_requests=REQUESTS + 1)
+    server.get("/hello", Hello())
+    host, port = start(server)
+    print(f"{'mode':>12} {'req/s':>10}")
+    print(f"{'close':>12} {bench_close(host, port):>10.0f}")
+    print(f"{'keep-alive':>12} {bench_keep_alive(host, port):>10.0f}")
+    print(f"{'pipelined':>12} {bench_pipelined(host, port):>10.0f}")
+    server.shutdown()
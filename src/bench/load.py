@@ -0,0 +1,129 @@
+from multiprocessing import get_context
+from socket import IPPROTO_TCP, TCP_NODELAY, create_connection, socket
+from threading import Thread
+from time import perf_counter, sleep
+from typing import IO, Dict, List, Tuple, Union
+
+"""
+Closed-loop HTTP load generator. Client processes (so that they don't share the server's GIL) each
+run a number of connections on threads; every connection sends one request, waits for the whole
+response and sends the next, recording the latency of each.
+"""
+
+
+class ResponseError(Exception):
+    pass
+
+
+def read_response(reader: IO[bytes]) -> bool:
+    """Reads one response; returns True when the server will close the connection"""
+    status_line = reader.readline()
+    if not status_line:
+        raise ResponseError("connection closed")
+    if not status_line.startswith(b"HTTP/1."):
+        raise ResponseError(f"unexpected status line {status_line!r}")
+    content_length = 0
+    chunked = False
+    close = False
+    while True:
+        line = reader.readline()
+        if line in (b"\r\n", b"\n"):
+            break
+        if not line:
+            raise ResponseError("connection closed in headers")
+        name, _, value = line.partition(b":")
+        name = name.strip().lower()
+        if name == b"content-length":
+            content_length = int(value)
+        elif name == b"transfer-encoding":
+            chunked = b"chunked" in value.lower()
+        elif name == b"connection":
+            close = value.strip().lower() == b"close"
+    if chunked:
+        while True:
+            size = int(reader.readline().split(b";", 1)[0], 16)
+            reader.read(size + 2)
+            if size == 0:
+                break
+    elif content_length:
+        if len(reader.read(content_length)) != content_length:
+            raise ResponseError("connection closed in body")
+    return close
+
+
+def _connection(host: str, port: int, request: bytes, keep_alive: bool, deadline: float, latencies: List[float], errors: List[int]):
+    sock: Union[socket, None] = None
+    reader: Union[IO[bytes], None] = None
+    while True:
+        start_time = perf_counter()
+        if start_time >= deadline:
+            break
+        try:
+            if sock is None:
+                sock = create_connection((host, port))
+                sock.setsockopt(IPPROTO_TCP, TCP_NODELAY, 1)
+                reader = sock.makefile("rb")
+            sock.sendall(request)
+            close = read_response(reader)  # type: ignore[arg-type]
+            latencies.append(perf_counter() - start_time)
+        except (OSError, ResponseError, ValueError):
+            errors[0] += 1
+            close = True
+            # don't spin on a refused connection
+            sleep(0.001)
+        if close or not keep_alive:
+            if sock is not None:
+                sock.close()
+            sock = None
+    if sock is not None:
+        sock.close()
+
+
+def _client_process(host: str, port: int, request: bytes, keep_alive: bool, connections: int, duration: float) -> Tuple[List[float], int]:
+    deadline = perf_counter() + duration
+    latencies: List[float] = []
+    errors = [0]
+    threads = [Thread(target=_connection, args=(host, port, request, keep_alive, deadline, latencies, errors)) for _ in range(connections)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors[0]
+
+
+def build_request(host: str, method: str, path: str, keep_alive: bool) -> bytes:
+    connection = "keep-alive" if keep_alive else "close"
+    return f"{method} {path} HTTP/1.1\r\nHost: {host}\r\nUser-Agent: pyserve-bench\r\nAccept: */*\r\nConnection: {connection}\r\n\r\n".encode()
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(fraction * len(sorted_values)))
+    return sorted_values[index]
+
+
+def run_load(host: str, port: int, path: str, keep_alive: bool=True, connections: int=16, processes: int=2, duration: float=5.0, warmup: float=1.0, method: str="GET") -> Dict[str, float]:
+    """Runs connections in total, spread over processes, for duration seconds after warmup"""
+    request = build_request(host, method, path, keep_alive)
+    per_process = [connections // processes + (1 if i < connections % processes else 0) for i in range(processes)]
+    per_process = [count for count in per_process if count > 0]
+    # spawn, since the server's threads make forking this process unsafe
+    context = get_context("spawn")
+    with context.Pool(len(per_process)) as pool:
+        if warmup > 0:
+            pool.starmap(_client_process, [(host, port, request, keep_alive, count, warmup) for count in per_process])
+        results = pool.starmap(_client_process, [(host, port, request, keep_alive, count, duration) for count in per_process])
+    latencies = sorted(latency for process_latencies, _ in results for latency in process_latencies)
+    errors = sum(process_errors for _, process_errors in results)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "duration": duration,
+        # every connection runs until the same deadline
+        "rps": len(latencies) / duration,
+        "p50_ms": percentile(latencies, 0.50) * 1e3,
+        "p99_ms": percentile(latencies, 0.99) * 1e3,
+        "p999_ms": percentile(latencies, 0.999) * 1e3,
+        "max_ms": (latencies[-1] if latencies else 0.0) * 1e3,
+    }
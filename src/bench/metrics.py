@@ -0,0 +1,64 @@
+from time import perf_counter
+from typing import Callable, List
+
+from ..dispatch_cache import Dispatch
+from ..handler import RequestHandler, run_handlers
+from ..metrics import Metrics
+from ..request import Request
+from ..response import Response
+from ..types import Params
+from .allocations import FakeExchange
+
+"""
+Per-request cost of metrics: runs a chain of middlewares and a handler with and without timing it,
+recording each timed run with Metrics.observe, and reports the difference per request.
+Run with `python -m src.bench.metrics`
+"""
+
+REQUESTS = 100000
+
+
+class Passthrough(RequestHandler):
+    def __call__(self, request: Request, response: Response):
+        pass
+
+
+class Send(RequestHandler):
+    def __call__(self, request: Request, response: Response):
+        response.send_raw(b"ok")
+
+
+def measure(run: Callable[[], None], n: int=REQUESTS) -> float:
+    start_time = perf_counter()
+    for _ in range(n):
+        run()
+    return (perf_counter() - start_time) / n
+
+
+def scenario(middlewares: int) -> List[float]:
+    exchange = FakeExchange()
+    chain: List[RequestHandler] = [Passthrough() for _ in range(middlewares)] + [Send()]
+    dispatch = Dispatch(chain, "/users/:id", Params(id="42"))  # type: ignore[arg-type]
+    request = Request("/users/:id", exchange, Params(id="42"))
+    response = Response(exchange)
+    metrics = Metrics()
+
+    def untimed():
+        response.reset(exchange)
+        run_handlers(chain, request, response)
+
+    def timed():
+        started = perf_counter()
+        timings: List[float] = []
+        response.reset(exchange)
+        run_handlers(chain, request, response, timings)
+        metrics.observe("get", dispatch, 200, perf_counter() - started, timings)
+
+    return [measure(untimed), measure(timed)]
+
+
+if __name__ == "__main__":
+    print(f"{'middlewares':>11} {'off us/req':>10} {'on us/req':>10} {'cost us':>8}")
+    for middlewares in [0, 1, 5, 20]:
+        off, on = scenario(middlewares)
+        print(f"{middlewares:>11} {off * 1e6:>10.2f} {on * 1e6:>10.2f} {(on - off) * 1e6:>8.2f}")
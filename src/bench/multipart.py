@@ -0,0 +1,86 @@
+from http.client import HTTPConnection
+from os import urandom
+from time import perf_counter
+from typing import Iterator, List
+
+from ..handler import RequestHandler
+from ..multipart import parse_multipart
+from ..request import Request
+from ..response import Response
+from .server import make_server, start
+
+"""
+Multipart upload benchmark: parser throughput on an in-memory body for a few chunk sizes, and
+end-to-end upload throughput through the threaded server. 1 Gbit/s is 125 MB/s.
+Run with `python -m src.bench.multipart`
+"""
+
+BOUNDARY = b"----pyservebenchboundary7MA4YWxk"
+FILE_SIZE = 256 * 1024 * 1024
+CHUNK_SIZES = [4 * 1024, 16 * 1024, 64 * 1024, 256 * 1024]
+BLOCK = urandom(1024 * 1024)
+
+
+def part_head(name: str, filename: str) -> bytes:
+    return (
+        b"--" + BOUNDARY + b"\r\n"
+        + f'Content-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'.encode()
+        + b"Content-Type: application/octet-stream\r\n\r\n"
+    )
+
+
+def body_chunks(chunk_size: int) -> Iterator[bytes]:
+    # a small field, then one FILE_SIZE file part, sliced into chunk_size pieces
+    yield b"--" + BOUNDARY + b'\r\nContent-Disposition: form-data; name="title"\r\n\r\nbenchmark\r\n'
+    yield part_head("upload", "data.bin")
+    block = memoryview(BLOCK)
+    sent = 0
+    while sent < FILE_SIZE:
+        offset = sent % len(BLOCK)
+        chunk = block[offset:offset + min(chunk_size, FILE_SIZE - sent, len(BLOCK) - offset)]
+        sent += len(chunk)
+        yield bytes(chunk)
+    yield b"\r\n--" + BOUNDARY + b"--\r\n"
+
+
+def bench_parser(chunk_size: int) -> float:
+    chunks: List[bytes] = list(body_chunks(chunk_size))
+    start_time = perf_counter()
+    form = parse_multipart(chunks, BOUNDARY)
+    elapsed = perf_counter() - start_time
+    assert form.files["upload"][0].size == FILE_SIZE
+    form.close()
+    return FILE_SIZE / elapsed / 1e6
+
+
+class Upload(RequestHandler):
+    def __call__(self, request: Request, response: Response):
+        upload = request.form().files["upload"][0]
+        response.send_json({"size": upload.size})
+
+
+def bench_upload() -> float:
+    server = make_server(max_body_size=None)
+    server.post("/upload", Upload())
+    host, port = start(server)
+    body = list(body_chunks(64 * 1024))
+    conn = HTTPConnection(host, port)
+    start_time = perf_counter()
+    conn.putrequest("POST", "/upload")
+    conn.putheader("Content-Type", f"multipart/form-data; boundary={BOUNDARY.decode()}")
+    conn.putheader("Content-Length", str(sum(len(chunk) for chunk in body)))
+    conn.endheaders()
+    for chunk in body:
+        conn.send(chunk)
+    conn.getresponse().read()
+    elapsed = perf_counter() - start_time
+    conn.close()
+    server.shutdown()
+    return FILE_SIZE / elapsed / 1e6
+
+
+if __name__ == "__main__":
+    print(f"{'chunk':>8} {'parser MB/s':>12}")
+    for chunk_size in CHUNK_SIZES:
+        print(f"{chunk_size:>8} {bench_parser(chunk_size):>12.0f}")
+    print(f"upload through the threaded server: {bench_upload():.0f} MB/s")
@@ -0,0 +1,48 @@
+from random import Random
+from time import perf_counter
+from typing import List
+
+from ..route_table import RouteTable
+
+"""
+Route lookup benchmark: time per RouteTable.match() as the number of registered routes grows.
+Run with `python -m src.bench.routes`
+"""
+
+ROUTE_COUNTS = [10, 100, 1000, 10000]
+LOOKUPS = 20000
+
+
+def build_table(count: int) -> RouteTable[int]:
+    table: RouteTable[int] = RouteTable()
+    for i in range(count):
+        if i % 2 == 0:
+            table[f"/api/resource{i}/items"] = i
+        else:
+            table[f"/api/resource{i}/items/:id/detail"] = i
+    return table
+
+
+def sample_paths(count: int, n: int) -> List[str]:
+    rng = Random(count)
+    paths: List[str] = []
+    for _ in range(n):
+        i = rng.randrange(count)
+        paths.append(f"/api/resource{i}/items" if i % 2 == 0 else f"/api/resource{i}/items/{i}/detail")
+    return paths
+
+
+def bench(count: int) -> float:
+    table = build_table(count)
+    paths = sample_paths(count, LOOKUPS)
+    match = table.match
+    start = perf_counter()
+    for path in paths:
+        match(path)
+    return (perf_counter() - start) / LOOKUPS
+
+
+if __name__ == "__main__":
+    print(f"{'routes':>8} {'us/lookup':>10}")
+    for count in ROUTE_COUNTS:
+        print(f"{count:>8} {bench(count) * 1e6:>10.2f}")
@@ -0,0 +1,120 @@
+from asyncio import CancelledError, Task, new_event_loop, set_event_loop
+from http.server import ThreadingHTTPServer
+from multiprocessing import get_context
+from os import getpid, sysconf
+from resource import RUSAGE_SELF, getrusage
+from socket import create_connection, socket
+from threading import Thread
+from time import monotonic, sleep
+from typing import Any, Callable, Dict, List, Tuple
+
+from ..async_server import AsyncPyserve
+from ..server import Pyserve
+
+"""
+Helpers to run a Pyserve instance in-process for benchmarks
+"""
+
+
+def start(server: Pyserve) -> Tuple[str, int]:
+    thread = Thread(target=server.listen, daemon=True)
+    thread.start()
+    while server.server is None:
+        sleep(0.01)
+    host, port = server.server.server_address[:2]
+    return str(host), int(port)
+
+
+def make_server(**kwargs: Any) -> Pyserve:
+    kwargs.setdefault("server_class", ThreadingHTTPServer)
+    kwargs.setdefault("access_log", False)
+    return Pyserve("127.0.0.1", 0, **kwargs)
+
+
+def free_port(host: str="127.0.0.1") -> int:
+    with socket() as sock:
+        sock.bind((host, 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(host: str, port: int, timeout: float=10.0):
+    deadline = monotonic() + timeout
+    while True:
+        try:
+            create_connection((host, port), timeout=1.0).close()
+            return
+        except OSError:
+            if monotonic() > deadline:
+                raise
+            sleep(0.02)
+
+
+def start_async(app: AsyncPyserve) -> Tuple[str, int, Callable[[], None]]:
+    """Runs app on its own event loop thread; returns (host, port, stop)"""
+    state: Dict[str, Any] = {}
+
+    def run():
+        loop = new_event_loop()
+        set_event_loop(loop)
+        task: Task[None] = loop.create_task(app.listen())
+        state["loop"], state["task"] = loop, task
+        try:
+            loop.run_until_complete(task)
+        except CancelledError:
+            pass
+        finally:
+            loop.close()
+
+    thread = Thread(target=run, daemon=True)
+    thread.start()
+    while app.server is None or not app.server.sockets:
+        sleep(0.01)
+    host, port = app.server.sockets[0].getsockname()[:2]
+
+    def stop():
+        state["loop"].call_soon_threadsafe(state["task"].cancel)
+        thread.join(10)
+    return str(host), int(port), stop
+
+
+def start_workers(app: Pyserve) -> Tuple[str, int, int, Callable[[], None]]:
+    """
+    Runs app.listen() (and so its Supervisor) in a forked process; returns (host, port, pid, stop).
+    app.port must be set, since the port chosen by the supervisor isn't visible from here.
+    """
+    process = get_context("fork").Process(target=app.listen, daemon=True)
+    process.start()
+    wait_for_port(app.host, app.port)
+
+    def stop():
+        process.terminate()
+        process.join(app.shutdown_timeout + 5)
+    return app.host, app.port, process.pid or 0, stop
+
+
+def _children(pid: int) -> List[int]:
+    children: List[int] = []
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            children = [int(child) for child in f.read().split()]
+    except OSError:
+        return []
+    for child in list(children):
+        children.extend(_children(child))
+    return children
+
+
+def rss_bytes(pid: int=0) -> int:
+    """Resident set size of a process and all of its descendants (Linux); the peak RSS of this process elsewhere"""
+    pid = pid or getpid()
+    total = 0
+    for process in [pid, *_children(pid)]:
+        try:
+            with open(f"/proc/{process}/statm") as f:
+                total += int(f.read().split()[1]) * sysconf("SC_PAGE_SIZE")
+        except OSError:
+            continue
+    if total:
+        return total
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS; this path is only hit off Linux
+    return getrusage(RUSAGE_SELF).ru_maxrss
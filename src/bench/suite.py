@@ -0,0 +1,161 @@
+from argparse import ArgumentParser
+from http.server import HTTPServer, ThreadingHTTPServer
+from json import dump, load
+from os import cpu_count
+from platform import platform, python_version
+from sys import stdout
+from time import strftime
+from typing import Any, Callable, Dict, List, Tuple, Union
+
+from ..async_server import AsyncPyserve
+from ..handler import RequestHandler
+from ..pooled_server import pooled_server_class
+from ..request import Request
+from ..response import Response
+from ..router import Router
+from ..server import Pyserve
+from .load import run_load
+from .server import free_port, rss_bytes, start, start_async, start_workers
+
+"""
+Load benchmark suite: starts each server kind in-process (worker mode in a forked supervisor),
+drives it over loopback with src.bench.load and reports req/s, p50/p99/p999 latency and server RSS.
+Results can be written as JSON and compared against an earlier run:
+    python -m src.bench.suite --servers threading,async --scenarios routes,body --output new.json --baseline old.json
+"""
+
+SERVER_KINDS = ["http", "threading", "pooled", "async", "workers"]
+
+# each scenario varies one setting of DEFAULTS
+SCENARIOS: Dict[str, Tuple[str, List[Any]]] = {
+    "routes": ("routes", [10, 1000, 10000]),
+    "body": ("body_size", [64, 16 * 1024, 1024 * 1024]),
+    "connection": ("keep_alive", [True, False]),
+    "middleware": ("middleware_depth", [0, 5, 20]),
+}
+
+DEFAULTS: Dict[str, Any] = {"routes": 100, "body_size": 64, "keep_alive": True, "middleware_depth": 0}
+
+
+class Body(RequestHandler):
+    def __init__(self, size: int):
+        self.body = b"x" * size
+
+    def __call__(self, request: Request, response: Response):
+        response.header("Content-Type", "application/octet-stream")
+        response.send_raw(self.body)
+
+
+class Passthrough(RequestHandler):
+    def __call__(self, request: Request, response: Response):
+        pass
+
+
+def build_app(app: Router, routes: int, body_size: int, middleware_depth: int, **_: Any) -> str:
+    """Registers the scenario's routes and middlewares; returns the path to request"""
+    handler = Body(body_size)
+    for i in range(routes):
+        app.get(f"/r{i}/items/:id", handler)
+    for _ in range(middleware_depth):
+        app.use("/*", Passthrough())
+    return f"/r{routes // 2}/items/42"
+
+
+def start_server(kind: str, settings: Dict[str, Any], workers: int) -> Tuple[str, int, str, int, Callable[[], None]]:
+    """Returns (host, port, path, pid whose process tree is measured, stop)"""
+    keep_alive = settings["keep_alive"]
+    if kind == "async":
+        async_app = AsyncPyserve("127.0.0.1", 0, keep_alive=keep_alive, access_log=False)
+        path = build_app(async_app, **settings)
+        host, port, stop = start_async(async_app)
+        return host, port, path, 0, stop
+    server_class = {"http": HTTPServer, "threading": ThreadingHTTPServer, "pooled": pooled_server_class(), "workers": ThreadingHTTPServer}[kind]
+    app = Pyserve("127.0.0.1", 0, server_class=server_class, keep_alive=keep_alive if kind != "http" else False, access_log=False, max_keep_alive_requests=1 << 30)
+    path = build_app(app, **settings)
+    if kind == "workers":
+        app.port = free_port()
+        app.workers = workers
+        app.reuse_port = True
+        app.shutdown_timeout = 5.0
+        host, port, pid, stop = start_workers(app)
+        return host, port, path, pid, stop
+    host, port = start(app)
+    return host, port, path, 0, app.shutdown
+
+
+def run_case(kind: str, scenario: str, settings: Dict[str, Any], options: Any) -> Dict[str, Any]:
+    host, port, path, pid, stop = start_server(kind, settings, options.workers)
+    try:
+        result = run_load(host, port, path, keep_alive=settings["keep_alive"], connections=options.connections, processes=options.processes, duration=options.duration, warmup=options.warmup)
+        result["rss_mb"] = rss_bytes(pid) / (1024 * 1024)
+    finally:
+        stop()
+    return {"server": kind, "scenario": scenario, "settings": settings, **result}
+
+
+def case_id(result: Dict[str, Any]) -> str:
+    settings = ",".join(f"{name}={value}" for name, value in sorted(result["settings"].items()))
+    return f"{result['server']}/{result['scenario']}/{settings}"
+
+
+def print_result(result: Dict[str, Any], name: str, value: Any):
+    print(f"{result['server']:<10} {result['scenario']:<11} {f'{name}={value}':<24} {result['rps']:>9.0f} {result['p50_ms']:>8.2f} {result['p99_ms']:>8.2f} {result['p999_ms']:>8.2f} {result['rss_mb']:>8.1f} {result['errors']:>6}")
+    stdout.flush()
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any]):
+    previous = {case_id(result): result for result in baseline["results"]}
+    print(f"\n{'case':<84} {'req/s':>9} {'change':>8} {'p99 ms':>8} {'change':>8}")
+    for result in current["results"]:
+        before: Union[Dict[str, Any], None] = previous.get(case_id(result))
+        if before is None:
+            continue
+        rps_change = (result["rps"] / before["rps"] - 1) * 100 if before["rps"] else 0.0
+        p99_change = (result["p99_ms"] / before["p99_ms"] - 1) * 100 if before["p99_ms"] else 0.0
+        print(f"{case_id(result):<84} {result['rps']:>9.0f} {rps_change:>+7.1f}% {result['p99_ms']:>8.2f} {p99_change:>+7.1f}%")
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--servers", default=",".join(SERVER_KINDS), help="comma-separated: " + ", ".join(SERVER_KINDS))
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="comma-separated: " + ", ".join(SCENARIOS))
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds measured per case")
+    parser.add_argument("--warmup", type=float, default=1.0, help="seconds of unmeasured load before each case")
+    parser.add_argument("--connections", type=int, default=16, help="concurrent client connections")
+    parser.add_argument("--processes", type=int, default=max(1, (cpu_count() or 2) // 2), help="client processes")
+    parser.add_argument("--workers", type=int, default=2, help="worker processes for the workers server kind")
+    parser.add_argument("--output", help="write results to this JSON file")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare against")
+    options = parser.parse_args()
+
+    results: List[Dict[str, Any]] = []
+    print(f"{'server':<10} {'scenario':<11} {'case':<24} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'p999 ms':>8} {'rss MB':>8} {'errors':>6}")
+    for kind in options.servers.split(","):
+        for scenario in options.scenarios.split(","):
+            name, values = SCENARIOS[scenario]
+            for value in values:
+                settings = {**DEFAULTS, name: value}
+                result = run_case(kind, scenario, settings, options)
+                results.append(result)
+                print_result(result, name, value)
+
+    report = {
+        "meta": {
+            "time": strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": python_version(),
+            "platform": platform(),
+            "cpus": cpu_count(),
+            "options": vars(options),
+        },
+        "results": results,
+    }
+    if options.output:
+        with open(options.output, "w") as f:
+            dump(report, f, indent=2)
+    if options.baseline:
+        with open(options.baseline) as f:
+            compare(load(f), report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+from typing import IO, Iterator, Union
+
+"""
+Incremental reader for request bodies delimited by Content-Length or Transfer-Encoding: chunked
+"""
+
+CHUNK_SIZE = 64 * 1024
+
+
+class RequestBodyError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class RequestBodyTooLarge(RequestBodyError):
+    def __init__(self, max_body_size: int):
+        super().__init__(413, f"Request body exceeds {max_body_size} bytes")
+
+
+class BodyReader:
+    """
+    File-like and iterable view of a request body. Chunked bodies are decoded as they are read;
+    reading past max_body_size raises RequestBodyTooLarge. With until_eof the body is whatever rfile
+    holds, for servers that have already decoded the framing (e.g. WSGI's wsgi.input).
+    """
+    def __init__(self, rfile: IO[bytes], content_length: Union[int, None], chunked: bool, max_body_size: Union[int, None]=None, until_eof: bool=False):
+        self._rfile = rfile
+        self._chunked = chunked
+        self._until_eof = until_eof and content_length is None and not chunked
+        self._max_body_size = max_body_size
+        # bytes left in the body (Content-Length) or in the current chunk (chunked)
+        self._remaining = 0 if chunked else (content_length or 0)
+        self._done = not chunked and self._remaining == 0 and not self._until_eof
+        self.bytes_read = 0
+        if not chunked and max_body_size is not None and self._remaining > max_body_size:
+            raise RequestBodyTooLarge(max_body_size)
+
+    def done(self) -> bool:
+        return self._done
+
+    def started(self) -> bool:
+        return self.bytes_read > 0 or self._done
+
+    def _next_chunk(self):
+        line = self._rfile.readline(1024)
+        if not line.endswith(b"\n"):
+            raise RequestBodyError(400, "Invalid chunk size line")
+        try:
+            size = int(line.split(b";", 1)[0].strip(), 16)
+        except ValueError:
+            raise RequestBodyError(400, "Invalid chunk size")
+        if size == 0:
+            # skip trailers
+            while True:
+                trailer = self._rfile.readline(8 * 1024)
+                if trailer in (b"\r\n", b"\n", b""):
+                    break
+            self._done = True
+            return
+        self._remaining = size
+
+    def _account(self, data: bytes) -> bytes:
+        self.bytes_read += len(data)
+        if self._max_body_size is not None and self.bytes_read > self._max_body_size:
+            raise RequestBodyTooLarge(self._max_body_size)
+        return data
+
+    def read(self, size: int=-1) -> bytes:
+        if size < 0:
+            return b"".join(self)
+        try:
+            return self._read(size)
+        except TimeoutError:
+            # the socket's read deadline passed (see deadline.DeadlineSocketIO)
+            raise RequestBodyError(408, "Timed out reading the request body")
+
+    def _read(self, size: int) -> bytes:
+        if self._until_eof and not self._done:
+            data = self._rfile.read(size)
+            if not data:
+                self._done = True
+            return self._account(data)
+        while not self._done:
+            if self._remaining == 0:
+                if not self._chunked:
+                    self._done = True
+                    break
+                self._next_chunk()
+                continue
+            data = self._rfile.read(min(size, self._remaining))
+            if not data:
+                raise RequestBodyError(400, "Request body ended early")
+            self._remaining -= len(data)
+            if self._remaining == 0:
+                if self._chunked:
+                    self._rfile.readline(16)
+                else:
+                    self._done = True
+            return self._account(data)
+        return b""
+
+    def __iter__(self) -> Iterator[bytes]:
+        while True:
+            data = self.read(CHUNK_SIZE)
+            if not data:
+                return
+            yield data
+
+    def drain(self, limit: int) -> bool:
+        """Reads and discards the rest of the body; returns False if more than limit bytes remain"""
+        drained = 0
+        try:
+            while not self._done:
+                drained += len(self.read(CHUNK_SIZE))
+                if drained > limit:
+                    return False
+        except RequestBodyError:
+            return False
+        return True
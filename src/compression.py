@@ -0,0 +1,158 @@
+from typing import AsyncIterable, AsyncIterator, Iterable, Iterator, List, Tuple, Union
+import zlib
+
+from .handler import RequestHandler
+from .request import Request
+from .response import Response
+from .streaming import is_async_iterable
+
+"""
+Response compression, registered as an after-handler hook so it sees the finished response:
+    server.after(Compression(min_size=1024))
+"""
+
+# content types that are already compressed and don't shrink any further
+DEFAULT_SKIP_TYPES = (
+    "image/",
+    "video/",
+    "audio/",
+    "font/woff",
+    "application/zip",
+    "application/gzip",
+    "application/x-gzip",
+    "application/x-bzip2",
+    "application/x-xz",
+    "application/x-7z-compressed",
+    "application/x-rar-compressed",
+    "application/octet-stream",
+    "application/pdf",
+)
+
+# types matched by DEFAULT_SKIP_TYPES that are text and do compress
+_COMPRESSIBLE_EXCEPTIONS = ("image/svg+xml",)
+
+_WBITS = {"gzip": 31, "deflate": 15}
+
+
+def negotiate(accept_encoding: Union[str, None], supported: Iterable[str]=("gzip", "deflate")) -> Union[str, None]:
+    """Picks the supported coding with the highest q-value, preferring earlier entries of supported on ties"""
+    if not accept_encoding:
+        return None
+    weights: List[Tuple[str, float]] = []
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights.append((coding.strip().lower(), q))
+    best: Union[str, None] = None
+    best_q = 0.0
+    for candidate in supported:
+        q = 0.0
+        for coding, weight in weights:
+            if coding == candidate:
+                q = weight
+                break
+            if coding == "*":
+                q = weight
+        if q > best_q:
+            best, best_q = candidate, q
+    return best
+
+
+def compress_stream(chunks: Iterable[bytes], coding: str, level: int=6) -> Iterator[bytes]:
+    """Compresses a streamed body chunk by chunk, flushing after each one so nothing is held back"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, _WBITS[coding])
+    for chunk in chunks:
+        if not chunk:
+            continue
+        data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush(zlib.Z_FINISH)
+
+
+async def compress_async_stream(chunks: AsyncIterable[bytes], coding: str, level: int=6) -> AsyncIterator[bytes]:
+    compressor = zlib.compressobj(level, zlib.DEFLATED, _WBITS[coding])
+    async for chunk in chunks:
+        if not chunk:
+            continue
+        data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush(zlib.Z_FINISH)
+
+
+class Compression(RequestHandler):
+    def __init__(self, min_size: int=1024, level: int=6, codings: Iterable[str]=("gzip", "deflate"), skip_types: Iterable[str]=DEFAULT_SKIP_TYPES):
+        self.min_size = min_size
+        self.level = level
+        self.codings = tuple(codings)
+        self.skip_types = tuple(skip_types)
+
+    def compressible_type(self, content_type: Union[str, None]) -> bool:
+        if content_type is None:
+            return True
+        content_type = content_type.lower()
+        if content_type.startswith(_COMPRESSIBLE_EXCEPTIONS):
+            return True
+        return not content_type.startswith(self.skip_types)
+
+    def coding_for(self, request: Request, response: Response) -> Union[str, None]:
+        """Returns the coding to apply, adding Vary when the response depends on Accept-Encoding"""
+        status = response.get_response()[0]
+        if status < 200 or status in (204, 206, 304):
+            return None
+        if response.get_header("Content-Encoding") is not None:
+            return None
+        if not self.compressible_type(response.get_header("Content-Type")):
+            return None
+        vary = response.get_header("Vary")
+        if vary is None:
+            response.header("Vary", "Accept-Encoding")
+        elif "accept-encoding" not in vary.lower():
+            response.header("Vary", f"{vary}, Accept-Encoding")
+        return negotiate(request.header("Accept-Encoding"), self.codings)
+
+    def _mark_encoded(self, response: Response, coding: str):
+        response.header("Content-Encoding", coding)
+        etag = response.get_header("ETag")
+        if etag is not None and not etag.startswith("W/"):
+            # the strong validator belongs to the uncompressed representation
+            response.header("ETag", f"W/{etag}")
+
+    def _compress_stream(self, request: Request, response: Response):
+        # streamed bodies have no known size, so min_size doesn't apply
+        stream = response.get_stream()
+        coding = self.coding_for(request, response)
+        if stream is None or coding is None:
+            return
+        if is_async_iterable(stream):
+            response.set_stream(compress_async_stream(stream, coding, self.level))  # type: ignore[arg-type]
+        else:
+            response.set_stream(compress_stream(stream, coding, self.level))  # type: ignore[arg-type]
+        self._mark_encoded(response, coding)
+
+    def __call__(self, request: Request, response: Response):
+        if response.get_stream() is not None:
+            self._compress_stream(request, response)
+            return
+        if response.get_file() is not None:
+            # streamed from disk with sendfile (and possibly a byte range); left as is
+            return
+        body = response.get_response()[2]
+        if len(body) < self.min_size:
+            return
+        coding = self.coding_for(request, response)
+        if coding is None:
+            return
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, _WBITS[coding])
+        compressed = compressor.compress(body) + compressor.flush()
+        if len(compressed) >= len(body):
+            return
+        response.set_body(compressed)
+        self._mark_encoded(response, coding)
@@ -0,0 +1,50 @@
+from socket import SocketIO, socket
+from threading import Lock
+from time import monotonic
+from typing import Dict, Union
+
+"""
+Socket reads with deadlines. A socket timeout bounds each recv, so a client that trickles a byte at a
+time never trips it; DeadlineSocketIO instead shrinks the timeout of every recv to what is left
+until a deadline, so reading a request line or a set of headers takes at most that long in total.
+Both servers count the requests they refuse or time out on in a RejectionCounters (server.rejections).
+"""
+
+# kinds of requests the servers refuse or give up on
+REJECTIONS = ("request_line_timeout", "header_timeout", "body_timeout", "write_timeout", "request_line_too_long", "headers_too_large", "too_many_headers", "body_too_large", "invalid_body", "bad_request")
+
+# RequestBodyError statuses -> kind
+BODY_REJECTIONS = {408: "body_timeout", 413: "body_too_large", 400: "invalid_body"}
+
+
+class RejectionCounters:
+    def __init__(self):
+        self._counts = dict.fromkeys(REJECTIONS, 0)
+        self._lock = Lock()
+
+    def count(self, kind: str):
+        with self._lock:
+            self._counts[kind] += 1
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._counts)
+
+
+class DeadlineSocketIO(SocketIO):
+    def __init__(self, sock: socket):
+        super().__init__(sock, "rb")
+        # the same bookkeeping as socket.makefile, so that closing this doesn't close the socket early
+        sock._io_refs += 1  # type: ignore[attr-defined]
+        self.deadline: Union[float, None] = None
+
+    def set_deadline(self, seconds: float):
+        self.deadline = monotonic() + seconds
+
+    def readinto(self, b) -> Union[int, None]:  # type: ignore[no-untyped-def]
+        if self.deadline is not None:
+            remaining = self.deadline - monotonic()
+            if remaining <= 0:
+                raise TimeoutError("read deadline exceeded")
+            self._sock.settimeout(remaining)  # type: ignore[attr-defined]
+        return super().readinto(b)
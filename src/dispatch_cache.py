@@ -0,0 +1,63 @@
+from collections import OrderedDict
+from threading import Lock
+from typing import Dict, List, Tuple, Union
+
+from .handler import AnyRequestHandler, HttpMethod, is_coroutine_handler
+from .types import Params
+
+
+class Dispatch:
+    """Resolved middleware + handler chain for a concrete (method, path)"""
+    __slots__ = ("chain", "pattern", "params", "coroutines")
+
+    def __init__(self, chain: List[AnyRequestHandler], pattern: str, params: Params):
+        self.chain = chain
+        self.pattern = pattern
+        self.params = params
+        self.coroutines = [is_coroutine_handler(handler) for handler in chain]
+
+
+DispatchKey = Tuple[HttpMethod, str]
+
+
+class DispatchCache:
+    """
+    Bounded LRU of (method, path) -> Dispatch. Paths with no handler are cached as None so that
+    repeated misses skip pattern matching as well.
+    """
+    def __init__(self, max_size: int = 1024):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[DispatchKey, Union[Dispatch, None]]" = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key: DispatchKey) -> Tuple[bool, Union[Dispatch, None]]:
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, self._entries[key]
+            self.misses += 1
+            return False, None
+
+    def put(self, key: DispatchKey, dispatch: Union[Dispatch, None]):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = dispatch
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses
+        }
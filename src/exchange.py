@@ -0,0 +1,18 @@
+from email.message import Message
+from typing import IO, Any, Protocol
+
+"""
+The parts of a connection's current request that Request/Response rely on.
+BaseHTTPRequestHandler satisfies this, so other servers only need to provide the same attributes:
+AsyncExchange does for AsyncPyserve and WsgiExchange for WSGI containers.
+"""
+
+
+class Exchange(Protocol):
+    path: str
+    command: str
+    request_version: str
+    headers: Message
+    rfile: IO[bytes]
+    # (host, port) of the peer for TCP connections
+    client_address: Any
@@ -0,0 +1,75 @@
+from asyncio import Semaphore, get_running_loop
+from concurrent.futures import ThreadPoolExecutor
+from os import cpu_count
+from threading import Lock
+from time import perf_counter
+from typing import Any, Callable, Dict, TypeVar, Union
+
+T = TypeVar("T")
+
+
+class HandlerExecutor:
+    """
+    Bounded thread pool used by AsyncPyserve to run synchronous handlers off the event loop.
+    At most max_workers calls run at once and at most max_queue more wait for a worker; callers
+    beyond that wait on the event loop (without blocking it) until a slot frees up.
+    """
+    def __init__(self, max_workers: Union[int, None]=None, max_queue: Union[int, None]=None):
+        self.max_workers = max_workers if max_workers is not None else min(32, (cpu_count() or 1) + 4)
+        self.max_queue = max_queue if max_queue is not None else self.max_workers * 4
+        self._pool = ThreadPoolExecutor(self.max_workers, thread_name_prefix="pyserve-handler")
+        self._slots: Union[Semaphore, None] = None
+        self._lock = Lock()
+        self.submitted = 0
+        self.in_flight = 0
+        self.active = 0
+        self.saturated = 0
+        self.slot_wait_time = 0.0
+
+    def _get_slots(self) -> Semaphore:
+        # created lazily so that it binds to the loop the server runs on
+        if self._slots is None:
+            self._slots = Semaphore(self.max_workers + self.max_queue)
+        return self._slots
+
+    def _call(self, fn: Callable[..., T], *args: Any) -> T:
+        with self._lock:
+            self.active += 1
+        try:
+            return fn(*args)
+        finally:
+            with self._lock:
+                self.active -= 1
+
+    async def run(self, fn: Callable[..., T], *args: Any) -> T:
+        slots = self._get_slots()
+        if slots.locked():
+            self.saturated += 1
+            start = perf_counter()
+            await slots.acquire()
+            self.slot_wait_time += perf_counter() - start
+        else:
+            await slots.acquire()
+        self.submitted += 1
+        self.in_flight += 1
+        try:
+            return await get_running_loop().run_in_executor(self._pool, self._call, fn, *args)
+        finally:
+            self.in_flight -= 1
+            slots.release()
+
+    def shutdown(self):
+        self._pool.shutdown(wait=True)
+
+    def stats(self) -> Dict[str, Union[int, float]]:
+        active = self.active
+        return {
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "active": active,
+            "queued": max(0, self.in_flight - active),
+            "submitted": self.submitted,
+            "saturated": self.saturated,
+            "slot_wait_seconds": self.slot_wait_time,
+            "utilization": active / self.max_workers
+        }
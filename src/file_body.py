@@ -0,0 +1,75 @@
+from os import stat_result
+from socket import socket
+from typing import IO, Iterator, Tuple, Union
+
+"""
+File-backed response bodies. The file is streamed to the client from disk (os.sendfile where the
+socket supports it, fixed-size reads otherwise), so memory use does not depend on the file size.
+"""
+
+CHUNK_SIZE = 64 * 1024
+
+# returned by parse_range when the requested range lies outside the file
+UNSATISFIABLE = (-1, -1)
+
+
+class FileBody:
+    def __init__(self, file: IO[bytes], offset: int, length: int):
+        self.file = file
+        self.offset = offset
+        self.length = length
+
+    def send(self, sock: socket):
+        try:
+            if self.length > 0:
+                sock.sendfile(self.file, self.offset, self.length)
+        finally:
+            self.close()
+
+    def chunks(self, chunk_size: int=CHUNK_SIZE) -> Iterator[bytes]:
+        try:
+            self.file.seek(self.offset)
+            remaining = self.length
+            while remaining > 0:
+                chunk = self.file.read(min(chunk_size, remaining))
+                if not chunk:
+                    return
+                remaining -= len(chunk)
+                yield chunk
+        finally:
+            self.close()
+
+    def close(self):
+        self.file.close()
+
+
+def file_etag(stat: stat_result) -> str:
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+
+def parse_range(header: str, size: int) -> Union[Tuple[int, int], None]:
+    """
+    Parses a single "bytes=" range into an inclusive (start, end). Returns None when the header
+    should be ignored (malformed or multiple ranges) and UNSATISFIABLE when no byte is in range.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    start_str, sep, end_str = spec.strip().partition("-")
+    if not sep:
+        return None
+    try:
+        if not start_str:
+            suffix = int(end_str)
+            if suffix <= 0 or size == 0:
+                return UNSATISFIABLE
+            return max(0, size - suffix), size - 1
+        start = int(start_str)
+        end = int(end_str) if end_str else size - 1
+    except ValueError:
+        return None
+    if start >= size:
+        return UNSATISFIABLE
+    if start > end:
+        return None
+    return start, min(end, size - 1)
@@ -1,7 +1,10 @@
-from typing import DefaultDict, Literal, List, Union
+from inspect import iscoroutinefunction
+from time import perf_counter
+from typing import Any, Iterable, Literal, List, Union
 
 from .request import Request
 from .response import Response
+from .route_table import RouteTable
 
 
 ## interface for request handler functions
@@ -9,10 +12,40 @@ class RequestHandler:
     def __call__(self, request: Request, response: Response) -> None:
         pass
 
-class PatternMiddlewares(DefaultDict[str, List[RequestHandler]]):
+## interface for coroutine request handler functions, awaited natively by AsyncPyserve
+class AsyncRequestHandler:
+    async def __call__(self, request: Request, response: Response) -> None:
+        pass
+
+AnyRequestHandler = Union[RequestHandler, AsyncRequestHandler]
+
+def is_coroutine_handler(handler: Any) -> bool:
+    return iscoroutinefunction(handler) or iscoroutinefunction(getattr(handler, "__call__", None))
+
+def run_handlers(handlers: Iterable[RequestHandler], request: Request, response: Response, timings: Union[List[float], None]=None):
+    # with timings, the duration of each handler that runs is appended to it (for metrics)
+    if timings is None:
+        for handler_function in handlers:
+            handler_function(request, response)
+            if response.hasBeenSent():
+                break
+        return
+    for handler_function in handlers:
+        start = perf_counter()
+        handler_function(request, response)
+        timings.append(perf_counter() - start)
+        if response.hasBeenSent():
+            break
+
+def run_after_handlers(hooks: Iterable[RequestHandler], request: Request, response: Response):
+    # unlike run_handlers every hook runs, since the response has already been sent
+    for hook in hooks:
+        hook(request, response)
+
+class PatternMiddlewares(RouteTable[List[AnyRequestHandler]]):
     pass
 
-class ReqHandlerDefaultDict(DefaultDict[str, RequestHandler]):
+class ReqHandlerDefaultDict(RouteTable[AnyRequestHandler]):
     pass
 
 HttpMethod = Union[Literal["get"], Literal["head"], Literal["put"], Literal["post"], Literal["patch"], Literal["delete"]]
@@ -0,0 +1,225 @@
+from http.client import HTTPMessage
+from tempfile import SpooledTemporaryFile
+from typing import IO, List, Union
+
+"""
+Incremental HTTP/1.1 request parser. Bytes are fed in as they arrive from the socket and complete
+requests come out, so pipelined requests and requests split across reads are handled the same way.
+Bodies are written out as they arrive, to memory up to spool_threshold bytes and to a temp file
+beyond that, so a request never holds more than spool_threshold bytes of its body in memory.
+"""
+
+_HEAD = 0
+_BODY = 1
+_CHUNK_SIZE = 2
+_CHUNK_DATA = 3
+_TRAILERS = 4
+
+# longest chunk size line and trailer line accepted, as in body.BodyReader
+_MAX_CHUNK_SIZE_LINE = 1024
+_MAX_TRAILER_LINE = 8 * 1024
+
+
+class HttpParseError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        # requests completed by the same feed() before the malformed one, to be answered first
+        self.completed: List["ParsedRequest"] = []
+
+
+class ParsedRequest:
+    __slots__ = ("command", "path", "request_version", "headers", "body", "keep_alive")
+
+    def __init__(self, command: str, path: str, request_version: str, headers: HTTPMessage):
+        self.command = command
+        self.path = path
+        self.request_version = request_version
+        self.headers = headers
+        # the de-chunked body, positioned at its start; None if there is none
+        self.body: Union[IO[bytes], None] = None
+        connection = (headers.get("Connection") or "").lower()
+        if request_version == "HTTP/1.0":
+            self.keep_alive = connection == "keep-alive"
+        else:
+            self.keep_alive = connection != "close"
+
+
+class RequestParser:
+    def __init__(self, max_header_size: int=64 * 1024, max_body_size: int=16 * 1024 * 1024, spool_threshold: int=1024 * 1024):
+        self.max_header_size = max_header_size
+        self.max_body_size = max_body_size
+        self.spool_threshold = spool_threshold
+        self._buffer = bytearray()
+        self._state = _HEAD
+        self._current: Union[ParsedRequest, None] = None
+        self._body: Union[IO[bytes], None] = None
+        self._body_size = 0
+        self._remaining = 0
+        self._trailer_size = 0
+
+    def phase(self) -> str:
+        """"idle" between requests, then "request_line", "head" (the headers) and "body" while each is incomplete"""
+        if self._state != _HEAD:
+            return "body"
+        if not self._buffer:
+            return "idle"
+        return "head" if b"\n" in self._buffer else "request_line"
+
+    def close(self):
+        # removes the body of a request that never completed
+        if self._body is not None:
+            self._body.close()
+            self._body = None
+
+    def feed(self, data: bytes) -> List[ParsedRequest]:
+        self._buffer += data
+        completed: List[ParsedRequest] = []
+        while True:
+            try:
+                request = self._step()
+            except HttpParseError as e:
+                e.completed = completed
+                raise
+            if request is None:
+                return completed
+            completed.append(request)
+
+    def _step(self) -> Union[ParsedRequest, None]:
+        # advances the state machine as far as the buffer allows; returns a request once it is complete
+        buffer = self._buffer
+        while True:
+            if self._state == _HEAD:
+                end = buffer.find(b"\r\n\r\n")
+                if end < 0:
+                    if len(buffer) > self.max_header_size:
+                        raise HttpParseError(431, "Request header fields too large")
+                    return None
+                if end > self.max_header_size:
+                    raise HttpParseError(431, "Request header fields too large")
+                head = bytes(buffer[:end])
+                del buffer[:end + 4]
+                if not head:
+                    # tolerate empty lines between pipelined requests
+                    continue
+                request = self._parse_head(head)
+                encoding = (request.headers.get("Transfer-Encoding") or "").lower()
+                if encoding:
+                    if encoding != "chunked":
+                        raise HttpParseError(501, f"Unsupported transfer encoding {encoding}")
+                    self._start_body(request)
+                    self._state = _CHUNK_SIZE
+                    continue
+                content_length = self._content_length(request)
+                if content_length == 0:
+                    return request
+                self._start_body(request)
+                self._remaining = content_length
+                self._state = _BODY
+            elif self._state == _BODY:
+                if self._write_body() > 0:
+                    return None
+                return self._finish()
+            elif self._state == _CHUNK_SIZE:
+                end = buffer.find(b"\r\n", 0, _MAX_CHUNK_SIZE_LINE)
+                if end < 0:
+                    if len(buffer) >= _MAX_CHUNK_SIZE_LINE:
+                        raise HttpParseError(400, "Invalid chunk size line")
+                    return None
+                size_line = bytes(buffer[:end]).split(b";", 1)[0].strip()
+                del buffer[:end + 2]
+                try:
+                    size = int(size_line, 16)
+                except ValueError:
+                    raise HttpParseError(400, "Invalid chunk size")
+                if size == 0:
+                    self._state = _TRAILERS
+                    self._trailer_size = 0
+                    continue
+                if self._body_size + size > self.max_body_size:
+                    raise HttpParseError(413, "Request body too large")
+                self._remaining = size
+                self._state = _CHUNK_DATA
+            elif self._state == _CHUNK_DATA:
+                if self._write_body() > 0 or len(buffer) < 2:
+                    return None
+                if buffer[:2] != b"\r\n":
+                    raise HttpParseError(400, "Invalid chunk terminator")
+                del buffer[:2]
+                self._state = _CHUNK_SIZE
+            else:
+                end = buffer.find(b"\r\n", 0, _MAX_TRAILER_LINE)
+                if end < 0:
+                    if len(buffer) >= _MAX_TRAILER_LINE:
+                        raise HttpParseError(431, "Request header fields too large")
+                    return None
+                # trailers are header fields, so they share the header size limit
+                self._trailer_size += end + 2
+                if self._trailer_size > self.max_header_size:
+                    raise HttpParseError(431, "Request header fields too large")
+                del buffer[:end + 2]
+                if end == 0:
+                    return self._finish()
+
+    def _start_body(self, request: ParsedRequest):
+        self._current = request
+        self._body = SpooledTemporaryFile(max_size=self.spool_threshold)  # type: ignore[assignment]
+        self._body_size = 0
+
+    def _write_body(self) -> int:
+        # moves what the buffer holds of the body (or of the current chunk) out; returns the bytes still to come
+        assert self._body is not None
+        buffer = self._buffer
+        size = min(len(buffer), self._remaining)
+        if size:
+            self._body.write(buffer[:size])
+            del buffer[:size]
+            self._body_size += size
+            self._remaining -= size
+        return self._remaining
+
+    def _finish(self) -> ParsedRequest:
+        request = self._current
+        body = self._body
+        assert request is not None and body is not None
+        if "Transfer-Encoding" in request.headers:
+            # the body is handed on de-chunked, so describe it that way
+            del request.headers["Transfer-Encoding"]
+            request.headers["Content-Length"] = str(self._body_size)
+        body.seek(0)
+        request.body = body
+        self._current = None
+        self._body = None
+        self._state = _HEAD
+        return request
+
+    def _content_length(self, request: ParsedRequest) -> int:
+        value = request.headers.get("Content-Length")
+        if value is None:
+            return 0
+        try:
+            content_length = int(value)
+        except ValueError:
+            raise HttpParseError(400, "Invalid Content-Length")
+        if content_length < 0:
+            raise HttpParseError(400, "Invalid Content-Length")
+        if content_length > self.max_body_size:
+            raise HttpParseError(413, "Request body too large")
+        return content_length
+
+    def _parse_head(self, head: bytes) -> ParsedRequest:
+        lines = head.decode("iso-8859-1").split("\r\n")
+        parts = lines[0].split(" ")
+        if len(parts) != 3:
+            raise HttpParseError(400, f"Bad request line {lines[0]!r}")
+        command, path, version = parts
+        if version not in ("HTTP/1.1", "HTTP/1.0"):
+            raise HttpParseError(505, f"Unsupported HTTP version {version}")
+        headers = HTTPMessage()
+        for line in lines[1:]:
+            name, sep, value = line.partition(":")
+            if not sep or not name or name != name.strip():
+                raise HttpParseError(400, f"Bad header line {line!r}")
+            headers[name] = value.strip()
+        return ParsedRequest(command, path, version, headers)
@@ -0,0 +1,229 @@
+from math import ceil
+from threading import Lock
+from typing import Any, Callable, Dict, Iterable, List, Sequence, Tuple, Union
+
+from .dispatch_cache import Dispatch
+from .handler import RequestHandler
+from .request import Request
+from .response import Response
+
+"""
+Per-route request metrics. Requests are recorded under the route pattern they matched (never the raw
+path, so the number of series stays bounded) with counts per status class and latency histograms for
+the whole request, the middlewares and the handler. Enable with Router.enable_metrics(), which also
+serves everything in the Prometheus text format.
+"""
+
+# label for requests that matched no route, and for ones answered by middlewares alone (e.g. static files)
+UNMATCHED = "<unmatched>"
+MIDDLEWARE_ONLY = "<middleware>"
+
+DEFAULT_BOUNDS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DEFAULT_QUANTILES = (0.5, 0.9, 0.99, 0.999)
+
+_SUB_BUCKET_BITS = 4
+_SUB_BUCKETS = 1 << _SUB_BUCKET_BITS
+# values up to 2**27 microseconds (about 134 seconds) get their own bucket; slower ones land in the last
+_MAX_SHIFT = 22
+_BUCKETS = _SUB_BUCKETS + (_MAX_SHIFT + 1) * _SUB_BUCKETS
+
+
+def _bucket_index(microseconds: int) -> int:
+    if microseconds < _SUB_BUCKETS:
+        return microseconds if microseconds > 0 else 0
+    shift = microseconds.bit_length() - _SUB_BUCKET_BITS - 1
+    index = _SUB_BUCKETS + shift * _SUB_BUCKETS + (microseconds >> shift) - _SUB_BUCKETS
+    return index if index < _BUCKETS else _BUCKETS - 1
+
+
+def _bucket_upper(index: int) -> int:
+    # exclusive upper bound of a bucket, in microseconds
+    if index < _SUB_BUCKETS:
+        return index + 1
+    shift = index // _SUB_BUCKETS - 1
+    return (_SUB_BUCKETS + index % _SUB_BUCKETS + 1) << shift
+
+
+class LatencyHistogram:
+    """
+    HDR-style log-linear histogram with 16 linear sub-buckets per power of two microseconds, so every
+    recorded value is known to within 1/16 (6.25%). Recording is a couple of integer operations.
+    """
+    __slots__ = ("counts", "count", "sum", "max")
+
+    def __init__(self):
+        self.counts = [0] * _BUCKETS
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def record(self, seconds: float):
+        microseconds = int(seconds * 1e6)
+        if microseconds < _SUB_BUCKETS:
+            self.counts[microseconds if microseconds > 0 else 0] += 1
+        else:
+            self.counts[_bucket_index(microseconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q: float) -> float:
+        if self.count == 0:
+            return 0.0
+        target = max(1, ceil(q * self.count))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return min(_bucket_upper(index) / 1e6, self.max)
+        return self.max
+
+    def cumulative(self, bounds: Sequence[float]) -> List[int]:
+        """Counts at or below each bound (in seconds), at the histogram's precision"""
+        result: List[int] = []
+        seen = 0
+        index = 0
+        for bound in bounds:
+            limit = bound * 1e6
+            while index < _BUCKETS and _bucket_upper(index) <= limit:
+                seen += self.counts[index]
+                index += 1
+            result.append(seen)
+        return result
+
+
+class RouteStats:
+    __slots__ = ("lock", "statuses", "request", "middleware", "handler", "middlewares")
+
+    def __init__(self):
+        self.lock = Lock()
+        # index n counts nxx responses
+        self.statuses = [0] * 6
+        self.request = LatencyHistogram()
+        self.middleware = LatencyHistogram()
+        self.handler = LatencyHistogram()
+        # id of each middleware -> [name, seconds, calls]; middlewares live as long as their router
+        self.middlewares: Dict[int, List[Any]] = {}
+
+
+def _handler_name(handler: Any) -> str:
+    name = getattr(handler, "__name__", None)
+    return name if isinstance(name, str) else type(handler).__name__
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Metrics:
+    def __init__(self, bounds: Iterable[float]=DEFAULT_BOUNDS, quantiles: Iterable[float]=DEFAULT_QUANTILES):
+        self.bounds = tuple(bounds)
+        self.quantiles = tuple(quantiles)
+        self._routes: Dict[Tuple[str, str], RouteStats] = {}
+        self._lock = Lock()
+        self._collectors: List[Callable[[], List[str]]] = []
+
+    def add_collector(self, collector: Callable[[], List[str]]):
+        """Adds the exposition lines returned by collector (HELP and TYPE included) to every render"""
+        self._collectors.append(collector)
+
+    def _stats(self, method: str, route: str) -> RouteStats:
+        key = (method, route)
+        stats = self._routes.get(key)
+        if stats is None:
+            with self._lock:
+                stats = self._routes.setdefault(key, RouteStats())
+        return stats
+
+    def observe(self, method: str, dispatch: Union[Dispatch, None], status: int, seconds: float, timings: Union[List[float], None]=None):
+        """
+        Records one request. timings holds the time of each element of dispatch.chain that ran, in order;
+        the last element of a chain is the handler unless the dispatch has no route pattern.
+        """
+        if dispatch is None:
+            route = UNMATCHED
+        else:
+            route = dispatch.pattern or MIDDLEWARE_ONLY
+        stats = self._stats(method.upper(), route)
+        middleware_total = 0.0
+        handler_time = None
+        with stats.lock:
+            stats.statuses[min(status // 100, 5)] += 1
+            stats.request.record(seconds)
+            if dispatch is not None and timings:
+                chain = dispatch.chain
+                last = len(chain) - 1 if dispatch.pattern else -1
+                middlewares = stats.middlewares
+                for i, elapsed in enumerate(timings):
+                    if i == last:
+                        handler_time = elapsed
+                        continue
+                    middleware_total += elapsed
+                    middleware = chain[i]
+                    entry = middlewares.get(id(middleware))
+                    if entry is None:
+                        entry = middlewares[id(middleware)] = [_handler_name(middleware), 0.0, 0]
+                    entry[1] += elapsed
+                    entry[2] += 1
+                stats.middleware.record(middleware_total)
+                if handler_time is not None:
+                    stats.handler.record(handler_time)
+
+    def _histogram_lines(self, lines: List[str], name: str, labels: str, histogram: LatencyHistogram):
+        for bound, count in zip(self.bounds, histogram.cumulative(self.bounds)):
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {count}')
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+        lines.append(f"{name}_sum{{{labels}}} {histogram.sum}")
+        lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        with self._lock:
+            routes = sorted(self._routes.items())
+        requests = ["# HELP pyserve_requests_total Requests by route pattern and status class", "# TYPE pyserve_requests_total counter"]
+        durations = ["# HELP pyserve_request_duration_seconds Time from dispatch to the response being written", "# TYPE pyserve_request_duration_seconds histogram"]
+        quantiles = ["# HELP pyserve_request_duration_quantile_seconds Request duration quantiles from an HDR histogram (6.25% precision)", "# TYPE pyserve_request_duration_quantile_seconds gauge"]
+        middlewares = ["# HELP pyserve_middleware_duration_seconds Time spent in all middlewares of a request", "# TYPE pyserve_middleware_duration_seconds histogram"]
+        handlers = ["# HELP pyserve_handler_duration_seconds Time spent in the route handler", "# TYPE pyserve_handler_duration_seconds histogram"]
+        per_middleware = ["# HELP pyserve_middleware_seconds_total Time spent in each middleware", "# TYPE pyserve_middleware_seconds_total counter"]
+        calls = ["# HELP pyserve_middleware_calls_total Calls of each middleware", "# TYPE pyserve_middleware_calls_total counter"]
+        for (method, route), stats in routes:
+            labels = f'method="{method}",route="{_escape(route)}"'
+            with stats.lock:
+                for status_class, count in enumerate(stats.statuses):
+                    if count:
+                        requests.append(f'pyserve_requests_total{{{labels},status="{status_class}xx"}} {count}')
+                self._histogram_lines(durations, "pyserve_request_duration_seconds", labels, stats.request)
+                for q in self.quantiles:
+                    quantiles.append(f'pyserve_request_duration_quantile_seconds{{{labels},quantile="{q}"}} {stats.request.quantile(q)}')
+                if stats.middleware.count:
+                    self._histogram_lines(middlewares, "pyserve_middleware_duration_seconds", labels, stats.middleware)
+                if stats.handler.count:
+                    self._histogram_lines(handlers, "pyserve_handler_duration_seconds", labels, stats.handler)
+                # middlewares of the same class on one route are reported together
+                by_name: Dict[str, List[Any]] = {}
+                for name, seconds, count in stats.middlewares.values():
+                    totals = by_name.setdefault(name, [0.0, 0])
+                    totals[0] += seconds
+                    totals[1] += count
+                for name, (seconds, count) in sorted(by_name.items()):
+                    middleware_labels = f'{labels},middleware="{_escape(name)}"'
+                    per_middleware.append(f"pyserve_middleware_seconds_total{{{middleware_labels}}} {seconds}")
+                    calls.append(f"pyserve_middleware_calls_total{{{middleware_labels}}} {count}")
+        collected = [line for collector in self._collectors for line in collector()]
+        return "\n".join([*requests, *durations, *quantiles, *middlewares, *handlers, *per_middleware, *calls, *collected]) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._routes = {}
+
+
+class MetricsEndpoint(RequestHandler):
+    def __init__(self, metrics: Metrics):
+        self.metrics = metrics
+
+    def __call__(self, request: Request, response: Response):
+        response.header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        response.header("Cache-Control", "no-store")
+        response.send_raw(self.metrics.render().encode())
@@ -0,0 +1,214 @@
+from tempfile import SpooledTemporaryFile
+from typing import IO, Dict, Iterable, List, Tuple, Union
+
+from .body import RequestBodyError, RequestBodyTooLarge
+
+"""
+Incremental multipart/form-data parser. The body is consumed chunk by chunk as it arrives: plain
+fields are collected in memory (up to max_field_size each) and file parts are written straight into
+per-part spooled temp files, so memory use stays bounded however large the upload is.
+"""
+
+_PREAMBLE = 0
+_HEADERS = 1
+_BODY = 2
+_AFTER_DELIMITER = 3
+_EPILOGUE = 4
+
+
+class UploadedFile:
+    def __init__(self, name: str, filename: str, content_type: Union[str, None], headers: Dict[str, str], file: IO[bytes]):
+        self.name = name
+        self.filename = filename
+        self.content_type = content_type
+        self.headers = headers
+        self.file = file
+        self.size = 0
+
+    def close(self):
+        self.file.close()
+
+
+class MultipartForm:
+    def __init__(self):
+        self.fields: Dict[str, List[str]] = {}
+        self.files: Dict[str, List[UploadedFile]] = {}
+
+    def close(self):
+        for uploads in self.files.values():
+            for upload in uploads:
+                upload.close()
+
+
+def parse_header_params(value: str) -> Tuple[str, Dict[str, str]]:
+    """Splits 'form-data; name="a"; filename="b.txt"' into ('form-data', {'name': 'a', 'filename': 'b.txt'})"""
+    params: Dict[str, str] = {}
+    main, _, rest = value.partition(";")
+    i = 0
+    while i < len(rest):
+        eq = rest.find("=", i)
+        if eq < 0:
+            break
+        key = rest[i:eq].strip().strip(";").strip().lower()
+        i = eq + 1
+        while i < len(rest) and rest[i] == " ":
+            i += 1
+        if i < len(rest) and rest[i] == '"':
+            i += 1
+            chars: List[str] = []
+            while i < len(rest) and rest[i] != '"':
+                if rest[i] == "\\" and i + 1 < len(rest):
+                    i += 1
+                chars.append(rest[i])
+                i += 1
+            params[key] = "".join(chars)
+            i += 1
+        else:
+            end = rest.find(";", i)
+            end = len(rest) if end < 0 else end
+            params[key] = rest[i:end].strip()
+            i = end
+        next_sep = rest.find(";", i)
+        if next_sep < 0:
+            break
+        i = next_sep + 1
+    return main.strip().lower(), params
+
+
+def boundary_from_content_type(content_type: str) -> Union[bytes, None]:
+    kind, params = parse_header_params(content_type)
+    boundary = params.get("boundary")
+    if not kind.startswith("multipart/") or not boundary:
+        return None
+    return boundary.encode("latin-1")
+
+
+class MultipartParser:
+    def __init__(self, boundary: bytes, max_field_size: int=1024 * 1024, spool_threshold: int=1024 * 1024, max_parts: int=1000, max_header_size: int=16 * 1024, encoding: str="utf_8"):
+        self.max_field_size = max_field_size
+        self.spool_threshold = spool_threshold
+        self.max_parts = max_parts
+        self.max_header_size = max_header_size
+        self.encoding = encoding
+        self.form = MultipartForm()
+        self._first_delimiter = b"--" + boundary
+        self._delimiter = b"\r\n--" + boundary
+        self._buffer = bytearray()
+        self._state = _PREAMBLE
+        self._parts = 0
+        self._field: Union[bytearray, None] = None
+        self._field_name = ""
+        self._upload: Union[UploadedFile, None] = None
+
+    def _start_part(self, head: bytes):
+        self._parts += 1
+        if self._parts > self.max_parts:
+            raise RequestBodyError(413, f"More than {self.max_parts} multipart parts")
+        headers: Dict[str, str] = {}
+        for line in head.decode(self.encoding, "replace").split("\r\n"):
+            name, sep, value = line.partition(":")
+            if sep:
+                headers[name.strip().lower()] = value.strip()
+        disposition, params = parse_header_params(headers.get("content-disposition", ""))
+        if disposition != "form-data" or "name" not in params:
+            raise RequestBodyError(400, "Multipart part without a form-data name")
+        name = params["name"]
+        if "filename" in params:
+            spooled = SpooledTemporaryFile(max_size=self.spool_threshold)
+            self._upload = UploadedFile(name, params["filename"], headers.get("content-type"), headers, spooled)  # type: ignore[arg-type]
+            self.form.files.setdefault(name, []).append(self._upload)
+        else:
+            self._field = bytearray()
+            self._field_name = name
+
+    def _write(self, data: Union[bytes, bytearray, memoryview]):
+        if not data:
+            return
+        if self._upload is not None:
+            self._upload.file.write(data)
+            self._upload.size += len(data)
+            return
+        assert self._field is not None
+        if len(self._field) + len(data) > self.max_field_size:
+            raise RequestBodyTooLarge(self.max_field_size)
+        self._field += data
+
+    def _end_part(self):
+        if self._upload is not None:
+            self._upload.file.seek(0)
+            self._upload = None
+            return
+        assert self._field is not None
+        self.form.fields.setdefault(self._field_name, []).append(self._field.decode(self.encoding, "replace"))
+        self._field = None
+
+    def feed(self, data: bytes):
+        buffer = self._buffer
+        buffer += data
+        while True:
+            if self._state == _BODY:
+                index = buffer.find(self._delimiter)
+                if index < 0:
+                    # keep enough bytes to recognise a delimiter split across chunks
+                    keep = len(self._delimiter) - 1
+                    if len(buffer) > keep:
+                        flush = len(buffer) - keep
+                        self._write(memoryview(buffer)[:flush])
+                        del buffer[:flush]
+                    return
+                self._write(memoryview(buffer)[:index])
+                del buffer[:index + len(self._delimiter)]
+                self._end_part()
+                self._state = _AFTER_DELIMITER
+            elif self._state == _HEADERS:
+                index = buffer.find(b"\r\n\r\n")
+                if index < 0:
+                    if len(buffer) > self.max_header_size:
+                        raise RequestBodyError(431, "Multipart part headers too large")
+                    return
+                self._start_part(bytes(buffer[:index]))
+                del buffer[:index + 4]
+                self._state = _BODY
+            elif self._state == _AFTER_DELIMITER:
+                if len(buffer) < 2:
+                    return
+                if buffer[:2] == b"--":
+                    self._state = _EPILOGUE
+                    continue
+                index = buffer.find(b"\r\n")
+                if index < 0:
+                    if len(buffer) > self.max_header_size:
+                        raise RequestBodyError(400, "Invalid multipart delimiter line")
+                    return
+                # transport padding after the delimiter is allowed
+                del buffer[:index + 2]
+                self._state = _HEADERS
+            elif self._state == _PREAMBLE:
+                index = buffer.find(self._first_delimiter)
+                if index < 0:
+                    keep = len(self._first_delimiter) - 1
+                    if len(buffer) > keep:
+                        del buffer[:len(buffer) - keep]
+                    return
+                del buffer[:index + len(self._first_delimiter)]
+                self._state = _AFTER_DELIMITER
+            else:
+                buffer.clear()
+                return
+
+    def close(self) -> MultipartForm:
+        if self._state != _EPILOGUE:
+            self.form.close()
+            raise RequestBodyError(400, "Multipart body ended before the closing boundary")
+        return self.form
+
+
+def parse_multipart(chunks: Iterable[bytes], boundary: bytes, **options: int) -> MultipartForm:
+    parser = MultipartParser(boundary, **options)  # type: ignore[arg-type]
+    try:
+        for chunk in chunks:
+            parser.feed(chunk)
+    except BaseException:
+        parser.form.close()
+        raise
+    return parser.close()
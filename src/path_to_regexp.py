@@ -1,11 +1,17 @@
-from glob import escape
-from typing import Any, DefaultDict, Dict, List, TypedDict, Union
+from functools import lru_cache
+from re import escape
+from typing import Any, Callable, Dict, List, Mapping, Tuple, TypedDict, Union
 import re
 
 """
 The logic in this file was translated from the typescript here: https://github.com/pillarjs/path-to-regexp
+Parsing, compiling to a regexp and building path functions are memoized on the pattern and options,
+so that calling them again for the same route is a dictionary lookup.
 """
 
+# patterns (with distinct options) remembered by each of the memoized steps
+CACHE_SIZE = 4096
+
 Path = Union[str, re.Pattern[Any], List[Union[str, re.Pattern[str]]]]
     
 class LexToken(TypedDict):
@@ -35,71 +41,54 @@ class EncodeFunction:
 
 OptionalEncodeFn = Union[EncodeFunction, None]
 
-def lexer(string: str) -> List[LexToken]:
-    tokens: List[LexToken] = []
+# consecutive plain characters are lexed as one CHAR token; the parser splits off the last one when it
+# prefixes a parameter
+_TEXT_RUN = re.compile(r'[^*+?\\{}:(]+')
+_NAME = re.compile(r'\w+', re.ASCII)
+_MODIFIERS = frozenset("*+?")
+
+LexTuple = Tuple[str, int, str]
+
+def _lex(string: str) -> List[LexTuple]:
+    tokens: List[LexTuple] = []
     i = 0
-    while i < len(string):
+    length = len(string)
+    while i < length:
         char = string[i]
-        if char in ["*","+","?"]:
-            tokens.append({
-                "type": "MODIFIER",
-                "index": i,
-                "value": char
-            })
+        if char in _MODIFIERS:
+            tokens.append(("MODIFIER", i, char))
             i+=1
             continue
         if char == "\\":
-            tokens.append({
-                "type": "ESCAPED_CHAR",
-                "index": i,
-                "value": string[i+1]
-            })
+            if i + 1 >= length:
+                raise TypeError(f"Missing escaped character at {i}")
+            tokens.append(("ESCAPED_CHAR", i, string[i+1]))
             i+=2
             continue
         if char == "{":
-            tokens.append({
-                "type": "OPEN",
-                "index": i,
-                "value": char
-            })
+            tokens.append(("OPEN", i, char))
             i+=1
             continue
         if char == "}":
-            tokens.append({
-                "type": "CLOSE",
-                "index": i,
-                "value": char
-            })
+            tokens.append(("CLOSE", i, char))
             i+=1
             continue
         if char == ":":
-            name = ""
-            j = i+1
-            while j < len(string):
-                code = ord(string[j])
-                if 48 <= code <=57 or 65 <= code <= 90 or 97 <= code <=122 or code == 95:
-                    name += string[j]
-                    j+=1
-                    continue
-                break   
-            if not name:
+            name = _NAME.match(string, i + 1)
+            if name is None:
                 raise TypeError(f"Missing parameter name at {i}")
-            tokens.append({
-                "type": "NAME",
-                "index": i,
-                "value": name
-            })
-            i = j
+            tokens.append(("NAME", i, name.group()))
+            i = name.end()
             continue
         if char == "(":
             count = 1
             pattern = ""
             j = i + 1
-            if string[j] == "?":
+            if j < length and string[j] == "?":
                 raise TypeError(f'Pattern cannot start with "?" at {j}')
-            while j < len(string):
+            while j < length:
                 if string[j] == "\\":
-                    pattern += string[j] + string[j+1]
+                    pattern += string[j:j+2]
                     j+=2
                     continue
                 if string[j] == ")":
@@ -109,7 +98,7 @@ def lexer(string: str) -> List[LexToken]:
                         break
                 elif string[j] == "(":
                     count+=1
-                    if string[j+1] != "?":
+                    if j + 1 >= length or string[j+1] != "?":
                         raise TypeError(f"Capturing groups are not allowed at {j}")
                 pattern += string[j]
                 j+=1
@@ -117,29 +106,26 @@ def lexer(string: str) -> List[LexToken]:
                 raise TypeError(f"Unbalanced pattern at {i}")
             if not pattern:
                 raise TypeError(f"Missing pattern at {i}")
-            tokens.append({
-                "type": "PATTERN",
-                "index": i,
-                "value": pattern
-            })
+            tokens.append(("PATTERN", i, pattern))
             i = j
             continue
-        tokens.append({
-            "type": "CHAR",
-            "index": i,
-            "value": string[i]
-        })
-        i+=1
-    tokens.append({
-        "type": "END",
-        "index": i,
-        "value": ""
-    })
+        run = _TEXT_RUN.match(string, i)
+        assert run is not None
+        tokens.append(("CHAR", i, run.group()))
+        i = run.end()
+    tokens.append(("END", i, ""))
     return tokens
 
-def parse(string: str, delimiter:Union[str, None]=None, prefixes:str="./") -> List[Token]:
-    tokens = lexer(string)
-    default_pattern = f'[^{escape(delimiter if delimiter is not None else "/#?")}]+?'
+def lexer(string: str) -> List[LexToken]:
+    return [{"type": typ, "index": index, "value": value} for typ, index, value in _lex(string)]
+
+def default_pattern(delimiter:Union[str, None]=None) -> str:
+    return f'[^{escape(delimiter if delimiter is not None else "/#?")}]+?'
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _parse(string: str, delimiter:Union[str, None], prefixes:str) -> Tuple[Token, ...]:
+    tokens = _lex(string)
+    param_pattern = default_pattern(delimiter)
     result: List[Token] = []
     key = 0
     i = 0
@@ -147,35 +133,40 @@ def parse(string: str, delimiter:Union[str, None]=None, prefixes:str="./") -> Li
 
     def try_consume(typ: str) -> Union[None,str]:
         nonlocal i
-        nonlocal tokens
-        if i < len(tokens) and tokens[i]["type"] == typ:
-            v = tokens[i]["value"]
+        token = tokens[i]
+        if token[0] == typ:
             i+=1
-            return v
-    
+            return token[2]
+        return None
+
     def must_consume(typ: str) -> str:
         value = try_consume(typ)
         if value is not None:
             return value
-        next_type = tokens[i]["type"]
-        index = tokens[i]["index"]
-        raise TypeError(f'Unexpected {next_type} at {index}, expected {type}')
-    
-    def consume_text() -> Union[None,str]:
+        next_type, index, _ = tokens[i]
+        raise TypeError(f'Unexpected {next_type} at {index}, expected {typ}')
+
+    def consume_text() -> str:
         result = ""
-        value: Union[None,str] = None
-        # TODO: review this
-        while value := try_consume("CHAR") or try_consume("ESCAPED_CHAR"):
+        while True:
+            value = try_consume("CHAR")
+            if value is None:
+                value = try_consume("ESCAPED_CHAR")
+                if value is None:
+                    return result
             result += value
-        return result
-    
+
     while i < len(tokens):
         char = try_consume("CHAR")
+        if char is not None and tokens[i][0] in ("NAME", "PATTERN"):
+            # only the character right before a parameter can be its prefix
+            path += char[:-1]
+            char = char[-1]
         name = try_consume("NAME")
         pattern = try_consume("PATTERN")
         if name or pattern:
             prefix = char or ""
-            if prefix in prefixes:
+            if prefix not in prefixes:
                 path += prefix
                 prefix = ""
             if path:
@@ -185,7 +176,7 @@ def parse(string: str, delimiter:Union[str, None]=None, prefixes:str="./") -> Li
                 "name": name or key,
                 "prefix": prefix,
                 "suffix": "",
-                "pattern": pattern or default_pattern,
+                "pattern": pattern or param_pattern,
                 "modifier": try_consume("MODIFIER") or ""
             })
             if not name:
@@ -206,117 +197,125 @@ def parse(string: str, delimiter:Union[str, None]=None, prefixes:str="./") -> Li
             suffix = consume_text()
             must_consume("CLOSE")
             result.append({
-                "name": name or (pattern if key else ""),
-                "prefix": prefix or "",
-                "suffix": suffix or "",
-                "pattern": default_pattern if name and not pattern else pattern,
+                "name": name or (key if pattern else ""),
+                "prefix": prefix,
+                "suffix": suffix,
+                "pattern": param_pattern if name and not pattern else pattern,
                 "modifier": try_consume("MODIFIER") or ""
             })
-            if key and not name:
+            if pattern and not name:
                 key+=1
             continue
         must_consume("END")
-    return result
+    return tuple(result)
+
+def parse(string: str, delimiter:Union[str, None]=None, prefixes:str="./") -> List[Token]:
+    # the tokens are shared with the cache and must not be modified
+    return list(_parse(string, delimiter, prefixes))
 
 def flags(sensitive: Union[bool, None]) -> re.RegexFlag:
-    if sensitive is not None and sensitive:
-        return re.RegexFlag.I
-    # TODO: review this
-    return re.RegexFlag.U
+    if sensitive:
+        return re.RegexFlag.U
+    return re.RegexFlag.U | re.RegexFlag.I
 
-def tokens_to_function(tokens: List[Token], sensitive:bool=False, encode: OptionalEncodeFn=None, validate: bool=True):
+def tokens_to_function(tokens: List[Token], sensitive:bool=False, encode: OptionalEncodeFn=None, validate: bool=True) -> Callable[[Union[Mapping[str, Any], None]], str]:
     re_flags = flags(sensitive)
-    def default_encode(string: str, token: Token) -> str:
-        return string
-    encode_fn = encode if encode is not None else default_encode
-    matches = [re.compile(f'^(?:{token["pattern"]})$', re_flags) if type(token) is Key else token for token in tokens]
+    # everything about a token that doesn't depend on the data is worked out once, here
+    parts: List[Union[str, Tuple[Key, str, bool, bool, Union[re.Pattern[str], None]]]] = []
+    for token in tokens:
+        if isinstance(token, str):
+            parts.append(token)
+            continue
+        regex = re.compile(f'^(?:{token["pattern"]})$', re_flags) if validate else None
+        parts.append((token, str(token["name"]), token["modifier"] in ["?", "*"], token["modifier"] in ["*", "+"], regex))
 
-    def return_func(data: DefaultDict[str, Any]):
+    def return_func(data: Union[Mapping[str, Any], None]=None) -> str:
         path = ""
-        for i, token in enumerate(tokens):
-            if isinstance(token, str):
-                path += token
+        for part in parts:
+            if isinstance(part, str):
+                path += part
                 continue
-            value = data[str(token["name"])] if data is not None else None
-            optional = token["modifier"] in ["?", "*"]
-            repeat = token["modifier"] in ["*" or "+"]
-            if type(value) is List[str]:
+            token, name, optional, repeat, regex = part
+            value = data.get(name) if data is not None else None
+            if isinstance(value, (list, tuple)):
                 if not repeat:
-                    raise TypeError(f'Expected "{token["name"]} not to repeat, but got an array')
+                    raise TypeError(f'Expected "{name}" to not repeat, but got an array')
                 if len(value) == 0:
                     if optional:
                         continue
-                    raise TypeError(f'Expected {token["name"]} to not be empty')
+                    raise TypeError(f'Expected "{name}" to not be empty')
                 for unencoded_segment in value:
-                    segment = encode_fn(unencoded_segment, token)
-                    r = matches[i]
-                    if validate and type(r) is re.Pattern[str] and r.match(segment) is None:
-                        raise TypeError(f'Expected all {token["name"]} to match "{token["pattern"]}", but got {segment}')
+                    segment = encode(str(unencoded_segment), token) if encode is not None else str(unencoded_segment)
+                    if regex is not None and regex.match(segment) is None:
+                        raise TypeError(f'Expected all "{name}" to match "{token["pattern"]}", but got "{segment}"')
                     path += token["prefix"] + segment + token["suffix"]
                 continue
-            if type(value) is str or type(value) is int or type(value) is float:
-                segment = encode_fn(str(value), token)
-                regex = matches[i]
-                if validate and type(regex) is re.Pattern[str] and regex.match(segment) is None:
-                    raise TypeError(f'Expected all {token["name"]} to match "{token["pattern"]}", but got {segment}')
+            if isinstance(value, (str, int, float)):
+                segment = encode(str(value), token) if encode is not None else str(value)
+                if regex is not None and regex.match(segment) is None:
+                    raise TypeError(f'Expected "{name}" to match "{token["pattern"]}", but got "{segment}"')
                 path += token["prefix"] + segment + token["suffix"]
                 continue
             if optional:
                 continue
             type_of_message = "an array" if repeat else "a string"
-            raise TypeError(f'Expected "{token["name"]}" to be "{type_of_message}"')
+            raise TypeError(f'Expected "{name}" to be {type_of_message}')
         return path
 
     return return_func
 
-def compile(string: str, sensitive:bool=False, encode: OptionalEncodeFn=None, validate: bool=True, delimiter:Union[str, None]=None, prefixes:str="./" ):
-    return tokens_to_function(parse(string, delimiter=delimiter, prefixes=prefixes), sensitive=sensitive, encode=encode, validate=validate)
+@lru_cache(maxsize=CACHE_SIZE)
+def _compile(string: str, sensitive:bool, encode: OptionalEncodeFn, validate: bool, delimiter:Union[str, None], prefixes:str) -> Callable[[Union[Mapping[str, Any], None]], str]:
+    return tokens_to_function(list(_parse(string, delimiter, prefixes)), sensitive=sensitive, encode=encode, validate=validate)
 
-def regexp_to_function(regexp: re.Pattern[str], keys: List[Key], decode:OptionalEncodeFn=None):
-    def default_func(string: str, token: Token) -> str:
+def compile(string: str, sensitive:bool=False, encode: OptionalEncodeFn=None, validate: bool=True, delimiter:Union[str, None]=None, prefixes:str="./" ) -> Callable[[Union[Mapping[str, Any], None]], str]:
+    return _compile(string, sensitive, encode, validate, delimiter, prefixes)
+
+def regexp_to_function(regexp: re.Pattern[str], keys: List[Key], decode:OptionalEncodeFn=None) -> Callable[[str], MatchResult]:
+    def default_func(string: str, token: Union[Token,None]=None) -> str:
         return string
     decodeFn = decode if decode is not None else default_func
-    
+
     def return_func(pathname: str) -> MatchResult:
         m = regexp.match(pathname)
-        if m is None: 
+        if m is None:
             return None
-        path: str = m.group(0)
-        index = m.start()
-        params = Dict[str, Any]()
-        groups = m.groups()
-        for i, group in zip(range(1, len(groups)),groups):
-            g: str = group
-            key = keys[i - 1]
+        params: Dict[str, Any] = {}
+        for key, group in zip(keys, m.groups()):
+            if group is None:
+                continue
             if key["modifier"] in ["*", "+"]:
-                params[str(key["name"])] = [decodeFn(value, key) for value in g.split(key["prefix"] + key["suffix"])]
+                separator = key["prefix"] + key["suffix"]
+                values = group.split(separator) if separator else [group]
+                params[str(key["name"])] = [decodeFn(value, key) for value in values]
             else:
-                params[str(key["name"])] = decodeFn(g, key)
+                params[str(key["name"])] = decodeFn(group, key)
         return {
-            "path": path,
-            "index": index,
+            "path": m.group(0),
+            "index": m.start(),
             "params": params
         }
 
     return return_func
 
+# an unescaped opening parenthesis that starts a capturing group, named or not
+_GROUPS = re.compile(r'(?<!\\)\((?:\?P<(\w+)>)?(?!\?)')
+
 def regexp_to_regexp(path: re.Pattern[str], keys:Union[List[Key], None]=None) -> re.Pattern[str]:
-    if keys is None: 
+    if keys is None:
         return path
-    groupsRegex = re.compile('\\((?:\\?<(.*?)>)?(?!\\?)')
     index = 0
-    exec_result = groupsRegex.search(path.pattern)
-    while exec_result:
+    for group in _GROUPS.finditer(path.pattern):
+        name = group.group(1)
         keys.append({
-            "name": exec_result.group(1) if exec_result is not None else index,
+            "name": name if name is not None else index,
             "prefix": "",
             "suffix": "",
             "pattern": "",
             "modifier": ""
         })
-        if exec_result is None:
+        if name is None:
             index +=1
-        exec_result = groupsRegex.search(path.pattern)
     return path
 
 def array_to_regexp(paths: List[Union[str, re.Pattern[str]]], keys:Union[List[Key], None]=None, encode: OptionalEncodeFn=None, sensitive:bool=False, delimiter:Union[str, None]=None, prefixes:str="./") -> re.Pattern[str]:
@@ -324,7 +323,7 @@ def array_to_regexp(paths: List[Union[str, re.Pattern[str]]], keys:Union[List[Ke
     return re.compile(f'(?:{"|".join(parts)})', flags(sensitive))
 
 def tokens_to_regexp(tokens: List[Token], keys: Union[List[Key], None], sensitive: bool=False, strict: bool=False, end: bool = True, start: bool = True, delimiter:Union[str, None]=None, ends_with: str = "", encode: OptionalEncodeFn=None):
-    ends_with_re=f'[{escape(ends_with or "")}]$'
+    ends_with_re=f'[{escape(ends_with)}]|$' if ends_with else "$"
     delimiter_re=f'[{escape(delimiter or "/#?")}]'
     def default_func(string: str, token: Union[Token,None]=None) -> str:
         return string
@@ -337,7 +336,7 @@ def tokens_to_regexp(tokens: List[Token], keys: Union[List[Key], None], sensitiv
             prefix = escape(encodeFn(token["prefix"]))
             suffix = escape(encodeFn(token["suffix"]))
             if token["pattern"]:
-                if keys:
+                if keys is not None:
                     keys.append(token)
                 if prefix or suffix:
                     if token["modifier"] in[ "*", "+"]:
@@ -351,10 +350,10 @@ def tokens_to_regexp(tokens: List[Token], keys: Union[List[Key], None], sensitiv
                 route += f'(?:{prefix}{suffix}){token["modifier"]}'
     if end:
         if not strict:
-            route += f'{delimiter}?'
-        route += "$" if not ends_with_re else f'(?={ends_with_re})'
+            route += f'{delimiter_re}?'
+        route += f'(?={ends_with_re})' if ends_with else "$"
     else:
-        end_token = tokens[-1]
+        end_token = tokens[-1] if tokens else None
         is_end_delimited = end_token[-1] in delimiter_re if isinstance(end_token, str) else end_token is None
         if not strict:
             route+=f'(?:{delimiter_re}(?={ends_with_re}))?'
@@ -362,8 +361,17 @@ def tokens_to_regexp(tokens: List[Token], keys: Union[List[Key], None], sensitiv
             route += f'(?={delimiter_re}|{ends_with_re})'
     return re.compile(route, flags(sensitive))
 
+@lru_cache(maxsize=CACHE_SIZE)
+def _string_to_regexp(path: str, sensitive: bool, strict: bool, end: bool, start: bool, delimiter:Union[str, None], ends_with: str, encode: OptionalEncodeFn, prefixes:str) -> Tuple[re.Pattern[str], Tuple[Key, ...]]:
+    keys: List[Key] = []
+    regexp = tokens_to_regexp(list(_parse(path, delimiter, prefixes)), keys, sensitive=sensitive, strict=strict, end=end, start=start, delimiter=delimiter, ends_with=ends_with, encode=encode)
+    return regexp, tuple(keys)
+
 def string_to_regexp(path: str, keys:Union[List[Key], None]=None, sensitive: bool=False, strict: bool=False, end: bool = True, start: bool = True, delimiter:Union[str, None]=None, ends_with: str = "", encode: OptionalEncodeFn=None, prefixes:str="./") -> re.Pattern[str]:
-    return tokens_to_regexp(parse(path, delimiter=delimiter, prefixes=prefixes), keys, sensitive=sensitive, strict=strict, end=end, start=start, delimiter=delimiter, ends_with=ends_with, encode=encode)
+    regexp, compiled_keys = _string_to_regexp(path, sensitive, strict, end, start, delimiter, ends_with, encode, prefixes)
+    if keys is not None:
+        keys.extend(compiled_keys)
+    return regexp
 
 def path_to_regex(path: Path, keys:Union[List[Key], None]=None, sensitive: bool=False, strict: bool=False, end: bool = True, start: bool = True, delimiter:Union[str, None]=None, ends_with: str = "", encode: OptionalEncodeFn=None, prefixes:str="./") -> re.Pattern[str]:
     if isinstance(path, re.Pattern):
@@ -372,7 +380,15 @@ def path_to_regex(path: Path, keys:Union[List[Key], None]=None, sensitive: bool=
         return array_to_regexp(path, keys, encode=encode)
     return string_to_regexp(path, keys,sensitive=sensitive, strict=strict, end=end, start=start, delimiter=delimiter, ends_with=ends_with, encode=encode, prefixes=prefixes)
 
-def match(string: Path,encode:OptionalEncodeFn=None,decode:OptionalEncodeFn=None):
-    keys = []
+@lru_cache(maxsize=CACHE_SIZE)
+def _match(string: str, encode:OptionalEncodeFn, decode:OptionalEncodeFn) -> Callable[[str], MatchResult]:
+    keys: List[Key] = []
+    regexp = path_to_regex(string, keys, encode=encode)
+    return regexp_to_function(regexp, keys, decode=decode)
+
+def match(string: Path,encode:OptionalEncodeFn=None,decode:OptionalEncodeFn=None) -> Callable[[str], MatchResult]:
+    if isinstance(string, str):
+        return _match(string, encode, decode)
+    keys: List[Key] = []
     regexp = path_to_regex(string, keys, encode=encode)
     return regexp_to_function(regexp, keys, decode=decode)
@@ -0,0 +1,123 @@
+from http.server import HTTPServer
+from queue import Full, Queue
+from socket import socket
+from socketserver import ThreadingMixIn
+from threading import Lock, Thread
+from typing import Any, Dict, List, Literal, Tuple, Type, Union
+
+"""
+HTTPServer that hands accepted connections to a fixed pool of worker threads through a bounded
+queue, instead of spawning a thread per connection like ThreadingHTTPServer.
+"""
+
+OverloadPolicy = Union[Literal["reject"], Literal["block"], Literal["drop"]]
+
+_REJECT_RESPONSE = b"HTTP/1.1 503 Service Unavailable\r\nContent-Length: 0\r\nRetry-After: 1\r\nConnection: close\r\n\r\n"
+
+
+class PooledHTTPServer(ThreadingMixIn, HTTPServer):
+    """
+    When the queue is full, overload_policy decides what happens to a new connection:
+      - "reject": answer 503 with Retry-After and close it
+      - "block": stop accepting until a slot frees up (the kernel backlog absorbs the burst)
+      - "drop": close it without a response
+    Use pooled_server_class() to configure a subclass for Pyserve(server_class=...).
+    """
+    pool_size = 16
+    max_queue = 64
+    overload_policy: OverloadPolicy = "reject"
+
+    def __init__(self, server_address: Tuple[str, int], RequestHandlerClass: Any, bind_and_activate: bool=True):
+        super().__init__(server_address, RequestHandlerClass, bind_and_activate)
+        self._queue: "Queue[Union[Tuple[socket, Any], None]]" = Queue(self.max_queue)
+        self._workers: List[Thread] = []
+        self._lock = Lock()
+        self.busy = 0
+        self.accepted = 0
+        self.rejected = 0
+        self.dropped = 0
+        self.max_depth = 0
+
+    def _start_workers(self):
+        # started lazily rather than in __init__ so that threads are created after any fork
+        for i in range(self.pool_size - len(self._workers)):
+            worker = Thread(target=self._work, name=f"pyserve-worker-{i}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            request, client_address = item
+            with self._lock:
+                self.busy += 1
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+                with self._lock:
+                    self.busy -= 1
+
+    def _reject(self, request: socket):
+        try:
+            request.settimeout(0.1)
+            request.sendall(_REJECT_RESPONSE)
+        except OSError:
+            pass
+        self.shutdown_request(request)
+
+    def process_request(self, request: socket, client_address: Any):  # type: ignore[override]
+        if not self._workers:
+            self._start_workers()
+        try:
+            if self.overload_policy == "block":
+                self._queue.put((request, client_address))
+            else:
+                self._queue.put_nowait((request, client_address))
+        except Full:
+            if self.overload_policy == "reject":
+                self.rejected += 1
+                self._reject(request)
+            else:
+                self.dropped += 1
+                self.shutdown_request(request)
+            return
+        self.accepted += 1
+        depth = self._queue.qsize()
+        if depth > self.max_depth:
+            self.max_depth = depth
+
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "pool_size": self.pool_size,
+            "busy": self.busy,
+            "queue_depth": self.queue_depth(),
+            "max_queue": self.max_queue,
+            "max_depth": self.max_depth,
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "dropped": self.dropped
+        }
+
+    def server_close(self):
+        super().server_close()
+        for _ in self._workers:
+            self._queue.put(None)
+        for worker in self._workers:
+            worker.join()
+        self._workers = []
+
+
+def pooled_server_class(pool_size: int=16, max_queue: int=64, overload_policy: OverloadPolicy="reject") -> Type[PooledHTTPServer]:
+    return type("PooledHTTPServer", (PooledHTTPServer,), {
+        "pool_size": pool_size,
+        "max_queue": max_queue,
+        "overload_policy": overload_policy
+    })
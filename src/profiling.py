@@ -0,0 +1,273 @@
+from cProfile import Profile
+from hmac import compare_digest
+from io import StringIO
+from marshal import dumps
+from os.path import basename
+from pstats import Stats
+from random import random
+from sys import _current_frames, _getframe, version_info
+from threading import Event, Lock, Thread, get_ident
+from time import sleep
+from types import FrameType
+from typing import Any, Callable, Dict, List, Literal, Tuple, TypeVar, Union
+
+from .handler import RequestHandler
+from .metrics import MIDDLEWARE_ONLY
+from .request import Request
+from .response import Response
+
+"""
+On-demand profiling of the middleware + handler chain. A Profiler picks a fraction of requests at
+random, and requests that carry its trigger header with the right token, and runs their chain under
+cProfile or a stack sampler. Results are aggregated per route pattern and can be downloaded as pstats
+files (cprofile mode) or collapsed stacks for flamegraph tools (sampler mode):
+    profiler = server.enable_profiling(Profiler(sample_rate=0.01, trigger_token="secret"))
+    curl -H "X-Pyserve-Profile: secret" localhost:8080/items/1
+    curl "localhost:8080/debug/profile?route=/items/:id&format=pstats" > items.pstats
+"""
+
+ProfileMode = Literal["cprofile", "sampler"]
+ProfileFormat = Literal["pstats", "text", "collapsed"]
+
+T = TypeVar("T")
+
+# cProfile records every thread from 3.12 on (it is built on sys.monitoring), the profiling thread only before
+_PROFILES_ALL_THREADS = version_info >= (3, 12)
+
+
+def _frame_name(frame: FrameType) -> str:
+    code = frame.f_code
+    return f"{code.co_qualname} ({basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """
+    Samples the stacks of the threads that are running a profiled chain every interval seconds, from a
+    daemon thread that sleeps while nothing is being profiled. Stacks are cut at the frame that started
+    profiling, so they only hold the chain.
+    """
+    def __init__(self, interval: float=0.001):
+        self.interval = interval
+        # route -> collapsed stack -> samples
+        self.stacks: Dict[str, Dict[str, int]] = {}
+        self._active: Dict[int, Tuple[str, FrameType]] = {}
+        self._lock = Lock()
+        self._wake = Event()
+        self._thread: Union[Thread, None] = None
+
+    def start(self, route: str, frame: FrameType):
+        with self._lock:
+            self._active[get_ident()] = (route, frame)
+            if self._thread is None:
+                self._thread = Thread(target=self._run, name="pyserve-sampler", daemon=True)
+                self._thread.start()
+        self._wake.set()
+
+    def stop(self):
+        with self._lock:
+            self._active.pop(get_ident(), None)
+
+    def _run(self):
+        while True:
+            while not self._active:
+                self._wake.wait()
+                self._wake.clear()
+            sleep(self.interval)
+            self.sample()
+
+    def sample(self):
+        frames = _current_frames()
+        with self._lock:
+            for thread_id, (route, root) in self._active.items():
+                frame = frames.get(thread_id)
+                names: List[str] = []
+                while frame is not None and frame is not root:
+                    names.append(_frame_name(frame))
+                    frame = frame.f_back
+                if not names:
+                    continue
+                names.reverse()
+                stack = ";".join(names)
+                counts = self.stacks.setdefault(route, {})
+                counts[stack] = counts.get(stack, 0) + 1
+
+    def collapsed(self, route: Union[str, None]=None) -> str:
+        """Stacks in the collapsed format (`frame;frame;frame count` per line) read by flamegraph.pl and speedscope"""
+        merged: Dict[str, int] = {}
+        with self._lock:
+            for name, counts in self.stacks.items():
+                if route is None or name == route:
+                    for stack, count in counts.items():
+                        merged[stack] = merged.get(stack, 0) + count
+        return "".join(f"{stack} {count}\n" for stack, count in sorted(merged.items()))
+
+    def reset(self):
+        with self._lock:
+            self.stacks = {}
+
+
+class Profiler:
+    """
+    Chooses requests to profile and profiles them. One Profile is enabled at a time, so a request chosen
+    while another is profiled runs unprofiled and is counted in skipped. From Python 3.12 cProfile also
+    records what other threads run, so a chosen request is only profiled if it is the only one in flight
+    (servers count them with track), and what it recorded is dropped, and counted in skipped, if another
+    request started meanwhile. The trigger header is only honored when trigger_token is set.
+    """
+    def __init__(self, sample_rate: float=0.0, trigger_header: str="X-Pyserve-Profile", trigger_token: Union[str, None]=None, mode: ProfileMode="cprofile", interval: float=0.001):
+        if mode not in ("cprofile", "sampler"):
+            raise ValueError(f"unknown profiling mode {mode}")
+        self.sample_rate = sample_rate
+        self.trigger_header = trigger_header
+        self.trigger_token = trigger_token
+        self.mode = mode
+        self.requests: Dict[str, int] = {}
+        self.skipped = 0
+        self._stats: Dict[str, Stats] = {}
+        self._busy = Lock()
+        self._lock = Lock()
+        # requests between track() and their close, and how many were ever tracked
+        self._in_flight = 0
+        self._arrivals = 0
+        self.sampler = StackSampler(interval)
+
+    def wants(self, request: Request) -> bool:
+        if self.sample_rate and random() < self.sample_rate:
+            return True
+        if self.trigger_token is None:
+            return False
+        value = request.header(self.trigger_header)
+        return value is not None and compare_digest(value.encode(), self.trigger_token.encode())
+
+    def track(self, request: Request):
+        """Counts request as in flight until it is closed; servers call it for every request that runs a chain"""
+        if self.mode != "cprofile" or not _PROFILES_ALL_THREADS:
+            return
+        with self._lock:
+            self._in_flight += 1
+            self._arrivals += 1
+        request.on_close(self._leave)
+
+    def _leave(self):
+        with self._lock:
+            self._in_flight -= 1
+
+    def run(self, route: Union[str, None], function: Callable[..., T], *args: Any) -> T:
+        """Calls function(*args) under the profiler, recording it for route"""
+        route = route or MIDDLEWARE_ONLY
+        if self.mode == "sampler":
+            self.sampler.start(route, _getframe())
+            try:
+                return function(*args)
+            finally:
+                self.sampler.stop()
+                self._count(route)
+        if not self._busy.acquire(blocking=False):
+            with self._lock:
+                self.skipped += 1
+            return function(*args)
+        try:
+            with self._lock:
+                alone = not _PROFILES_ALL_THREADS or self._in_flight <= 1
+                arrivals = self._arrivals
+                if not alone:
+                    self.skipped += 1
+            if not alone:
+                return function(*args)
+            profile = Profile()
+            profile.enable()
+            try:
+                return function(*args)
+            finally:
+                profile.disable()
+                with self._lock:
+                    alone = self._arrivals == arrivals
+                    if not alone:
+                        self.skipped += 1
+                if alone:
+                    stats = self._stats.get(route)
+                    if stats is None:
+                        self._stats[route] = Stats(profile, stream=StringIO())
+                    else:
+                        stats.add(profile)
+                    self._count(route)
+        finally:
+            self._busy.release()
+
+    def _count(self, route: str):
+        with self._lock:
+            self.requests[route] = self.requests.get(route, 0) + 1
+
+    def stats(self, route: Union[str, None]=None) -> Union[Stats, None]:
+        """The cProfile results for route (all routes when None) as one pstats.Stats"""
+        with self._busy:
+            recorded = [stats for name, stats in self._stats.items() if route is None or name == route]
+            if not recorded:
+                return None
+            stats = Stats(stream=StringIO())
+            stats.add(*recorded)
+        return stats
+
+    def export(self, route: Union[str, None]=None, format: ProfileFormat="pstats", limit: int=50) -> Union[bytes, None]:
+        """The results in one of the download formats, or None when there are none in that format"""
+        if format == "collapsed":
+            if self.mode != "sampler":
+                return None
+            return self.sampler.collapsed(route).encode()
+        if self.mode != "cprofile":
+            return None
+        stats = self.stats(route)
+        if stats is None:
+            return None
+        if format == "pstats":
+            # the same marshalled dict that Stats.dump_stats writes, loadable with pstats.Stats(path)
+            return dumps(stats.stats)  # type: ignore[attr-defined]
+        output = StringIO()
+        stats.stream = output  # type: ignore[attr-defined]
+        stats.sort_stats("cumulative").print_stats(limit)
+        return output.getvalue().encode()
+
+    def reset(self):
+        with self._busy:
+            self._stats = {}
+        with self._lock:
+            self.requests = {}
+            self.skipped = 0
+        self.sampler.reset()
+
+
+class ProfileEndpoint(RequestHandler):
+    """
+    GET lists the profiled routes as JSON. With ?format=pstats|text|collapsed it downloads the results,
+    of one route pattern with &route=..., and with ?reset=1 it discards everything recorded so far.
+    """
+    def __init__(self, profiler: Profiler):
+        self.profiler = profiler
+
+    def __call__(self, request: Request, response: Response):
+        query = request.query()
+        response.header("Cache-Control", "no-store")
+        if "reset" in query:
+            self.profiler.reset()
+        format = query.get("format", [None])[0]
+        if format is None:
+            with self.profiler._lock:
+                response.send_json({"mode": self.profiler.mode, "requests": dict(self.profiler.requests), "skipped": self.profiler.skipped})
+            return
+        if format not in ("pstats", "text", "collapsed"):
+            response.status(400)
+            response.send_raw(f"unknown format {format}".encode())
+            return
+        route = query.get("route", [None])[0]
+        data = self.profiler.export(route, format)  # type: ignore[arg-type]
+        if data is None:
+            response.status(404)
+            response.send_raw(f"no {format} profile for {route or 'any route'} in {self.profiler.mode} mode".encode())
+            return
+        if format == "text":
+            response.header("Content-Type", "text/plain; charset=utf-8")
+        else:
+            extension = "pstats" if format == "pstats" else "folded"
+            response.header("Content-Type", "application/octet-stream")
+            response.header("Content-Disposition", f'attachment; filename="profile.{extension}"')
+        response.send_raw(data)
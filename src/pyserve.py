@@ -1,4 +1,14 @@
 from .server import *
+from .async_server import *
+from .pooled_server import *
+from .static import *
+from .compression import *
+from .response_cache import *
+from .metrics import *
+from .profiling import *
+from .admission import *
+from .wsgi import *
+from .sse import *
 from .response import *
 from .request import *
 from .handler import *
\ No newline at end of file
@@ -1,24 +1,68 @@
-from http.server import BaseHTTPRequestHandler
 from json import loads
-from urllib.parse import parse_qs
+from tempfile import SpooledTemporaryFile
+from typing import IO, Callable, Iterable, List, Union
+from urllib.parse import parse_qs, unquote
 
+from .body import CHUNK_SIZE, BodyReader, RequestBodyError
+from .exchange import Exchange
+from .multipart import MultipartForm, boundary_from_content_type, parse_multipart
 from .types import QueryParsed, Cookies, JsonBody, Params, Headers
 
 
 class Request:
-    _cookies: Cookies
-    _json: JsonBody
-    _params: Params
-    _query_parsed: QueryParsed
-    def __init__(self, pattern: str, handler: BaseHTTPRequestHandler):
+    """
+    Everything but the route match is parsed on first access and memoized. Servers reuse one Request
+    per connection through reset(), so nothing may hold on to a request once its response is written.
+    """
+    __slots__ = ("handler", "_pattern", "_params", "max_body_size", "spool_threshold", "_path", "_query", "_headers", "_cookies", "_json", "_query_parsed", "_reader", "_body_file", "_form", "_close_callbacks")
+
+    def __init__(self, pattern: str, handler: Exchange, params: Params, max_body_size: Union[int, None]=None, spool_threshold: int=1024 * 1024):
+        self.max_body_size = max_body_size
+        self.spool_threshold = spool_threshold
+        self._close_callbacks: List[Callable[[], None]] = []
+        self.reset(pattern, handler, params)
+
+    def reset(self, pattern: str, handler: Exchange, params: Params):
         self.handler = handler
         self._pattern = pattern
-        path_and_query = handler.path.split("?")
-        self._query = path_and_query[1] if len(path_and_query) > 1 else None
-        self.path = path_and_query[0]
-        self.headers = self._parse_headers()
-        self.method = handler.command
-    
+        self._params = params
+        self._path: Union[str, None] = None
+        self._query: Union[str, None] = None
+        self._headers: Union[Headers, None] = None
+        self._cookies: Union[Cookies, None] = None
+        self._json: Union[JsonBody, None] = None
+        self._query_parsed: Union[QueryParsed, None] = None
+        self._reader: Union[BodyReader, None] = None
+        self._body_file: Union[IO[bytes], None] = None
+        self._form: Union[MultipartForm, None] = None
+
+    def _split_path(self):
+        path, _, query = self.handler.path.partition("?")
+        self._path = path
+        self._query = query
+
+    @property
+    def path(self) -> str:
+        if self._path is None:
+            self._split_path()
+        return self._path  # type: ignore[return-value]
+
+    @property
+    def method(self) -> str:
+        return self.handler.command
+
+    @property
+    def headers(self) -> Headers:
+        # a copy of every header; header() looks one up without building it
+        if self._headers is None:
+            self._headers = self._parse_headers()
+        return self._headers
+
+    def header(self, name: str, default: Union[str, None]=None) -> Union[str, None]:
+        # case-insensitive
+        value = self.handler.headers.get(name)
+        return default if value is None else str(value)
+
     def _parse_headers(self) -> Headers:
         headers = self.handler.headers
         d = Headers(None)
@@ -26,80 +70,137 @@ class Request:
             d[key] = str(value)
         return d
 
-    def _parse_body(self):
-        content_type = self.headers.get('Content-Type')
+    def _body_reader(self) -> BodyReader:
+        if self._reader is None:
+            transfer_encoding = self.handler.headers.get("Transfer-Encoding")
+            chunked = transfer_encoding is not None and "chunked" in transfer_encoding.lower()
+            content_length = self.handler.headers.get("Content-Length")
+            # exchanges whose rfile ends with the body (see wsgi.WsgiExchange) need no length
+            until_eof = getattr(self.handler, "body_until_eof", False)
+            self._reader = BodyReader(self.handler.rfile, int(content_length) if content_length else None, chunked, self.max_body_size, until_eof)
+        return self._reader
+
+    def _parse_body(self) -> JsonBody:
+        content_type = self.handler.headers.get('Content-Type')
+        json_body = JsonBody()
         if content_type is None:
-            return
-        content_length_str = self.headers.get('Content-Length')
-        content_len = int(content_length_str) if content_length_str is not None else None
-        if content_len is None:
-            return
-        post_body = self.handler.rfile.read(content_len)
+            return json_body
+        if content_type.startswith("multipart/form-data"):
+            json_body.update(self.form().fields)
+            return json_body
+        if self._body_file is not None:
+            self._body_file.seek(0)
+            post_body = self._body_file.read()
+        else:
+            post_body = self._body_reader().read()
         encoding = "utf_8" # TODO: get encoding from content-type header
         if content_type.startswith("application/json"):
-            self._json = loads(post_body)
-        elif content_type.startswith("application/x-www-form-urlencoded"):
-            parsed = parse_qs(post_body)
-            json_body = JsonBody()
-            for key, value in parsed.items():
+            return loads(post_body)
+        if content_type.startswith("application/x-www-form-urlencoded"):
+            for key, value in parse_qs(post_body).items():
                 json_body[key.decode(encoding)] = [v.decode(encoding) for v in value]
-            self._json = json_body
-
-
-    def _parse_query(self):
-        parsed = parse_qs(self._query)
-        qs =  QueryParsed()
-        qs.update(parsed.items())
-        self._query_parsed = qs
-
-    def _parse_params(self):
-        params = Params()
-        split_pattern = self._pattern.split("/")
-        split_path = self.path.split("")
-        for i, pattern_value in enumerate(split_pattern):
-            is_param = pattern_value.startswith(":")
-            if not is_param:
-                continue
-            end_index = -1
-            optional = pattern_value.endswith("?")
-            if optional:
-                end_index -= 1
-            wildcard = pattern_value.endswith("(*)?" if optional else "(*)")
-            if wildcard:
-                end_index -= 3
-                param_value = "/".join(split_path[i:])
-            else:
-                param_value = split_path[i]
-            param_name = pattern_value[1:end_index]
-            params[param_name] = param_value
-            if wildcard:
-                break
-    
-    def _parse_cookies(self):
-        # TODO: get cookies as dict
-        self._cookies = Cookies()
-    
+        return json_body
+
+    def _parse_query(self) -> QueryParsed:
+        if self._path is None:
+            self._split_path()
+        qs = QueryParsed()
+        if self._query:
+            qs.update(parse_qs(self._query))
+        return qs
+
+    def _parse_cookies(self) -> Cookies:
+        cookies = Cookies()
+        for header in self.handler.headers.get_all("Cookie") or ():
+            for pair in str(header).split(";"):
+                name, sep, value = pair.strip().partition("=")
+                if sep and name and name not in cookies:
+                    cookies[name] = unquote(value.strip('"'))
+        return cookies
+
     def get_all_cookies(self) -> Cookies:
         if self._cookies is None:
-            self._parse_cookies()
+            self._cookies = self._parse_cookies()
         return self._cookies
 
     def get_cookie(self, name: str) -> str:
-        if self._cookies is None:
-            self._parse_cookies()
-        return self._cookies[name]
+        return self.get_all_cookies()[name]
+
+    def stream(self) -> BodyReader:
+        """
+        The request body as it arrives: iterate it for chunks or read() it like a file.
+        It can only be consumed once; use body_file() to read the body more than once.
+        """
+        return self._body_reader()
+
+    def body_file(self) -> IO[bytes]:
+        """The whole request body, kept in memory up to spool_threshold bytes and spooled to a temp file beyond that"""
+        if self._body_file is None:
+            body_file = SpooledTemporaryFile(max_size=self.spool_threshold)
+            for chunk in self._body_reader():
+                body_file.write(chunk)
+            self._body_file = body_file  # type: ignore[assignment]
+        assert self._body_file is not None
+        self._body_file.seek(0)
+        return self._body_file
+
+    def form(self) -> MultipartForm:
+        """
+        Parses a multipart/form-data body as it streams in. Fields are kept in memory, uploaded files
+        are spooled to temp files (see MultipartForm.files) that are removed once the request is done.
+        """
+        if self._form is None:
+            content_type = self.handler.headers.get("Content-Type") or ""
+            boundary = boundary_from_content_type(content_type)
+            if boundary is None or not content_type.startswith("multipart/form-data"):
+                raise RequestBodyError(415, "Expected a multipart/form-data body")
+            if self._body_file is not None:
+                body_file = self.body_file()
+                chunks: Iterable[bytes] = iter(lambda: body_file.read(CHUNK_SIZE), b"")
+            else:
+                chunks = self._body_reader()
+            self._form = parse_multipart(chunks, boundary, spool_threshold=self.spool_threshold)
+        return self._form
+
+    def on_close(self, callback: Callable[[], None]):
+        """Calls callback once the request is done, whether or not its handlers and after-handler hooks completed"""
+        self._close_callbacks.append(callback)
+
+    def close(self):
+        # servers call it once the request is done, even if a handler or hook raised
+        self._close_files()
+        callbacks, self._close_callbacks = self._close_callbacks, []
+        for callback in callbacks:
+            callback()
+
+    def _close_files(self):
+        # removes the spooled body and any uploaded files
+        if self._body_file is not None:
+            self._body_file.close()
+        if self._form is not None:
+            self._form.close()
+
+    def drain(self, limit: int) -> bool:
+        # discards whatever the handlers left unread so the connection can be reused
+        self._close_files()
+        try:
+            return self._body_reader().drain(limit)
+        except RequestBodyError:
+            return False
+
+    def pattern(self) -> str:
+        # the route pattern the handler was registered with, e.g. "/users/:id"
+        return self._pattern
 
     def params(self) -> Params:
-        if self._params is None:
-            self._parse_params()
         return self._params
 
     def body(self) -> JsonBody:
         if self._json is None:
-            self._parse_body()
+            self._json = self._parse_body()
         return self._json
-        
+
     def query(self) -> QueryParsed:
         if self._query_parsed is None:
-            self._parse_query()
-        return self._query_parsed
\ No newline at end of file
+            self._query_parsed = self._parse_query()
+        return self._query_parsed
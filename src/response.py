@@ -1,16 +1,29 @@
-from http.server import BaseHTTPRequestHandler
+from email.utils import formatdate
 from mimetypes import guess_type
 from json import dumps
+from os import fstat
 from typing import Any, Dict, Tuple, Union
 
+from .exchange import Exchange
+from .file_body import UNSATISFIABLE, FileBody, file_etag, parse_range
+from .sse import Events, event_stream
+from .streaming import StreamBody
 from .types import Headers
 
 class Response:
-    def __init__(self, handler: BaseHTTPRequestHandler):
+    # reused per connection through reset(), like Request
+    __slots__ = ("handler", "_status", "_headers", "_body", "_file", "_stream", "_sent")
+
+    def __init__(self, handler: Exchange):
+        self.reset(handler)
+
+    def reset(self, handler: Exchange):
         self.handler = handler
         self._status: int = 200
         self._headers = Headers()
         self._body: bytes = b''
+        self._file: Union[FileBody, None] = None
+        self._stream: Union[StreamBody, None] = None
         self._sent: bool = False
 
     def hasBeenSent(self) -> bool:
@@ -34,19 +47,100 @@ class Response:
     def send_raw(self, body: bytes):
         self._send(body)
 
+    def send_stream(self, chunks: StreamBody):
+        """
+        Sends the body as it is produced by an iterable or async iterable of bytes, using chunked
+        transfer encoding. Nothing is buffered: each chunk is written as soon as it is yielded.
+        """
+        if self._sent:
+            raise Exception("Cannot call send more than once!")
+        self._stream = chunks
+        self._sent = True
+
+    def send_events(self, events: Events, heartbeat: Union[float, None]=15.0):
+        # Server-Sent Events; see sse.event_stream
+        self.header("Content-Type", "text/event-stream; charset=utf-8")
+        self.header("Cache-Control", "no-cache")
+        # stops nginx from buffering the stream
+        self.header("X-Accel-Buffering", "no")
+        self.send_stream(event_stream(events, heartbeat))
+
+    def _requested_range(self, etag: str, last_modified: str, size: int) -> Union[Tuple[int, int], None]:
+        if self.handler.command != "GET":
+            return None
+        range_header = self.handler.headers.get("Range")
+        if range_header is None:
+            return None
+        if_range = self.handler.headers.get("If-Range")
+        if if_range is not None and if_range.strip() not in (etag, last_modified):
+            return None
+        return parse_range(range_header, size)
+
     def send_file(self, file_path: str, encoding: str="utf_8"):
-        data = ''
-        with open(file_path, "r") as f:
-            data = f.read()
-        encoded = data.encode(encoding=encoding)
-        length = len(encoded)
+        # files are sent byte-for-byte; encoding is only kept for compatibility
+        if self._sent:
+            raise Exception("Cannot call send more than once!")
+        f = open(file_path, "rb")
+        try:
+            stat = fstat(f.fileno())
+            size = stat.st_size
+            etag = file_etag(stat)
+            last_modified = formatdate(stat.st_mtime, usegmt=True)
+            content_type, content_encoding = guess_type(file_path)
+            if content_type is not None:
+                self.header("Content-Type", content_type)
+            if content_encoding is not None:
+                self.header("Content-Encoding", content_encoding)
+            self.header("Accept-Ranges", "bytes")
+            self.header("ETag", etag)
+            self.header("Last-Modified", last_modified)
+            byte_range = self._requested_range(etag, last_modified, size)
+        except BaseException:
+            f.close()
+            raise
+        if byte_range == UNSATISFIABLE:
+            f.close()
+            self.status(416)
+            self.header("Content-Range", f"bytes */{size}")
+            self._send(b'')
+            return
+        offset, length = 0, size
+        if byte_range is not None:
+            start, end = byte_range
+            offset, length = start, end - start + 1
+            self.status(206)
+            self.header("Content-Range", f"bytes {start}-{end}/{size}")
+        self._send(b'')
         self.header("Content-Length", str(length))
-        content_type, content_encoding = guess_type(file_path)
-        if content_type is not None:
-            self.header("Content-Type", content_type)
-        if content_encoding is not None:
-            self.header("Content-Encoding", content_encoding)
-        self._send(encoded)
+        self._file = FileBody(f, offset, length)
+
+    def set_body(self, body: bytes):
+        # replaces the body of a sent response, e.g. once it has been compressed
+        if not self._sent:
+            raise Exception("Response has not been sent yet")
+        self._body = body
+        self.header("Content-Length", str(len(body)))
+
+    def get_header(self, name: str) -> Union[str, None]:
+        lowered = name.lower()
+        for header_name, header_value in self._headers.items():
+            if header_name.lower() == lowered:
+                return header_value
+        return None
+
+    def set_stream(self, chunks: StreamBody):
+        # replaces the body of a streamed response, e.g. with a compressed stream
+        if self._stream is None:
+            raise Exception("Response is not streamed")
+        self._stream = chunks
+
+    def get_stream(self) -> Union[StreamBody, None]:
+        # set by send_stream; the body from get_response is then empty
+        return self._stream
+
+    def get_file(self) -> Union[FileBody, None]:
+        # set when the body is streamed from disk by send_file; the body from get_response is then empty
+        return self._file
     
     def download(self, filename: Union[str,None] = None):
         self.header("Content-Disposition", f"attachment{f'; filename=\"{filename}\"' if filename is not None else ''}")
@@ -0,0 +1,305 @@
+from asyncio import AbstractEventLoop, Future, get_running_loop, wait_for, TimeoutError as AsyncTimeoutError
+from collections import OrderedDict
+from threading import Event, Lock
+from time import monotonic
+from typing import Dict, Iterable, List, Tuple, Union
+from urllib.parse import parse_qsl, urlencode
+
+from .handler import RequestHandler
+from .request import Request
+from .response import Response
+from .types import Headers
+
+"""
+Response cache. The cache is a middleware that answers hits, and its store method is an after-handler
+hook that saves what the handler produced:
+    cache = ResponseCache(ttl=5.0, vary=("Accept-Encoding",))
+    server.use("/api/*", cache)
+    server.after(cache.store)
+Register store after Compression so that compressed variants are cached and not compressed again.
+On AsyncPyserve use AsyncResponseCache, whose coalesced requests wait on the event loop.
+"""
+
+CacheKey = Tuple[str, str, str, Tuple[str, ...]]
+
+CACHEABLE_STATUSES = frozenset((200, 203, 204, 300, 301, 308, 404, 410))
+
+# never replayed from the cache; the server sets them per response
+_SKIPPED_HEADERS = frozenset(("content-length", "connection", "date", "transfer-encoding", "keep-alive"))
+
+
+def normalize_query(query: Union[str, None]) -> str:
+    if not query:
+        return ""
+    return urlencode(sorted(parse_qsl(query, keep_blank_values=True)))
+
+
+def cache_control(value: Union[str, None]) -> Dict[str, Union[str, None]]:
+    directives: Dict[str, Union[str, None]] = {}
+    if not value:
+        return directives
+    for part in value.split(","):
+        name, sep, argument = part.strip().partition("=")
+        if name:
+            directives[name.lower()] = argument.strip('"') if sep else None
+    return directives
+
+
+class CachedResponse:
+    __slots__ = ("status", "headers", "body", "stored_at", "expires_at", "size")
+
+    def __init__(self, status: int, headers: List[Tuple[str, str]], body: bytes, stored_at: float, expires_at: float):
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.stored_at = stored_at
+        self.expires_at = expires_at
+        self.size = len(body) + sum(len(name) + len(value) for name, value in headers)
+
+
+def _wake(future: "Future[None]"):
+    if not future.done():
+        future.set_result(None)
+
+
+class _Flight:
+    # one handler run in progress for a key; concurrent misses wait on it instead of running the handler too
+    __slots__ = ("done", "started_at", "_lock", "_waiters")
+
+    def __init__(self):
+        self.done = Event()
+        self.started_at = monotonic()
+        self._lock = Lock()
+        # futures of AsyncResponseCache requests waiting on an event loop
+        self._waiters: List[Tuple[AbstractEventLoop, "Future[None]"]] = []
+
+    def release(self):
+        with self._lock:
+            self.done.set()
+            waiters, self._waiters = self._waiters, []
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(_wake, future)
+
+    async def wait_async(self, timeout: float):
+        loop = get_running_loop()
+        future: "Future[None]" = loop.create_future()
+        with self._lock:
+            if self.done.is_set():
+                return
+            self._waiters.append((loop, future))
+        try:
+            await wait_for(future, timeout)
+        except AsyncTimeoutError:
+            pass
+
+
+class _Pending:
+    __slots__ = ("request", "key", "ttl", "flight")
+
+    def __init__(self, request: Request, key: CacheKey, ttl: float, flight: Union[_Flight, None]):
+        self.request = request
+        self.key = key
+        self.ttl = ttl
+        self.flight = flight
+
+
+class ResponseCache(RequestHandler):
+    def __init__(self, ttl: float=5.0, route_ttls: Union[Dict[str, float], None]=None, vary: Iterable[str]=(), max_bytes: int=32 * 1024 * 1024, max_entry_size: int=1024 * 1024, methods: Iterable[str]=("GET", "HEAD"), flight_timeout: float=10.0):
+        self.ttl = ttl
+        # keyed by the route pattern the handler was registered with, e.g. "/users/:id"
+        self.route_ttls: Dict[str, float] = dict(route_ttls or {})
+        self.vary = tuple(header.lower() for header in vary)
+        self.max_bytes = max_bytes
+        self.max_entry_size = max_entry_size
+        self.methods = frozenset(method.upper() for method in methods)
+        self.flight_timeout = flight_timeout
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.stores = 0
+        self._entries: "OrderedDict[CacheKey, CachedResponse]" = OrderedDict()
+        self._flights: Dict[CacheKey, _Flight] = {}
+        # misses whose response hasn't been stored yet, by id() of their request
+        self._pending: Dict[int, _Pending] = {}
+        self._lock = Lock()
+
+    def set_ttl(self, pattern: str, ttl: float):
+        self.route_ttls[pattern] = ttl
+
+    def key_for(self, request: Request) -> CacheKey:
+        varying = tuple(request.header(name) or "" for name in self.vary)
+        return request.method, request.path, normalize_query(request.handler.path.partition("?")[2]), varying
+
+    def _lookup(self, key: CacheKey, now: float) -> Union[CachedResponse, None]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at <= now:
+            del self._entries[key]
+            self.size -= entry.size
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _replay(self, entry: CachedResponse, response: Response, now: float):
+        response.status(entry.status)
+        for name, value in entry.headers:
+            response.header(name, value)
+        response.header("Age", str(int(now - entry.stored_at)))
+        response.send_raw(entry.body)
+
+    def _release(self, pending: _Pending):
+        if pending.flight is not None:
+            if self._flights.get(pending.key) is pending.flight:
+                del self._flights[pending.key]
+            pending.flight.release()
+
+    def _abandon(self, pending: _Pending):
+        # on_close callback of a miss: if the after-handler hooks never ran store (e.g. a handler failed),
+        # the requests waiting for it run their handlers instead of waiting for flight_timeout
+        with self._lock:
+            if self._pending.get(id(pending.request)) is pending:
+                del self._pending[id(pending.request)]
+                self._release(pending)
+
+    def _key(self, request: Request) -> Union[Tuple[CacheKey, float, bool], None]:
+        # the key, ttl and whether to skip the lookup; None if the request bypasses the cache
+        if request.method not in self.methods:
+            return None
+        if request.header("Authorization") is not None:
+            return None
+        directives = cache_control(request.header("Cache-Control"))
+        if "no-store" in directives:
+            return None
+        if id(request) in self._pending:
+            # already a miss of this cache, e.g. registered on two matching patterns
+            return None
+        revalidate = "no-cache" in directives or directives.get("max-age") == "0"
+        return self.key_for(request), self.route_ttls.get(request.pattern(), self.ttl), revalidate
+
+    def _begin(self, request: Request, key: CacheKey, ttl: float, revalidate: bool, waited: bool, now: float) -> Union[CachedResponse, _Flight, None]:
+        # a hit, a flight to wait for, or None once the request is registered as a miss
+        with self._lock:
+            entry = None if revalidate else self._lookup(key, now)
+            if entry is not None:
+                self.hits += 1
+                return entry
+            flight = self._flights.get(key)
+            stale = flight is not None and now - flight.started_at > self.flight_timeout
+            if flight is None or stale or revalidate or waited:
+                # a request that already waited once runs the handler itself, so that responses
+                # which turn out not to be cacheable don't serialize every request for the key
+                self.misses += 1
+                leader = None
+                if not revalidate and (flight is None or stale):
+                    leader = _Flight()
+                    self._flights[key] = leader
+                pending = self._pending[id(request)] = _Pending(request, key, ttl, leader)
+                request.on_close(lambda: self._abandon(pending))
+                return None
+            self.coalesced += 1
+            return flight
+
+    def __call__(self, request: Request, response: Response):
+        lookup = self._key(request)
+        if lookup is None:
+            return
+        waited = False
+        while True:
+            now = monotonic()
+            result = self._begin(request, *lookup, waited, now)
+            if not isinstance(result, _Flight):
+                break
+            result.done.wait(self.flight_timeout)
+            waited = True
+        if result is not None:
+            self._replay(result, response, now)
+
+    def _ttl_for(self, response: Response, ttl: float) -> Union[float, None]:
+        directives = cache_control(response.get_header("Cache-Control"))
+        if "no-store" in directives or "private" in directives or "no-cache" in directives:
+            return None
+        max_age = directives.get("s-maxage") or directives.get("max-age")
+        if max_age is not None:
+            try:
+                return float(max_age)
+            except ValueError:
+                return None
+        return ttl
+
+    def _cacheable(self, response: Response) -> bool:
+        if response.get_stream() is not None or response.get_file() is not None:
+            return False
+        if response.get_header("Set-Cookie") is not None:
+            return False
+        vary = response.get_header("Vary")
+        if vary is not None:
+            # the key only covers the configured vary headers
+            for name in vary.split(","):
+                name = name.strip().lower()
+                if name == "*" or (name and name not in self.vary):
+                    return False
+        return True
+
+    def store(self, request: Request, response: Response):
+        """After-handler hook: caches the finished response of a miss and wakes up requests waiting for it"""
+        with self._lock:
+            pending = self._pending.get(id(request))
+            if pending is None or pending.request is not request:
+                return
+            del self._pending[id(request)]
+        entry = None
+        if response.hasBeenSent():
+            status, headers, body = response.get_response()
+            ttl = self._ttl_for(response, pending.ttl)
+            if status in CACHEABLE_STATUSES and ttl is not None and ttl > 0 and len(body) <= self.max_entry_size and self._cacheable(response):
+                now = monotonic()
+                entry = CachedResponse(status, self._stored_headers(headers), body, now, now + ttl)
+        with self._lock:
+            if entry is not None:
+                previous = self._entries.pop(pending.key, None)
+                if previous is not None:
+                    self.size -= previous.size
+                self._entries[pending.key] = entry
+                self.size += entry.size
+                self.stores += 1
+                while self.size > self.max_bytes:
+                    _, evicted = self._entries.popitem(last=False)
+                    self.size -= evicted.size
+            self._release(pending)
+
+    def _stored_headers(self, headers: Headers) -> List[Tuple[str, str]]:
+        return [(name, value) for name, value in headers.items() if name.lower() not in _SKIPPED_HEADERS]
+
+    def invalidate(self, path: Union[str, None]=None):
+        """Drops every cached response for path, or the whole cache when path is None"""
+        with self._lock:
+            for key in [key for key in self._entries if path is None or key[1] == path]:
+                self.size -= self._entries.pop(key).size
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"entries": len(self._entries), "size": self.size, "max_bytes": self.max_bytes, "hits": self.hits, "misses": self.misses, "coalesced": self.coalesced, "stores": self.stores}
+
+
+class AsyncResponseCache(ResponseCache):
+    """
+    ResponseCache for AsyncPyserve. Lookups run on the event loop, and concurrent misses await the first
+    one's store instead of blocking a thread of the handler pool, which the store hook itself runs on.
+    """
+
+    async def __call__(self, request: Request, response: Response):  # type: ignore[override]
+        lookup = self._key(request)
+        if lookup is None:
+            return
+        waited = False
+        while True:
+            now = monotonic()
+            result = self._begin(request, *lookup, waited, now)
+            if not isinstance(result, _Flight):
+                break
+            await result.wait_async(self.flight_timeout)
+            waited = True
+        if result is not None:
+            self._replay(result, response, now)
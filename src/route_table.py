@@ -0,0 +1,215 @@
+from typing import Any, Dict, Generic, Iterable, List, Tuple, TypeVar, Union
+from urllib.parse import unquote
+import re
+
+from .path_to_regexp import Key, default_pattern, parse, string_to_regexp
+from .types import Params
+
+"""
+Route index used for dispatch. Static path segments are stored in a segment trie so that a lookup
+costs O(path segments) no matter how many routes are registered. Segments containing parameters
+fall back to per-node regexes compiled by path_to_regexp:
+  - a segment made only of plain named parameters (e.g. ":id", ":name.:ext") is matched against a
+    single path segment and descends further into the trie
+  - anything that may span segments (modifiers, custom patterns, groups, "*") is compiled over the
+    remainder of the pattern and matched against the remainder of the path at that node
+"""
+
+T = TypeVar("T")
+
+_SPECIAL_CHARS = frozenset(":()*+?{}\\")
+_PARAM_PATTERN = default_pattern()
+
+
+def _split(path: str) -> List[str]:
+    # leading and (non-strict) trailing delimiters are not significant
+    if path.endswith("/") and len(path) > 1:
+        path = path[:-1]
+    path = path[1:] if path.startswith("/") else path
+    return path.split("/") if path else []
+
+
+def _is_static(segment: str) -> bool:
+    return not any(c in _SPECIAL_CHARS for c in segment)
+
+
+class RouteMatch(Generic[T]):
+    __slots__ = ("pattern", "value", "params", "order")
+
+    def __init__(self, pattern: str, value: T, params: Params, order: int):
+        self.pattern = pattern
+        self.value = value
+        self.params = params
+        self.order = order
+
+
+class _Entry:
+    __slots__ = ("pattern", "order")
+
+    def __init__(self, pattern: str, order: int):
+        self.pattern = pattern
+        self.order = order
+
+
+class _SegmentMatcher:
+    __slots__ = ("regexp", "keys", "node")
+
+    def __init__(self, segment: str):
+        self.keys: List[Key] = []
+        self.regexp = string_to_regexp(segment, self.keys, sensitive=True, strict=True, prefixes="")
+        self.node = _Node()
+
+
+class _TailMatcher:
+    __slots__ = ("regexp", "keys", "entry")
+
+    def __init__(self, remainder: str, entry: _Entry):
+        self.keys: List[Key] = []
+        self.regexp = string_to_regexp(remainder, self.keys, sensitive=True)
+        self.entry = entry
+
+
+class _Node:
+    __slots__ = ("static", "segments", "tails", "entry")
+
+    def __init__(self):
+        self.static: Dict[str, _Node] = {}
+        self.segments: Dict[str, _SegmentMatcher] = {}
+        self.tails: List[_TailMatcher] = []
+        self.entry: Union[_Entry, None] = None
+
+
+def _is_simple_param_segment(segment: str) -> bool:
+    for token in parse(segment, prefixes=""):
+        if isinstance(token, str):
+            continue
+        if not isinstance(token["name"], str) or token["modifier"] or token["pattern"] != _PARAM_PATTERN:
+            return False
+    return True
+
+
+def _extract(keys: List[Key], match: "re.Match[str]", params: Params):
+    # paths are matched as requested and their parameters percent-decoded, as url_for encodes them
+    for key, value in zip(keys, match.groups()):
+        if value is not None:
+            params[str(key["name"])] = unquote(value)
+
+
+class RouteTable(Dict[str, T]):
+    """
+    Dict of pattern -> value which keeps a compiled route index in sync with its contents.
+    match() returns the most specific route (static > parameter > remainder pattern);
+    match_all() returns every matching route in registration order.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._root = _Node()
+        self._entries: Dict[str, _Entry] = {}
+        self._next_order = 0
+
+    def __setitem__(self, pattern: str, value: T):
+        if pattern not in self._entries:
+            self._insert(pattern)
+        super().__setitem__(pattern, value)
+
+    def __delitem__(self, pattern: str):
+        super().__delitem__(pattern)
+        self._rebuild()
+
+    def pop(self, pattern: str, *default: Any) -> Any:
+        value = super().pop(pattern, *default)
+        self._rebuild()
+        return value
+
+    def clear(self):
+        super().clear()
+        self._rebuild()
+
+    def update(self, *args: Any, **kwargs: Any):
+        for pattern, value in dict(*args, **kwargs).items():
+            self[pattern] = value
+
+    def setdefault(self, pattern: str, default: Any = None) -> Any:
+        if pattern not in self:
+            self[pattern] = default
+        return self[pattern]
+
+    def _rebuild(self):
+        self._root = _Node()
+        self._entries = {}
+        self._next_order = 0
+        for pattern in self.keys():
+            self._insert(pattern)
+
+    def _insert(self, pattern: str):
+        entry = _Entry(pattern, self._next_order)
+        self._next_order += 1
+        self._entries[pattern] = entry
+        segments = ["(.*)" if segment == "*" else segment for segment in _split(pattern)]
+        node = self._root
+        for i, segment in enumerate(segments):
+            if _is_static(segment):
+                child = node.static.get(segment)
+                if child is None:
+                    child = node.static[segment] = _Node()
+                node = child
+            elif _is_simple_param_segment(segment):
+                matcher = node.segments.get(segment)
+                if matcher is None:
+                    matcher = node.segments[segment] = _SegmentMatcher(segment)
+                node = matcher.node
+            else:
+                # remainders start with "/", which a pattern without a leading "/" (e.g. "*") matches itself
+                prefix = "/" if i or pattern.startswith("/") else ""
+                node.tails.append(_TailMatcher(prefix + "/".join(segments[i:]), entry))
+                return
+        node.entry = entry
+
+    def _collect(self, node: _Node, segments: List[str], end: str, i: int, params: Params, first: bool, out: List[Tuple[_Entry, Params]]) -> bool:
+        if i == len(segments):
+            if node.entry is not None:
+                out.append((node.entry, params))
+                if first:
+                    return True
+        else:
+            child = node.static.get(segments[i])
+            if child is not None and self._collect(child, segments, end, i + 1, params, first, out):
+                return True
+            for matcher in node.segments.values():
+                m = matcher.regexp.match(segments[i])
+                if m is None:
+                    continue
+                child_params = Params(params)
+                _extract(matcher.keys, m, child_params)
+                if self._collect(matcher.node, segments, end, i + 1, child_params, first, out):
+                    return True
+        if node.tails:
+            # the rest of the path as it was requested, including its trailing delimiter
+            remainder = ("/" + "/".join(segments[i:]) if i < len(segments) else "") + end
+            for tail in node.tails:
+                m = tail.regexp.match(remainder)
+                if m is None:
+                    continue
+                tail_params = Params(params)
+                _extract(tail.keys, m, tail_params)
+                out.append((tail.entry, tail_params))
+                if first:
+                    return True
+        return False
+
+    def _result(self, found: Iterable[Tuple[_Entry, Params]]) -> List[RouteMatch[T]]:
+        return [RouteMatch(entry.pattern, self[entry.pattern], params, entry.order) for entry, params in found]
+
+    def match(self, path: str) -> Union[RouteMatch[T], None]:
+        found: List[Tuple[_Entry, Params]] = []
+        self._collect(self._root, _split(path), "/" if path.endswith("/") else "", 0, Params(), True, found)
+        if not found:
+            return None
+        return self._result(found)[0]
+
+    def match_all(self, path: str) -> List[RouteMatch[T]]:
+        found: List[Tuple[_Entry, Params]] = []
+        self._collect(self._root, _split(path), "/" if path.endswith("/") else "", 0, Params(), False, found)
+        found.sort(key=lambda item: item[0].order)
+        return self._result(found)
@@ -1,31 +1,227 @@
-from .handler import PatternMiddlewares, RequestHandler, RequestHandlers
+from typing import Any, Callable, Dict, Iterator, List, Mapping, Tuple, Union
+from urllib.parse import quote
+
+from .admission import AdmissionControl
+from .dispatch_cache import Dispatch, DispatchCache
+from .handler import AnyRequestHandler, HttpMethod, PatternMiddlewares, RequestHandler, RequestHandlers
+from .metrics import Metrics, MetricsEndpoint
+from .path_to_regexp import EncodeFunction, Token, compile, default_pattern
+from .profiling import ProfileEndpoint, Profiler
+from .types import Params
+
+UrlBuilder = Callable[[Union[Mapping[str, Any], None]], str]
+
+_SEGMENT_PATTERN = default_pattern()
+
+
+class _QuoteParam(EncodeFunction):
+    def __call__(self, string: str, token: Union[Token, None]=None) -> str:
+        # a parameter matching one segment can't contain "/", wider ones (e.g. "*") keep theirs
+        wide = token is not None and not isinstance(token, str) and token["pattern"] != _SEGMENT_PATTERN
+        return quote(string, safe="/" if wide else "")
+
+
+_quote_param = _QuoteParam()
+
+
+def url_builder(pattern: str) -> UrlBuilder:
+    # "*" segments are routed as "(.*)", an unnamed parameter whose name is "0"
+    return compile("/".join("(.*)" if segment == "*" else segment for segment in pattern.split("/")), sensitive=True, encode=_quote_param)
 
 
 class Router:
-    def __init__(self):
+    def __init__(self, dispatch_cache_size: int=1024):
         self.pattern_middlewares = PatternMiddlewares()
         self.request_handlers = RequestHandlers()
+        self.after_handlers: List[RequestHandler] = []
+        self.dispatch_cache = DispatchCache(dispatch_cache_size)
+        self.metrics: Union[Metrics, None] = None
+        self.profiler: Union[Profiler, None] = None
+        self.url_builders: Dict[str, UrlBuilder] = {}
+        # checked for every routed request before its middlewares run
+        self.admission: Union[AdmissionControl, None] = None
+        # prefix -> router mounted there, and the routers this one is mounted in
+        self.mounts: Dict[str, Router] = {}
+        self._parents: List[Router] = []
+
+    def _routes_changed(self):
+        # called after every registration so that nothing derived from the routes goes stale
+        self.dispatch_cache.clear()
+        for parent in self._parents:
+            parent._routes_changed()
+
+    def _check_handler(self, handler: AnyRequestHandler):
+        # called before every registration; servers refuse handlers they can't run, here or in a mounted router
+        for parent in self._parents:
+            parent._check_handler(handler)
+
+    def _all_handlers(self) -> Iterator[AnyRequestHandler]:
+        for middlewares in self.pattern_middlewares.values():
+            yield from middlewares
+        for method in ("get", "head", "put", "post", "patch", "delete"):
+            yield from self.request_handlers[method].values()
+        for router in self.mounts.values():
+            yield from router._all_handlers()
 
-    def use(self, pattern: str, middleware: RequestHandler):
+    def _get_middlewares(self, path: str) -> List[AnyRequestHandler]: 
+        middlewares: List[AnyRequestHandler] = []
+        for match in self.pattern_middlewares.match_all(path):
+            middlewares.extend(match.value)
+        return middlewares
+    
+    def _get_handler(self, path: str, method: HttpMethod) -> Union[None, Tuple[AnyRequestHandler, str, Params]]:
+        match = self.request_handlers[method].match(path)
+        if match is None:
+            return None
+        return match.value, match.pattern, match.params
+
+    def _get_mount(self, path: str) -> Union[None, Tuple[str, "Router", str]]:
+        # the longest mounted prefix that ends at a segment boundary of path, its router and the rest of path
+        if not self.mounts:
+            return None
+        end = len(path)
+        while end > 0:
+            router = self.mounts.get(path[:end])
+            if router is not None:
+                return path[:end], router, path[end:] or "/"
+            end = path.rfind("/", 0, end)
+        return None
+
+    def _resolve(self, path: str, method: HttpMethod) -> Union[None, Dispatch]:
+        key = (method, path)
+        cached, dispatch = self.dispatch_cache.get(key)
+        if cached:
+            return dispatch
+        dispatch = self._lookup(path, method)
+        self.dispatch_cache.put(key, dispatch)
+        return dispatch
+
+    def _lookup(self, path: str, method: HttpMethod) -> Union[None, Dispatch]:
+        # this router's middlewares for path, then the mounted router's chain for the rest of path, if any
+        middlewares = self._get_middlewares(path)
+        mounted: Union[Dispatch, None] = None
+        mount = self._get_mount(path)
+        if mount is not None:
+            prefix, router, rest = mount
+            mounted = router._lookup(rest, method)
+            if mounted is not None and mounted.pattern:
+                pattern = prefix if mounted.pattern == "/" else prefix + mounted.pattern
+                return Dispatch([*middlewares, *mounted.chain], pattern, mounted.params)
+        handlerPattern = self._get_handler(path, method)
+        if handlerPattern is not None:
+            handler, pattern, params = handlerPattern
+            return Dispatch([*middlewares, handler], pattern, params)
+        if mounted is not None:
+            middlewares.extend(mounted.chain)
+        # middlewares may answer paths that have no handler (e.g. static files)
+        if middlewares:
+            return Dispatch(middlewares, "", Params())
+        return None
+
+    def use(self, pattern: str, middleware: AnyRequestHandler):
+        self._check_handler(middleware)
         if pattern in self.pattern_middlewares.keys():
             self.pattern_middlewares[pattern] = [*self.pattern_middlewares[pattern], middleware]
         else:
             self.pattern_middlewares[pattern] = [middleware]
+        self._routes_changed()
     
-    def get(self, pattern: str, handler: RequestHandler):
+    def mount(self, prefix: str, router: "Router"):
+        """
+        Serves router's routes under prefix. Requests under prefix run this router's matching middlewares,
+        then the mounted router's ones for the path without prefix, then its handler. Handlers still see
+        the full path in the request, and request.pattern() includes prefix. Only routes and middlewares
+        are mounted: the mounted router's after_handlers, admission and metrics are ignored.
+        """
+        prefix = "/" + prefix.strip("/")
+        if prefix == "/":
+            raise ValueError("a router can't be mounted at /; register its routes directly")
+        # this router and every router it is mounted in, directly or not
+        mounted_in: List[Router] = [self]
+        while mounted_in:
+            ancestor = mounted_in.pop()
+            if ancestor is router:
+                raise ValueError("a router can't be mounted in itself or in a router mounted in it")
+            mounted_in.extend(ancestor._parents)
+        for handler in router._all_handlers():
+            self._check_handler(handler)
+        self.mounts[prefix] = router
+        router._parents.append(self)
+        self._routes_changed()
+
+    def after(self, hook: RequestHandler):
+        # hooks run after the middleware/handler chain, on every response, before it is written
+        self.after_handlers.append(hook)
+
+    def enable_metrics(self, path: Union[str, None]="/metrics", metrics: Union[Metrics, None]=None) -> Metrics:
+        """Starts recording per-route metrics, served in the Prometheus text format on path unless it is None"""
+        self.metrics = metrics if metrics is not None else Metrics()
+        if path is not None:
+            self.get(path, MetricsEndpoint(self.metrics))
+        return self.metrics
+
+    def enable_profiling(self, profiler: Union[Profiler, None]=None, path: Union[str, None]="/debug/profile") -> Profiler:
+        """Profiles the requests that profiler picks; results are listed and downloaded from path unless it is None"""
+        self.profiler = profiler if profiler is not None else Profiler()
+        if path is not None:
+            self.get(path, ProfileEndpoint(self.profiler))
+        return self.profiler
+
+    def _name_route(self, pattern: str, name: Union[str, None]):
+        if name is not None:
+            self.url_builders[name] = url_builder(pattern)
+
+    def _find_url_builder(self, route_name: str) -> Union[None, Tuple[str, UrlBuilder]]:
+        builder = self.url_builders.get(route_name)
+        if builder is not None:
+            return "", builder
+        for prefix, router in self.mounts.items():
+            found = router._find_url_builder(route_name)
+            if found is not None:
+                return prefix + found[0], found[1]
+        return None
+
+    def url_for(self, route_name: str, **params: Any) -> str:
+        """The path of the route registered as route_name, here or in a mounted router, with params filled in and percent-encoded"""
+        found = self._find_url_builder(route_name)
+        if found is None:
+            raise KeyError(f"no route named {route_name}")
+        prefix, builder = found
+        path = builder(params)
+        return prefix if prefix and path == "/" else prefix + path
+
+    def get(self, pattern: str, handler: AnyRequestHandler, name: Union[str, None]=None):
+        self._check_handler(handler)
         self.request_handlers.get[pattern] = handler
+        self._name_route(pattern, name)
+        self._routes_changed()
 
-    def head(self, pattern: str, handler: RequestHandler):
+    def head(self, pattern: str, handler: AnyRequestHandler, name: Union[str, None]=None):
+        self._check_handler(handler)
         self.request_handlers.head[pattern] = handler
+        self._name_route(pattern, name)
+        self._routes_changed()
 
-    def put(self, pattern: str, handler: RequestHandler):
+    def put(self, pattern: str, handler: AnyRequestHandler, name: Union[str, None]=None):
+        self._check_handler(handler)
         self.request_handlers.put[pattern] = handler
+        self._name_route(pattern, name)
+        self._routes_changed()
 
-    def post(self, pattern: str, handler: RequestHandler):
+    def post(self, pattern: str, handler: AnyRequestHandler, name: Union[str, None]=None):
+        self._check_handler(handler)
         self.request_handlers.post[pattern] = handler
+        self._name_route(pattern, name)
+        self._routes_changed()
 
-    def patch(self, pattern: str, handler: RequestHandler):
+    def patch(self, pattern: str, handler: AnyRequestHandler, name: Union[str, None]=None):
+        self._check_handler(handler)
         self.request_handlers.patch[pattern] = handler
+        self._name_route(pattern, name)
+        self._routes_changed()
 
-    def delete(self, pattern: str, handler: RequestHandler):
+    def delete(self, pattern: str, handler: AnyRequestHandler, name: Union[str, None]=None):
+        self._check_handler(handler)
         self.request_handlers.delete[pattern] = handler
+        self._name_route(pattern, name)
+        self._routes_changed()
@@ -0,0 +1,87 @@
+from email.utils import formatdate
+from http import HTTPStatus
+from socket import socket
+from time import time
+from typing import Dict, List, Tuple
+
+from .types import Headers
+
+"""
+Response head serialization shared by both servers. Status lines and repeated header lines are
+encoded once and reused, the Date header is formatted at most once per second, and the head is sent
+together with the body in a single sendmsg call.
+"""
+
+SERVER_HEADER = b"Server: pyserve\r\n"
+CONNECTION_CLOSE = b"Connection: close\r\n"
+CONNECTION_KEEP_ALIVE = b"Connection: keep-alive\r\n"
+TRANSFER_ENCODING_CHUNKED = b"Transfer-Encoding: chunked\r\n"
+
+STATUS_LINES: Dict[int, bytes] = {status.value: f"HTTP/1.1 {status.value} {status.phrase}\r\n".encode("latin-1") for status in HTTPStatus}
+
+# header lines whose values differ from response to response aren't worth caching
+_VOLATILE_HEADERS = frozenset(("content-length", "date", "etag", "last-modified", "age", "expires", "set-cookie", "content-range", "location", "content-disposition"))
+_MAX_CACHED_HEADERS = 1024
+_header_lines: Dict[Tuple[str, str], bytes] = {}
+
+_date: Tuple[int, bytes] = (0, b"")
+
+
+def status_line(status: int) -> bytes:
+    line = STATUS_LINES.get(status)
+    if line is None:
+        line = f"HTTP/1.1 {status} \r\n".encode("latin-1")
+    return line
+
+
+def date_header() -> bytes:
+    global _date
+    now = int(time())
+    cached = _date
+    if cached[0] != now:
+        cached = (now, f"Date: {formatdate(now, usegmt=True)}\r\n".encode("latin-1"))
+        _date = cached
+    return cached[1]
+
+
+def header_line(name: str, value: str) -> bytes:
+    key = (name, value)
+    line = _header_lines.get(key)
+    if line is not None:
+        return line
+    line = f"{name}: {value}\r\n".encode("latin-1")
+    if len(_header_lines) < _MAX_CACHED_HEADERS and name.lower() not in _VOLATILE_HEADERS:
+        _header_lines[key] = line
+    return line
+
+
+def serialize_head(status: int, headers: Headers, close: bool, keep_alive: bool=False, chunked: bool=False) -> bytes:
+    """The status line and headers of a response, ending with the blank line"""
+    parts = [status_line(status), SERVER_HEADER, date_header()]
+    for name, value in headers.items():
+        parts.append(header_line(name, value))
+    if chunked:
+        parts.append(TRANSFER_ENCODING_CHUNKED)
+    if close:
+        parts.append(CONNECTION_CLOSE)
+    elif keep_alive:
+        parts.append(CONNECTION_KEEP_ALIVE)
+    parts.append(b"\r\n")
+    return b"".join(parts)
+
+
+def send_buffers(sock: socket, buffers: List[bytes]):
+    """Writes all buffers with one sendmsg (writev) when the whole response fits in the socket buffer"""
+    buffers = [buffer for buffer in buffers if buffer]
+    try:
+        sent = sock.sendmsg(buffers)
+    except (AttributeError, NotImplementedError):
+        # e.g. TLS sockets
+        sock.sendall(b"".join(buffers))
+        return
+    for buffer in buffers:
+        if sent >= len(buffer):
+            sent -= len(buffer)
+            continue
+        sock.sendall(memoryview(buffer)[sent:])
+        sent = 0
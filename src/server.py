@@ -1,79 +1,331 @@
 
+from http import HTTPStatus
 from http.server import HTTPServer, BaseHTTPRequestHandler
-from typing import List, Tuple, Type, Union
+from io import BufferedReader, BytesIO
+from socketserver import ThreadingMixIn
+from time import perf_counter
+from traceback import format_exc
+from typing import Any, Dict, Iterable, List, Type, Union
 
 from .router import Router
-from .handler import HttpMethod, RequestHandler, PatternMiddlewares, RequestHandlers
+from .body import RequestBodyError
+from .deadline import BODY_REJECTIONS, DeadlineSocketIO, RejectionCounters
+from .dispatch_cache import Dispatch
+from .handler import AnyRequestHandler, HttpMethod, is_coroutine_handler, run_after_handlers, run_handlers
 from .request import Request
-from .response import Response;
-
-
+from .response import Response
+from .serialize import send_buffers, serialize_head
+from .streaming import LAST_CHUNK, StreamBody, close_stream, frame_chunk, iterate_sync
+from .types import Params
+from .workers import Supervisor
+from .wsgi import WsgiStartResponse, serve_wsgi
 
 
 class Pyserve(Router):
-    def __init__(self, host: str, port: int, server_class: Type[HTTPServer]=HTTPServer):
+    def __init__(self, host: str, port: int, server_class: Type[HTTPServer]=HTTPServer, dispatch_cache_size: int=1024, keep_alive: Union[bool, None]=None, keep_alive_timeout: float=5.0, max_keep_alive_requests: int=1000, max_body_size: Union[int, None]=16 * 1024 * 1024, spool_threshold: int=1024 * 1024, access_log: bool=True, workers: int=1, reuse_port: bool=False, shutdown_timeout: float=30.0, request_line_timeout: float=10.0, header_timeout: float=10.0, body_timeout: float=60.0, write_timeout: float=30.0, max_request_line: int=8 * 1024, max_header_size: int=64 * 1024, max_headers: int=100, max_requests: Union[int, None]=None, max_requests_jitter: int=0, max_rss: Union[int, None]=None):
+        super().__init__(dispatch_cache_size)
         self.host = host
         self.port = port
-        self.pattern_middlewares = PatternMiddlewares()
-        self.request_handlers = RequestHandlers()
         self.server_class = server_class
+        # a single-threaded server can only serve one connection at a time, so by default
+        # connections are only kept open when the server class handles them concurrently
+        self.keep_alive = keep_alive if keep_alive is not None else issubclass(server_class, ThreadingMixIn)
+        self.keep_alive_timeout = keep_alive_timeout
+        self.max_keep_alive_requests = max_keep_alive_requests
+        self.max_body_size = max_body_size
+        self.spool_threshold = spool_threshold
+        self.access_log = access_log
+        self.workers = workers
+        self.reuse_port = reuse_port
+        self.shutdown_timeout = shutdown_timeout
+        # worker recycling, see workers.Supervisor
+        self.max_requests = max_requests
+        self.max_requests_jitter = max_requests_jitter
+        self.max_rss = max_rss
+        # approximate: increments from concurrent threads can race, which only nudges when a worker recycles
+        self.requests_served = 0
+        # deadlines (in seconds) for reading each part of a request; keep_alive_timeout is the deadline
+        # for the next request line on a persistent connection
+        self.request_line_timeout = request_line_timeout
+        self.header_timeout = header_timeout
+        self.body_timeout = body_timeout
+        self.write_timeout = write_timeout
+        self.max_request_line = max_request_line
+        self.max_header_size = max_header_size
+        self.max_headers = max_headers
+        self.rejections = RejectionCounters()
+        # set while shutting down so that persistent connections are closed after their current request
+        self.draining = False
         self.server = None
 
-    def _pattern_matches(self, pattern: str, path: str) -> bool:
-        # TODO: implement a matching function that actually does something
-        return pattern == path or pattern == "*"
-
-    def _get_middlewares(self, path: str) -> List[RequestHandler]: 
-        middlewares: List[RequestHandler] = []
-        for key, value in self.pattern_middlewares.items():
-            if self._pattern_matches(key, path):
-                middlewares.extend(value)
-        return middlewares
-    
-    def _get_handler(self, path: str, method: HttpMethod) -> Union[None, Tuple[RequestHandler, str]]:
-        for key, value in self.request_handlers[method].items():
-            if self._pattern_matches(key, path):
-                return value, key
-        return None
+    def _check_handler(self, handler: AnyRequestHandler):
+        # a coroutine handler would only be called, never awaited
+        if is_coroutine_handler(handler):
+            raise TypeError(f"{handler!r} is a coroutine handler; serve it with AsyncPyserve")
+        super()._check_handler(handler)
 
     def _generate_http_request_handler(self):
         class Handler(BaseHTTPRequestHandler):
-            def _generate_request(_self, pattern: str) -> Request:
-                return Request(pattern, _self)
+            protocol_version = "HTTP/1.1"
+            timeout = self.keep_alive_timeout
+            # streamed and file bodies follow the head in separate writes, so Nagle + delayed ACKs would stall them
+            disable_nagle_algorithm = True
+            # largest unread request body that is discarded to keep the connection open
+            max_drain_size = 64 * 1024
+
+            def setup(_self):
+                super().setup()
+                _self.rfile.close()
+                _self.reader = DeadlineSocketIO(_self.connection)
+                _self.rfile = BufferedReader(_self.reader)
+                # which deadline a TimeoutError belongs to
+                _self.phase = "request_line_timeout"
+                _self.requests_handled = 0
+                # reused for every request on the connection
+                _self.request_object: Union[Request, None] = None
+                _self.response_object: Union[Response, None] = None
+
+            def log_request(_self, code: Union[int, str]="-", size: Union[int, str]="-"):
+                if self.access_log:
+                    super().log_request(code, size)
+
+            def _generate_request(_self, pattern: str, params: Params) -> Request:
+                if _self.request_object is None:
+                    _self.request_object = Request(pattern, _self, params, self.max_body_size, self.spool_threshold)
+                else:
+                    _self.request_object.reset(pattern, _self, params)
+                return _self.request_object
             def _generate_response(_self) -> Response:
-                return Response(_self)
-            
-            def _handle_method(_self, method: HttpMethod):
-                middlewares = self._get_middlewares(_self.path)
-                handlerPattern = self._get_handler(_self.path, method)
-                if handlerPattern is None:
+                if _self.response_object is None:
+                    _self.response_object = Response(_self)
+                else:
+                    _self.response_object.reset(_self)
+                return _self.response_object
+
+            def _discard_body(_self):
+                # an unread body would be parsed as the next pipelined request
+                if _self.headers.get("Transfer-Encoding") is not None:
                     _self.close_connection = True
                     return
-                handler, pattern = handlerPattern
-                all_handlers = [*middlewares, handler]
-                if len(all_handlers) == 0:
-                    _self.send_error(404, f"cannot {method.upper()} {_self.path}")
+                content_length = int(_self.headers.get("Content-Length") or 0)
+                if content_length > _self.max_drain_size:
+                    _self.close_connection = True
                     return
-                request = _self._generate_request(pattern)
-                response = _self._generate_response()
+                if content_length > 0:
+                    _self.rfile.read(content_length)
+
+            def handle_one_request(_self):
+                rfile = _self.rfile
                 try:
-                    for handler_function in all_handlers:
-                        handler_function(request, response)
-                        if response.hasBeenSent():
-                            break
-                finally:
-                    resp = response.get_response()
-                    if resp is None:
+                    # waiting for a new connection's first request counts against the request line deadline,
+                    # waiting for the next one on a persistent connection is idle time
+                    _self.phase = "idle_timeout" if _self.requests_handled else "request_line_timeout"
+                    _self.reader.set_deadline(self.keep_alive_timeout if _self.requests_handled else self.request_line_timeout)
+                    if not rfile.peek(1):
+                        _self.close_connection = True
                         return
-                    
-                    status, headers, body = resp
-                    _self.send_response(status)
-                    for header_name, header_value in headers.items():
-                        _self.send_header(header_name, header_value)
-                    _self.end_headers()
-                    _self.wfile.write(body)
+                    _self.phase = "request_line_timeout"
+                    _self.reader.set_deadline(self.request_line_timeout)
+                    _self.raw_requestline = rfile.readline(self.max_request_line + 1)
+                    if len(_self.raw_requestline) > self.max_request_line:
+                        _self.requestline = ""
+                        _self.request_version = ""
+                        _self.command = ""
+                        self.rejections.count("request_line_too_long")
+                        _self.send_error(HTTPStatus.REQUEST_URI_TOO_LONG)
+                        return
+                    if not _self.raw_requestline:
+                        _self.close_connection = True
+                        return
+                    _self.phase = "header_timeout"
+                    _self.reader.set_deadline(self.header_timeout)
+                    if not _self.parse_request():
+                        return
+                    method = getattr(_self, "do_" + _self.command, None)
+                    if method is None:
+                        _self.send_error(HTTPStatus.NOT_IMPLEMENTED, f"Unsupported method ({_self.command!r})")
+                        return
+                    _self.phase = "body_timeout"
+                    _self.reader.set_deadline(self.body_timeout)
+                    method()
+                    _self.wfile.flush()
+                except TimeoutError:
+                    if _self.phase != "idle_timeout":
+                        self.rejections.count(_self.phase)
+                    _self.close_connection = True
+
+            def parse_request(_self) -> bool:
+                # HTTP/0.9 requests have no headers
+                if len(_self.raw_requestline.split()) != 3:
+                    if super().parse_request():
+                        return True
+                    self.rejections.count("bad_request")
+                    return False
+                # the header block is read here under the server's limits, and parsed from memory by the stdlib
+                lines: List[bytes] = []
+                size = 0
+                while True:
+                    line = _self.rfile.readline(self.max_header_size - size + 1)
+                    size += len(line)
+                    if size > self.max_header_size or len(lines) > self.max_headers:
+                        _self.requestline = str(_self.raw_requestline, "iso-8859-1").rstrip("\r\n")
+                        _self.request_version = ""
+                        _self.command = ""
+                        self.rejections.count("headers_too_large" if size > self.max_header_size else "too_many_headers")
+                        _self.send_error(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE)
+                        return False
+                    lines.append(line)
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                rfile = _self.rfile
+                _self.rfile = BytesIO(b"".join(lines))  # type: ignore[assignment]
+                try:
+                    if super().parse_request():
+                        return True
+                    self.rejections.count("bad_request")
+                    return False
+                finally:
+                    _self.rfile = rfile
+
+            def _write_response(_self, method: HttpMethod, response: Response):
+                status, headers, body = response.get_response()
+                _self.phase = "write_timeout"
+                _self.connection.settimeout(self.write_timeout)
+                _self.requests_handled += 1
+                self.requests_served += 1
+                if not self.keep_alive or self.draining or _self.requests_handled >= self.max_keep_alive_requests:
+                    _self.close_connection = True
+                stream = response.get_stream()
+                # HTTP/1.0 clients don't understand chunked encoding; the stream ends when the connection closes
+                chunked = stream is not None and _self.request_version != "HTTP/1.0"
+                if stream is not None and not chunked and method != "head":
+                    _self.close_connection = True
+                connection_header = response.get_header("Connection")
+                if connection_header is not None and connection_header.lower() == "close":
                     _self.close_connection = True
-                    
+                _self.log_request(status)
+                # a handler's own Connection header is sent as is
+                head = serialize_head(status, headers, _self.close_connection and connection_header is None, _self.request_version == "HTTP/1.0" and connection_header is None, chunked)
+                file_body = response.get_file()
+                if method == "head":
+                    send_buffers(_self.connection, [head])
+                    if file_body is not None:
+                        file_body.close()
+                    if stream is not None:
+                        close_stream(stream)
+                elif file_body is not None:
+                    send_buffers(_self.connection, [head])
+                    file_body.send(_self.connection)
+                elif stream is not None:
+                    send_buffers(_self.connection, [head])
+                    _self._write_stream(stream, chunked)
+                else:
+                    # head and body go out in one syscall
+                    send_buffers(_self.connection, [head, body])
+
+            def _write_stream(_self, stream: StreamBody, chunked: bool):
+                # headers are already out, so a failing stream can only be cut short by closing the connection
+                try:
+                    for chunk in iterate_sync(stream):
+                        if chunk:
+                            _self.wfile.write(frame_chunk(chunk) if chunked else chunk)
+                    if chunked:
+                        _self.wfile.write(LAST_CHUNK)
+                except ConnectionError:
+                    _self.close_connection = True
+                except TimeoutError:
+                    self.rejections.count("write_timeout")
+                    _self.close_connection = True
+                except Exception:
+                    _self.log_error("error streaming response\n%s", format_exc())
+                    _self.close_connection = True
+                finally:
+                    close_stream(stream)
+            
+            def _reject(_self, method: HttpMethod, response: Response, status: int, message: str):
+                # the rest of the request can't be trusted or skipped, so the connection is closed
+                _self.close_connection = True
+                response.status(status)
+                response.send_raw(message.encode())
+                _self._write_response(method, response)
+
+            def _dispatch(_self, method: HttpMethod, timings: Union[List[float], None]) -> Union[Dispatch, None]:
+                path = _self.path.split("?", 1)[0]
+                response = _self._generate_response()
+                content_length = _self.headers.get("Content-Length")
+                if self.max_body_size is not None and content_length is not None and content_length.isdigit() and int(content_length) > self.max_body_size:
+                    self.rejections.count("body_too_large")
+                    _self._reject(method, response, 413, f"Request body exceeds {self.max_body_size} bytes")
+                    return None
+                dispatch = self._resolve(path, method)
+                admission = self.admission
+                if admission is None:
+                    _self._run(method, path, dispatch, response, timings)
+                    return dispatch
+                rejection = admission.admit(_self, dispatch.pattern if dispatch is not None else None)
+                if rejection is not None:
+                    _self._discard_body()
+                    rejection.send(response)
+                    _self._write_response(method, response)
+                    return dispatch
+                try:
+                    _self._run(method, path, dispatch, response, timings)
+                finally:
+                    admission.release()
+                return dispatch
+
+            def _run(_self, method: HttpMethod, path: str, dispatch: Union[Dispatch, None], response: Response, timings: Union[List[float], None]):
+                if dispatch is None:
+                    _self._discard_body()
+                    response.status(404)
+                    response.send_raw(f"cannot {method.upper()} {path}".encode())
+                    _self._write_response(method, response)
+                    return
+                request = _self._generate_request(dispatch.pattern, Params(dispatch.params))
+                profiler = self.profiler
+                if profiler is not None:
+                    profiler.track(request)
+                # closed even if an after-handler hook raises, so that its on_close callbacks always run
+                try:
+                    try:
+                        if profiler is not None and profiler.wants(request):
+                            profiler.run(dispatch.pattern, run_handlers, dispatch.chain, request, response, timings)
+                        else:
+                            run_handlers(dispatch.chain, request, response, timings)  # type: ignore[arg-type]
+                    except RequestBodyError as e:
+                        if e.status in BODY_REJECTIONS:
+                            self.rejections.count(BODY_REJECTIONS[e.status])
+                        if not response.hasBeenSent():
+                            _self._reject(method, response, e.status, e.message)
+                            return
+                        # a response the handler already sent still goes out, on a connection that then closes
+                        _self.close_connection = True
+                    except Exception:
+                        _self.log_error("error handling %s %s\n%s", method.upper(), path, format_exc())
+                        _self.close_connection = True
+                        if not response.hasBeenSent():
+                            response.status(500)
+                            response.send_raw(b"Internal Server Error")
+                    if not request.drain(_self.max_drain_size):
+                        _self.close_connection = True
+                    if not response.hasBeenSent():
+                        response.status(404)
+                        response.send_raw(f"cannot {method.upper()} {path}".encode())
+                    run_after_handlers(self.after_handlers, request, response)
+                    _self._write_response(method, response)
+                finally:
+                    request.close()
+
+            def _handle_method(_self, method: HttpMethod):
+                metrics = self.metrics
+                if metrics is None:
+                    _self._dispatch(method, None)
+                    return
+                started = perf_counter()
+                timings: List[float] = []
+                dispatch = _self._dispatch(method, timings)
+                assert _self.response_object is not None
+                metrics.observe(method, dispatch, _self.response_object.get_response()[0], perf_counter() - started, timings)
 
             def do_GET(_self):
                 return _self._handle_method("get")
@@ -95,8 +347,24 @@ class Pyserve(Router):
         
         return Handler
 
-    def listen(self):
+    def _create_server(self, server_class: Union[Type[HTTPServer], None]=None) -> HTTPServer:
         handler = self._generate_http_request_handler()
         server_address = (self.host, self.port)
-        self.server = self.server_class(server_address,handler)
-        self.server.serve_forever()
\ No newline at end of file
+        return (server_class or self.server_class)(server_address,handler)
+
+    def listen(self):
+        if self.workers > 1 or self.max_requests is not None or self.max_rss is not None:
+            Supervisor(self, self.workers, reuse_port=self.reuse_port, shutdown_timeout=self.shutdown_timeout, max_requests=self.max_requests, max_requests_jitter=self.max_requests_jitter, max_rss=self.max_rss).run()
+            return
+        self.server = self._create_server()
+        self.server.serve_forever()
+
+    def wsgi_app(self, environ: Dict[str, Any], start_response: WsgiStartResponse) -> Iterable[bytes]:
+        """A WSGI application serving the same routes; pass server.wsgi_app to any WSGI container"""
+        return serve_wsgi(self, environ, start_response)
+
+    def shutdown(self):
+        if self.server is None:
+            return
+        self.server.shutdown()
+        self.server.server_close()
\ No newline at end of file
@@ -0,0 +1,125 @@
+from asyncio import CancelledError, ensure_future, wait
+from queue import Empty, Full, Queue
+from threading import Event, Thread
+from typing import Any, AsyncIterable, AsyncIterator, Iterable, Iterator, Tuple, Union
+
+from .streaming import StreamBody, close_stream, is_async_iterable
+
+"""
+Server-Sent Events (text/event-stream). Events are ServerSentEvents, plain strings (sent as data)
+or pre-encoded bytes; while the source is idle a comment line is sent every heartbeat seconds so
+that proxies and clients keep the connection open.
+"""
+
+HEARTBEAT = b": heartbeat\n\n"
+
+Events = Union[Iterable[Any], AsyncIterable[Any]]
+
+
+class ServerSentEvent:
+    def __init__(self, data: str, event: Union[str, None]=None, id: Union[str, None]=None, retry: Union[int, None]=None):
+        self.data = data
+        self.event = event
+        self.id = id
+        self.retry = retry
+
+    def encode(self) -> bytes:
+        lines = []
+        if self.event is not None:
+            lines.append(f"event: {self.event}")
+        if self.id is not None:
+            lines.append(f"id: {self.id}")
+        if self.retry is not None:
+            lines.append(f"retry: {self.retry}")
+        for line in self.data.splitlines() or [""]:
+            lines.append(f"data: {line}")
+        return ("\n".join(lines) + "\n\n").encode("utf_8")
+
+
+def encode_event(event: Any) -> bytes:
+    if isinstance(event, ServerSentEvent):
+        return event.encode()
+    if isinstance(event, (bytes, bytearray)):
+        return bytes(event)
+    return ServerSentEvent(str(event)).encode()
+
+
+def _heartbeat_events(events: Iterable[Any], heartbeat: float) -> Iterator[bytes]:
+    # the source may block between events, so it is read on its own thread
+    queue: "Queue[Tuple[bool, Any]]" = Queue(maxsize=16)
+    stopped = Event()
+
+    def put(item: Tuple[bool, Any]):
+        while not stopped.is_set():
+            try:
+                queue.put(item, timeout=0.5)
+                return
+            except Full:
+                continue
+
+    def produce():
+        try:
+            for event in events:
+                if stopped.is_set():
+                    break
+                put((True, event))
+        except BaseException as e:
+            put((False, e))
+        else:
+            put((False, None))
+        finally:
+            close_stream(events)
+
+    Thread(target=produce, daemon=True).start()
+    try:
+        while True:
+            try:
+                ok, item = queue.get(timeout=heartbeat)
+            except Empty:
+                yield HEARTBEAT
+                continue
+            if not ok:
+                if item is not None:
+                    raise item
+                return
+            yield encode_event(item)
+    finally:
+        stopped.set()
+
+
+async def _async_heartbeat_events(events: AsyncIterable[Any], heartbeat: Union[float, None]) -> AsyncIterator[bytes]:
+    iterator = events.__aiter__()
+    pending = None
+    try:
+        while True:
+            if pending is None:
+                pending = ensure_future(iterator.__anext__())
+            done, _ = await wait({pending}, timeout=heartbeat)
+            if not done:
+                yield HEARTBEAT
+                continue
+            task, pending = pending, None
+            try:
+                event = task.result()
+            except StopAsyncIteration:
+                return
+            yield encode_event(event)
+    finally:
+        if pending is not None:
+            pending.cancel()
+            try:
+                await pending
+            except (CancelledError, Exception):
+                pass
+        aclose = getattr(iterator, "aclose", None)
+        if aclose is not None:
+            await aclose()
+
+
+def event_stream(events: Events, heartbeat: Union[float, None]=15.0) -> StreamBody:
+    """Encodes events for Response.send_stream, adding heartbeats when heartbeat is not None"""
+    if is_async_iterable(events):
+        return _async_heartbeat_events(events, heartbeat)  # type: ignore[arg-type]
+    if heartbeat is None:
+        return (encode_event(event) for event in events)  # type: ignore[union-attr]
+    return _heartbeat_events(events, heartbeat)  # type: ignore[arg-type]
@@ -0,0 +1,176 @@
+from collections import OrderedDict
+from email.utils import formatdate, parsedate_to_datetime
+from functools import lru_cache
+from mimetypes import guess_type
+from os import stat, stat_result
+from os.path import isdir, join, realpath, sep
+from stat import S_ISREG
+from threading import Lock
+from typing import List, Tuple, Union
+
+from .file_body import file_etag
+from .handler import RequestHandler
+from .request import Request
+from .response import Response
+
+"""
+Static file middleware. Mount it on a wildcard pattern and give it the same prefix:
+    server.use("/static/*", StaticFiles("public", prefix="/static"))
+"""
+
+# (suffix of the precompressed sibling, Content-Encoding), in order of preference
+_PRECOMPRESSED = [(".br", "br"), (".gz", "gzip")]
+
+
+@lru_cache(maxsize=1024)
+def guess_mime(file_path: str) -> Tuple[Union[str, None], Union[str, None]]:
+    return guess_type(file_path)
+
+
+class _CachedFile:
+    __slots__ = ("mtime_ns", "size", "data")
+
+    def __init__(self, mtime_ns: int, size: int, data: bytes):
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self.data = data
+
+
+class FileCache:
+    """LRU of small file contents bounded by total bytes, validated against the file's mtime and size"""
+    def __init__(self, max_bytes: int=16 * 1024 * 1024, max_file_size: int=256 * 1024):
+        self.max_bytes = max_bytes
+        self.max_file_size = max_file_size
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, _CachedFile]" = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, file_path: str, file_stat: stat_result) -> Union[bytes, None]:
+        if file_stat.st_size > self.max_file_size:
+            return None
+        with self._lock:
+            entry = self._entries.get(file_path)
+            if entry is not None and entry.mtime_ns == file_stat.st_mtime_ns and entry.size == file_stat.st_size:
+                self._entries.move_to_end(file_path)
+                self.hits += 1
+                return entry.data
+            self.misses += 1
+        with open(file_path, "rb") as f:
+            data = f.read()
+        if len(data) != file_stat.st_size:
+            # changed while reading; serve it but don't cache it
+            return data
+        with self._lock:
+            previous = self._entries.pop(file_path, None)
+            if previous is not None:
+                self.size -= previous.size
+            self._entries[file_path] = _CachedFile(file_stat.st_mtime_ns, file_stat.st_size, data)
+            self.size += len(data)
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= evicted.size
+        return data
+
+
+def _stat_file(file_path: str) -> Union[stat_result, None]:
+    try:
+        file_stat = stat(file_path)
+    except OSError:
+        return None
+    return file_stat if S_ISREG(file_stat.st_mode) else None
+
+
+class StaticFiles(RequestHandler):
+    def __init__(self, directory: str, prefix: str="", index: Union[str, None]="index.html", precompressed: bool=True, cache: Union[FileCache, None]=None):
+        self.root = realpath(directory)
+        self.prefix = prefix.rstrip("/")
+        self.index = index
+        self.precompressed = precompressed
+        self.cache = cache if cache is not None else FileCache()
+
+    def _resolve_path(self, request_path: str) -> Union[str, None]:
+        relative = request_path[len(self.prefix):]
+        if not request_path.startswith(self.prefix) or (relative and not relative.startswith("/")):
+            return None
+        relative = relative.lstrip("/")
+        file_path = realpath(join(self.root, relative))
+        if file_path != self.root and not file_path.startswith(self.root + sep):
+            return None
+        if isdir(file_path):
+            if self.index is None:
+                return None
+            file_path = join(file_path, self.index)
+        return file_path
+
+    def _accepted_encodings(self, request: Request) -> List[str]:
+        accept_encoding = request.header("Accept-Encoding")
+        if not accept_encoding:
+            return []
+        accepted: List[str] = []
+        for part in accept_encoding.split(","):
+            coding, _, params = part.strip().partition(";")
+            if params.replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+                continue
+            accepted.append(coding.strip().lower())
+        return accepted
+
+    def _select(self, request: Request, file_path: str) -> Union[Tuple[str, stat_result, Union[str, None]], None]:
+        if self.precompressed:
+            accepted = self._accepted_encodings(request)
+            for suffix, coding in _PRECOMPRESSED:
+                if coding in accepted or "*" in accepted:
+                    variant_stat = _stat_file(file_path + suffix)
+                    if variant_stat is not None:
+                        return file_path + suffix, variant_stat, coding
+        file_stat = _stat_file(file_path)
+        if file_stat is None:
+            return None
+        return file_path, file_stat, None
+
+    def _not_modified(self, request: Request, etag: str, file_stat: stat_result) -> bool:
+        if_none_match = request.header("If-None-Match")
+        if if_none_match is not None:
+            return if_none_match.strip() == "*" or etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        if_modified_since = request.header("If-Modified-Since")
+        if if_modified_since is None:
+            return False
+        try:
+            return int(file_stat.st_mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+
+    def __call__(self, request: Request, response: Response):
+        if request.method not in ("GET", "HEAD"):
+            return
+        file_path = self._resolve_path(request.path)
+        if file_path is None:
+            return
+        selected = self._select(request, file_path)
+        if selected is None:
+            return
+        served_path, file_stat, coding = selected
+        etag = file_etag(file_stat)
+        if self.precompressed:
+            response.header("Vary", "Accept-Encoding")
+        if self._not_modified(request, etag, file_stat):
+            response.header("ETag", etag)
+            response.status(304)
+            response.send_raw(b'')
+            return
+        data = self.cache.get(served_path, file_stat)
+        if data is None:
+            # too large for the cache: stream it (with Range support)
+            response.send_file(served_path)
+        else:
+            response.header("ETag", etag)
+            response.header("Last-Modified", formatdate(file_stat.st_mtime, usegmt=True))
+            response.send_raw(data)
+        content_type, content_encoding = guess_mime(file_path)
+        if content_type is not None:
+            response.header("Content-Type", content_type)
+        if coding is not None:
+            response.header("Content-Encoding", coding)
+        elif content_encoding is not None:
+            response.header("Content-Encoding", content_encoding)
@@ -0,0 +1,55 @@
+from asyncio import new_event_loop
+from typing import Any, AsyncIterable, AsyncIterator, Iterable, Iterator, Union
+
+"""
+Helpers for streamed response bodies. A stream is any iterable or async iterable of bytes; the
+servers send it with chunked transfer encoding (or until the connection closes for HTTP/1.0 clients)
+and write every chunk as soon as it is produced.
+"""
+
+StreamBody = Union[Iterable[bytes], AsyncIterable[bytes]]
+
+LAST_CHUNK = b"0\r\n\r\n"
+
+
+def is_async_iterable(chunks: Any) -> bool:
+    return hasattr(chunks, "__aiter__")
+
+
+def frame_chunk(data: bytes) -> bytes:
+    return b"%x\r\n%b\r\n" % (len(data), data)
+
+
+def iterate_sync(chunks: StreamBody) -> Iterator[bytes]:
+    """Iterates a stream from a thread; async iterables are driven by a private event loop"""
+    if not is_async_iterable(chunks):
+        yield from chunks  # type: ignore[misc]
+        return
+    iterator: AsyncIterator[bytes] = chunks.__aiter__()  # type: ignore[union-attr]
+    loop = new_event_loop()
+    try:
+        while True:
+            try:
+                chunk = loop.run_until_complete(iterator.__anext__())
+            except StopAsyncIteration:
+                return
+            yield chunk
+    finally:
+        aclose = getattr(iterator, "aclose", None)
+        if aclose is not None:
+            loop.run_until_complete(aclose())
+        loop.close()
+
+
+def close_stream(chunks: StreamBody):
+    close = getattr(chunks, "close", None)
+    if close is not None:
+        close()
+
+
+async def aclose_stream(chunks: StreamBody):
+    aclose = getattr(chunks, "aclose", None)
+    if aclose is not None:
+        await aclose()
+    else:
+        close_stream(chunks)
@@ -0,0 +1,307 @@
+from http.server import HTTPServer
+from mmap import mmap
+from os import WNOHANG, _exit, close, fork, getpid, kill, pipe, read, set_blocking, sysconf, waitpid, write
+from random import randint
+from resource import RUSAGE_SELF, getrusage
+from signal import SIGINT, SIGKILL, SIGTERM, SIG_DFL, signal
+from socket import SO_REUSEADDR, SOCK_STREAM, SOL_SOCKET, socket
+from socketserver import ThreadingMixIn
+from struct import pack_into, unpack_from
+from sys import stderr
+from threading import Event, Thread
+from time import monotonic, sleep
+from traceback import print_exc
+from typing import TYPE_CHECKING, Any, Dict, List, Type, Union
+import socket as socket_module
+
+if TYPE_CHECKING:
+    from .server import Pyserve
+
+"""
+Pre-fork worker mode for Pyserve. The supervisor process binds the listening address, forks the
+workers and restarts any that exit unexpectedly. Workers either inherit the supervisor's listening
+socket, or (with reuse_port) bind their own SO_REUSEPORT socket so the kernel balances connections.
+
+Workers can also be recycled after max_requests requests (plus up to max_requests_jitter, so they
+don't all recycle at once) or once their RSS exceeds max_rss bytes. A worker due for recycling asks the
+supervisor for a replacement and keeps serving; once the replacement is accepting connections the old
+worker is sent SIGTERM and drains its in-flight requests, so the number of serving workers never drops.
+"""
+
+# lifecycle events counted by the supervisor, in the order they are stored
+LIFECYCLE_EVENTS = ("spawned", "crashed", "recycled_requests", "recycled_memory", "drain_killed")
+
+
+def _reuse_port_class(server_class: Type[HTTPServer]) -> Type[HTTPServer]:
+    return type(f"ReusePort{server_class.__name__}", (server_class,), {"allow_reuse_port": True})
+
+
+def rss_bytes() -> int:
+    """Resident set size of this process (Linux); its peak RSS elsewhere"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * sysconf("SC_PAGE_SIZE")
+    except OSError:
+        # ru_maxrss is in kilobytes on Linux and bytes on macOS; this path is only hit off Linux
+        return getrusage(RUSAGE_SELF).ru_maxrss
+
+
+class LifecycleCounters:
+    """Event counts in anonymous shared memory, written by the supervisor and readable in every worker"""
+    def __init__(self):
+        self._memory = mmap(-1, 8 * len(LIFECYCLE_EVENTS))
+
+    def count(self, event: str):
+        offset = 8 * LIFECYCLE_EVENTS.index(event)
+        pack_into("Q", self._memory, offset, unpack_from("Q", self._memory, offset)[0] + 1)
+
+    def snapshot(self) -> Dict[str, int]:
+        return {event: unpack_from("Q", self._memory, 8 * i)[0] for i, event in enumerate(LIFECYCLE_EVENTS)}
+
+
+class Supervisor:
+    # minimum seconds between restarts of the same worker slot, so a crash loop doesn't spin
+    restart_delay = 1.0
+    poll_interval = 0.2
+    # seconds between a worker's checks of its request count and RSS
+    check_interval = 1.0
+
+    def __init__(self, app: "Pyserve", workers: int, reuse_port: bool=False, shutdown_timeout: float=30.0, max_requests: Union[int, None]=None, max_requests_jitter: int=0, max_rss: Union[int, None]=None):
+        if reuse_port and not hasattr(socket_module, "SO_REUSEPORT"):
+            raise ValueError("SO_REUSEPORT is not available on this platform")
+        self.app = app
+        self.workers = workers
+        self.reuse_port = reuse_port
+        self.shutdown_timeout = shutdown_timeout
+        self.max_requests = max_requests
+        self.max_requests_jitter = max_requests_jitter
+        self.max_rss = max_rss
+        self.restarts = 0
+        self.events = LifecycleCounters()
+        self._pids: Dict[int, int] = {}
+        self._started: List[float] = [0.0] * workers
+        # replacement pid -> pid of the worker it replaces, until the replacement is ready
+        self._replacing: Dict[int, int] = {}
+        # pid of a worker being recycled -> when it gets SIGKILL (None until its replacement is ready)
+        self._retiring: Dict[int, Union[float, None]] = {}
+        # request limit of the next worker to be forked
+        self._request_limit: Union[int, None] = None
+        # in a worker, the slot it was forked for
+        self._slot = 0
+        self._messages: Union[int, None] = None
+        self._notify: Union[int, None] = None
+        self._buffer = b""
+        self._stopping = False
+        self._server: Union[HTTPServer, None] = None
+        self._reserved: Union[socket, None] = None
+
+    def _bind(self):
+        if not self.reuse_port:
+            self._server = self.app._create_server()
+            return
+        # hold the port (bound, not listening, so it never receives connections) so that port 0
+        # resolves once and every worker binds the same port
+        reserved = socket(self.app.server_class.address_family, SOCK_STREAM)
+        reserved.setsockopt(SOL_SOCKET, SO_REUSEADDR, 1)
+        reserved.setsockopt(SOL_SOCKET, socket_module.SO_REUSEPORT, 1)
+        reserved.bind((self.app.host, self.app.port))
+        self.app.port = reserved.getsockname()[1]
+        self._reserved = reserved
+
+    def _serve(self):
+        server = self._server
+        if server is None:
+            server = self.app._create_server(_reuse_port_class(self.app.server_class))
+        if isinstance(server, ThreadingMixIn):
+            # join in-flight requests on shutdown instead of abandoning daemon threads
+            server.daemon_threads = False
+            server.block_on_close = True
+        self.app.server = server
+
+        def stop(signum: int, frame: Any):
+            # the handler interrupts whatever the main thread is doing, possibly a request, so it only asks
+            # serve_forever to return once that request is done; shutdown() blocks, hence the thread
+            if self.app.draining:
+                return
+            self.app.draining = True
+            Thread(target=server.shutdown, name="pyserve-shutdown", daemon=True).start()
+
+        signal(SIGTERM, stop)
+        signal(SIGINT, stop)
+        self._send(f"ready {getpid()}")
+        if self.app.metrics is not None:
+            self.app.metrics.add_collector(self._metric_lines)
+        if self._request_limit is not None or self.max_rss is not None:
+            self._watch()
+        try:
+            server.serve_forever()
+        finally:
+            signal(SIGTERM, SIG_DFL)
+            server.server_close()
+
+    def _send(self, message: str):
+        # messages are far shorter than PIPE_BUF, so writes from different workers never interleave
+        if self._notify is not None:
+            write(self._notify, f"{message}\n".encode())
+
+    def _metric_lines(self) -> List[str]:
+        # the events are shared by all workers; the gauges are those of the worker serving the scrape
+        lines = ["# HELP pyserve_worker_events_total Worker lifecycle events counted by the supervisor", "# TYPE pyserve_worker_events_total counter"]
+        for event, count in self.events.snapshot().items():
+            lines.append(f'pyserve_worker_events_total{{event="{event}"}} {count}')
+        lines.extend([
+            "# HELP pyserve_worker_requests Requests served by this worker",
+            "# TYPE pyserve_worker_requests gauge",
+            f"pyserve_worker_requests {self.app.requests_served}",
+            "# HELP pyserve_worker_rss_bytes Resident set size of this worker",
+            "# TYPE pyserve_worker_rss_bytes gauge",
+            f"pyserve_worker_rss_bytes {rss_bytes()}",
+            "# HELP pyserve_worker_uptime_seconds Seconds since this worker started",
+            "# TYPE pyserve_worker_uptime_seconds gauge",
+            f"pyserve_worker_uptime_seconds {monotonic() - self._started[self._slot]}",
+        ])
+        return lines
+
+    def _watch(self):
+        app = self.app
+        stopped = Event()
+
+        def watch():
+            while not stopped.wait(self.check_interval):
+                if self._request_limit is not None and app.requests_served >= self._request_limit:
+                    reason = "requests"
+                elif self.max_rss is not None and rss_bytes() > self.max_rss:
+                    reason = "memory"
+                else:
+                    continue
+                # keep serving until the supervisor's replacement is ready and it sends SIGTERM
+                self._send(f"recycle {getpid()} {reason}")
+                stopped.set()
+
+        Thread(target=watch, name="pyserve-recycle", daemon=True).start()
+
+    def _spawn(self, slot: int, replacing: Union[int, None]=None):
+        if self.max_requests is not None:
+            # chosen in the supervisor, since forked workers would all draw the same random numbers
+            self._request_limit = self.max_requests + randint(0, self.max_requests_jitter)
+        self._started[slot] = monotonic()
+        pid = fork()
+        if pid == 0:
+            code = 0
+            self._slot = slot
+            try:
+                if self._messages is not None:
+                    close(self._messages)
+                self._serve()
+            except BaseException:
+                print_exc()
+                code = 1
+            finally:
+                _exit(code)
+        self._pids[pid] = slot
+        self.events.count("spawned")
+        if replacing is not None:
+            self._replacing[pid] = replacing
+
+    def _receive(self):
+        assert self._messages is not None
+        while True:
+            try:
+                data = read(self._messages, 4096)
+            except BlockingIOError:
+                break
+            if not data:
+                break
+            self._buffer += data
+        *lines, self._buffer = self._buffer.split(b"\n")
+        for line in lines:
+            kind, pid, *rest = line.decode().split()
+            if kind == "recycle":
+                self._recycle(int(pid), rest[0])
+            elif kind == "ready":
+                old = self._replacing.pop(int(pid), None)
+                if old is not None and old in self._retiring:
+                    kill(old, SIGTERM)
+                    self._retiring[old] = monotonic() + self.shutdown_timeout
+
+    def _recycle(self, pid: int, reason: str):
+        slot = self._pids.pop(pid, None)
+        if slot is None or self._stopping:
+            return
+        stderr.write(f"pyserve: recycling worker {pid} ({reason})\n")
+        self.events.count(f"recycled_{reason}")
+        self._retiring[pid] = None
+        self._spawn(slot, replacing=pid)
+
+    def _reap(self):
+        while self._pids or self._retiring:
+            pid, status = waitpid(-1, WNOHANG)
+            if pid == 0:
+                break
+            if pid in self._retiring:
+                self._retiring.pop(pid)
+                continue
+            slot = self._pids.pop(pid, None)
+            if slot is None or self._stopping:
+                continue
+            stderr.write(f"pyserve: worker {pid} exited with status {status}, restarting\n")
+            self.events.count("crashed")
+            wait = self.restart_delay - (monotonic() - self._started[slot])
+            if wait > 0:
+                sleep(wait)
+            self.restarts += 1
+            # a replacement that dies before it is ready hands the worker it replaces to its own replacement
+            self._spawn(slot, self._replacing.pop(pid, None))
+        now = monotonic()
+        for pid, deadline in list(self._retiring.items()):
+            if deadline is not None and now > deadline:
+                stderr.write(f"pyserve: worker {pid} did not drain within {self.shutdown_timeout}s, killing\n")
+                self.events.count("drain_killed")
+                kill(pid, SIGKILL)
+                self._retiring[pid] = None
+
+    def _stop(self, signum: int, frame: Any):
+        self._stopping = True
+
+    def _shutdown(self):
+        # workers being recycled are stopped the same way, whether or not they have been told to drain
+        self._pids.update(dict.fromkeys(self._retiring, -1))
+        self._retiring = {}
+        for pid in self._pids:
+            kill(pid, SIGTERM)
+        deadline = monotonic() + self.shutdown_timeout
+        while self._pids and monotonic() < deadline:
+            pid, _ = waitpid(-1, WNOHANG)
+            if pid == 0:
+                sleep(self.poll_interval)
+                continue
+            self._pids.pop(pid, None)
+        for pid in self._pids:
+            kill(pid, SIGKILL)
+        while self._pids:
+            pid, _ = waitpid(-1, 0)
+            self._pids.pop(pid, None)
+
+    def run(self):
+        self._bind()
+        self._messages, self._notify = pipe()
+        set_blocking(self._messages, False)
+        signal(SIGTERM, self._stop)
+        signal(SIGINT, self._stop)
+        supervisor_pid = getpid()
+        try:
+            for slot in range(self.workers):
+                self._spawn(slot)
+            while not self._stopping:
+                self._receive()
+                self._reap()
+                sleep(self.poll_interval)
+        finally:
+            if getpid() == supervisor_pid:
+                self._shutdown()
+                close(self._messages)
+                close(self._notify)
+                if self._server is not None:
+                    self._server.server_close()
+                if self._reserved is not None:
+                    self._reserved.close()
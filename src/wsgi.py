@@ -0,0 +1,206 @@
+from email.message import Message
+from http import HTTPStatus
+from os import fstat
+from sys import stderr
+from time import perf_counter
+from traceback import format_exc
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, Iterator, List, Tuple, Union
+from urllib.parse import quote
+
+from .body import RequestBodyError
+from .deadline import BODY_REJECTIONS
+from .dispatch_cache import Dispatch
+from .file_body import CHUNK_SIZE, FileBody
+from .handler import HttpMethod, run_after_handlers, run_handlers
+from .request import Request
+from .response import Response
+from .streaming import close_stream, iterate_sync
+from .types import Params
+
+if TYPE_CHECKING:
+    from .server import Pyserve
+
+"""
+Runs a Pyserve app's routes, middlewares and handlers in any WSGI container (PEP 3333), e.g.
+    gunicorn -w 4 'app:server.wsgi_app'
+Request bodies stream from wsgi.input and streamed responses are returned as iterables, so the
+container decides how they are framed. Connection handling (keep-alive, deadlines, header limits,
+worker processes) is left to the container; admission control, metrics and profiling still apply.
+"""
+
+WsgiStartResponse = Callable[..., Any]
+
+_METHODS: Dict[str, HttpMethod] = {"GET": "get", "HEAD": "head", "PUT": "put", "POST": "post", "PATCH": "patch", "DELETE": "delete"}
+
+# hop-by-hop headers belong to the container's connection, and PEP 3333 forbids applications to set them
+_HOP_BY_HOP = frozenset(("connection", "keep-alive", "proxy-authenticate", "proxy-authorization", "te", "trailers", "transfer-encoding", "upgrade"))
+
+# characters kept as they are when re-encoding the decoded PATH_INFO
+_PATH_SAFE = "/:@!$&'()*+,;=-._~"
+
+
+def _status_line(status: int) -> str:
+    try:
+        return f"{status} {HTTPStatus(status).phrase}"
+    except ValueError:
+        return f"{status} Unknown"
+
+
+class WsgiExchange:
+    def __init__(self, environ: Dict[str, Any]):
+        # routes match the raw, percent-encoded path like the other servers see it
+        raw_uri = environ.get("RAW_URI") or environ.get("REQUEST_URI")
+        if raw_uri and raw_uri.startswith("/") and not environ.get("SCRIPT_NAME"):
+            self.path: str = raw_uri
+        else:
+            query = environ.get("QUERY_STRING")
+            self.path = quote(environ.get("PATH_INFO", "").encode("latin-1"), safe=_PATH_SAFE) or "/"
+            if query:
+                self.path += "?" + query
+        self.command: str = environ["REQUEST_METHOD"]
+        self.request_version: str = environ.get("SERVER_PROTOCOL", "HTTP/1.1")
+        headers = Message()
+        for key, value in environ.items():
+            # the container has already decoded any chunked framing of wsgi.input
+            if key.startswith("HTTP_") and key not in ("HTTP_CONTENT_TYPE", "HTTP_CONTENT_LENGTH", "HTTP_TRANSFER_ENCODING"):
+                headers[key[5:].replace("_", "-").title()] = value
+        if environ.get("CONTENT_TYPE"):
+            headers["Content-Type"] = environ["CONTENT_TYPE"]
+        if environ.get("CONTENT_LENGTH"):
+            headers["Content-Length"] = environ["CONTENT_LENGTH"]
+        self.headers = headers
+        self.rfile = environ["wsgi.input"]
+        # without a Content-Length the body is empty, unless the container marks wsgi.input as ending with it
+        self.body_until_eof = bool(environ.get("wsgi.input_terminated")) and not environ.get("CONTENT_LENGTH")
+        port = environ.get("REMOTE_PORT")
+        self.client_address: Any = (environ.get("REMOTE_ADDR", ""), int(port) if port else 0)
+
+
+class _ClosingIterable:
+    # the body of a response; the container calls close() once it has been sent, or the client has gone
+    def __init__(self, chunks: Iterable[bytes], on_close: List[Callable[[], None]]):
+        self._chunks = chunks
+        self._on_close = on_close
+
+    def __iter__(self) -> Iterator[bytes]:
+        return iter(self._chunks)
+
+    def close(self):
+        close = getattr(self._chunks, "close", None)
+        try:
+            if close is not None:
+                close()
+        finally:
+            for callback in self._on_close:
+                callback()
+
+
+def _stream_chunks(stream: Any) -> Iterator[bytes]:
+    try:
+        for chunk in iterate_sync(stream):
+            if chunk:
+                yield chunk
+    finally:
+        close_stream(stream)
+
+
+def _file_chunks(file_body: FileBody, environ: Dict[str, Any]) -> Iterable[bytes]:
+    # wsgi.file_wrapper (sendfile in most containers) sends a file from its current position to its end
+    file_wrapper = environ.get("wsgi.file_wrapper")
+    if file_wrapper is not None and file_body.offset + file_body.length == fstat(file_body.file.fileno()).st_size:
+        file_body.file.seek(file_body.offset)
+        return file_wrapper(file_body.file, CHUNK_SIZE)
+    return file_body.chunks()
+
+
+def serve_wsgi(app: "Pyserve", environ: Dict[str, Any], start_response: WsgiStartResponse) -> Iterable[bytes]:
+    exchange = WsgiExchange(environ)
+    response = Response(exchange)
+    on_close: List[Callable[[], None]] = []
+    method = _METHODS.get(exchange.command)
+    path = exchange.path.split("?", 1)[0]
+    dispatch: Union[Dispatch, None] = None
+    metrics = app.metrics
+    started = perf_counter() if metrics is not None else 0.0
+    timings: Union[List[float], None] = [] if metrics is not None else None
+    content_length = exchange.headers.get("Content-Length")
+    if method is None:
+        response.status(501)
+        response.send_raw(f"Unsupported method {exchange.command}".encode())
+    elif app.max_body_size is not None and content_length is not None and content_length.isdigit() and int(content_length) > app.max_body_size:
+        app.rejections.count("body_too_large")
+        response.status(413)
+        response.send_raw(f"Request body exceeds {app.max_body_size} bytes".encode())
+    else:
+        dispatch = app._resolve(path, method)
+        admission = app.admission
+        rejection = admission.admit(exchange, dispatch.pattern if dispatch is not None else None) if admission is not None else None
+        if rejection is not None:
+            rejection.send(response)
+        else:
+            if admission is not None:
+                on_close.append(admission.release)
+            try:
+                _run(app, environ, method, path, dispatch, response, on_close, timings)
+            except BaseException:
+                for callback in on_close:
+                    callback()
+                raise
+    status, headers, body = response.get_response()
+    header_list: List[Tuple[str, str]] = [(name, value) for name, value in headers.items() if name.lower() not in _HOP_BY_HOP]
+    start_response(_status_line(status), header_list)
+    # like the other servers, unsupported methods are refused before metrics see them
+    if metrics is not None and method is not None:
+        metrics.observe(method, dispatch, status, perf_counter() - started, timings)
+    file_body = response.get_file()
+    stream = response.get_stream()
+    chunks: Iterable[bytes]
+    if method == "head":
+        if file_body is not None:
+            file_body.close()
+        if stream is not None:
+            close_stream(stream)
+        chunks = []
+    elif file_body is not None:
+        chunks = _file_chunks(file_body, environ)
+    elif stream is not None:
+        chunks = _stream_chunks(stream)
+    else:
+        chunks = [body]
+    return _ClosingIterable(chunks, on_close)
+
+
+def _run(app: "Pyserve", environ: Dict[str, Any], method: HttpMethod, path: str, dispatch: Union[Dispatch, None], response: Response, on_close: List[Callable[[], None]], timings: Union[List[float], None]):
+    if dispatch is None:
+        response.status(404)
+        response.send_raw(f"cannot {method.upper()} {path}".encode())
+        return
+    request = Request(dispatch.pattern, response.handler, Params(dispatch.params), app.max_body_size, app.spool_threshold)
+    # spooled bodies and uploads are removed once the response has been sent
+    on_close.insert(0, request.close)
+    profiler = app.profiler
+    if profiler is not None:
+        profiler.track(request)
+    try:
+        if profiler is not None and profiler.wants(request):
+            profiler.run(dispatch.pattern, run_handlers, dispatch.chain, request, response, timings)
+        else:
+            run_handlers(dispatch.chain, request, response, timings)  # type: ignore[arg-type]
+    except RequestBodyError as e:
+        if e.status in BODY_REJECTIONS:
+            app.rejections.count(BODY_REJECTIONS[e.status])
+        # a response the handler already sent is still returned
+        if not response.hasBeenSent():
+            response.status(e.status)
+            response.send_raw(e.message.encode())
+            return
+    except Exception:
+        errors = environ.get("wsgi.errors", stderr)
+        errors.write(f"error handling {method.upper()} {path}\n{format_exc()}")
+        if not response.hasBeenSent():
+            response.status(500)
+            response.send_raw(b"Internal Server Error")
+    if not response.hasBeenSent():
+        response.status(404)
+        response.send_raw(f"cannot {method.upper()} {path}".encode())
+    run_after_handlers(app.after_handlers, request, response)
@@ -0,0 +1,25 @@
+import unittest
+
+from src.admission import TokenBuckets
+
+
+class TokenBucketsTest(unittest.TestCase):
+    def test_keys_stay_bounded_when_none_has_refilled(self):
+        buckets = TokenBuckets(rate=1.0, burst=1.0, max_keys=640)
+        for i in range(20000):
+            self.assertEqual(buckets.take(f"10.0.{i // 256}.{i % 256}", 0.0), 0.0)
+        self.assertLessEqual(len(buckets), 640)
+
+    def test_recently_used_keys_are_kept(self):
+        buckets = TokenBuckets(rate=1.0, burst=1.0, max_keys=6400)
+        self.assertEqual(buckets.take("client", 0.0), 0.0)
+        for i in range(1000):
+            buckets.take(i, 0.0)
+            if i % 100 == 0:
+                self.assertGreater(buckets.take("client", 0.0), 0.0)
+        self.assertGreater(buckets.take("client", 0.0), 0.0)
+        self.assertEqual(buckets.take("client", 1.0), 0.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
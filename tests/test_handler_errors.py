@@ -0,0 +1,97 @@
+import socket
+import unittest
+from io import BytesIO, StringIO
+from http.client import HTTPConnection
+
+from src import AsyncPyserve, Pyserve, RequestHandler
+from src.bench.server import make_server, start, start_async
+
+
+class SendThenRaise(RequestHandler):
+    def __call__(self, request, response):
+        response.send_raw(b"ok")
+        raise ValueError("after sending")
+
+
+class SendThenReadBody(RequestHandler):
+    def __call__(self, request, response):
+        response.send_raw(b"ok")
+        request.body()
+
+
+class Ok(RequestHandler):
+    def __call__(self, request, response):
+        response.send_raw(b"fine")
+
+
+def read_until_closed(conn: socket.socket) -> bytes:
+    data = b""
+    while True:
+        chunk = conn.recv(65536)
+        if not chunk:
+            return data
+        data += chunk
+
+
+class HandlerErrorTest(unittest.TestCase):
+    def check_sent_response_survives(self, host: str, port: int):
+        client = HTTPConnection(host, port, timeout=5)
+        client.request("GET", "/raise")
+        response = client.getresponse()
+        self.assertEqual(response.status, 200)
+        self.assertEqual(response.read(), b"ok")
+        self.assertEqual(response.getheader("Connection"), "close")
+        client.close()
+
+    def check_sent_response_survives_a_body_error(self, host: str, port: int):
+        # the chunked body is over max_body_size, which is only found out while the handler reads it
+        client = HTTPConnection(host, port, timeout=5)
+        client.request("POST", "/body", body=iter([b"x" * 64]), headers={"Content-Type": "application/json"}, encode_chunked=True)
+        response = client.getresponse()
+        self.assertEqual(response.status, 200)
+        self.assertEqual(response.read(), b"ok")
+        self.assertEqual(response.getheader("Connection"), "close")
+        client.close()
+
+    def test_threaded_writes_a_sent_response_when_the_handler_raises(self):
+        server = make_server(max_body_size=16)
+        server.get("/raise", SendThenRaise())
+        server.post("/body", SendThenReadBody())
+        host, port = start(server)
+        try:
+            self.check_sent_response_survives(host, port)
+            self.check_sent_response_survives_a_body_error(host, port)
+        finally:
+            server.shutdown()
+
+    def test_async_writes_a_sent_response_when_the_handler_raises(self):
+        app = AsyncPyserve("127.0.0.1", 0, access_log=False)
+        app.get("/raise", SendThenRaise())
+        app.get("/ok", Ok())
+        host, port, stop = start_async(app)
+        try:
+            self.check_sent_response_survives(host, port)
+            # responses pipelined before the failing request are still flushed
+            conn = socket.create_connection((host, port), timeout=5)
+            conn.sendall(b"GET /ok HTTP/1.1\r\nHost: x\r\n\r\nGET /raise HTTP/1.1\r\nHost: x\r\n\r\n")
+            data = read_until_closed(conn)
+            conn.close()
+            self.assertEqual(data.count(b"HTTP/1.1 200 OK"), 2)
+            self.assertTrue(data.endswith(b"ok"))
+        finally:
+            stop()
+
+    def test_wsgi_returns_a_sent_response_when_the_handler_raises(self):
+        server = Pyserve("127.0.0.1", 0, access_log=False)
+        server.get("/raise", SendThenRaise())
+        started = []
+        environ = {"REQUEST_METHOD": "GET", "PATH_INFO": "/raise", "QUERY_STRING": "", "wsgi.input": BytesIO(), "wsgi.errors": StringIO()}
+        body = server.wsgi_app(environ, lambda status, headers: started.append(status))
+        self.assertEqual(started, ["200 OK"])
+        self.assertEqual(b"".join(body), b"ok")
+        body.close()  # type: ignore[attr-defined]
+        self.assertIn("ValueError", environ["wsgi.errors"].getvalue())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,129 @@
+import socket
+import unittest
+
+from src import AsyncPyserve, RequestHandler
+from src.bench.server import start_async
+from src.http_parser import HttpParseError, RequestParser
+
+
+class Echo(RequestHandler):
+    def __call__(self, request, response):
+        response.send_raw(request.stream().read())
+
+
+def read_body(request) -> bytes:
+    body = request.body.read()
+    request.body.close()
+    return body
+
+
+def read_until_closed(conn: socket.socket) -> bytes:
+    data = b""
+    while True:
+        chunk = conn.recv(65536)
+        if not chunk:
+            return data
+        data += chunk
+
+
+class RequestParserTest(unittest.TestCase):
+    def test_requests_split_across_reads(self):
+        parser = RequestParser()
+        raw = b"POST /a HTTP/1.1\r\nHost: x\r\nContent-Length: 5\r\n\r\nhello"
+        completed = []
+        for i in range(len(raw)):
+            completed.extend(parser.feed(raw[i:i + 1]))
+        self.assertEqual(len(completed), 1)
+        self.assertEqual((completed[0].command, completed[0].path), ("POST", "/a"))
+        self.assertEqual(read_body(completed[0]), b"hello")
+        self.assertEqual(parser.phase(), "idle")
+
+    def test_pipelined_requests(self):
+        parser = RequestParser()
+        completed = parser.feed(b"GET /1 HTTP/1.1\r\n\r\nGET /2 HTTP/1.1\r\nConnection: close\r\n\r\nGET /3")
+        self.assertEqual([request.path for request in completed], ["/1", "/2"])
+        self.assertTrue(completed[0].keep_alive)
+        self.assertFalse(completed[1].keep_alive)
+        self.assertEqual(parser.phase(), "request_line")
+
+    def test_chunked_body(self):
+        parser = RequestParser()
+        completed = parser.feed(b"POST / HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n5;ext=1\r\nhello\r\n6\r\n world\r\n0\r\nX-Trailer: 1\r\n\r\n")
+        self.assertEqual(len(completed), 1)
+        self.assertEqual(read_body(completed[0]), b"hello world")
+        self.assertEqual(completed[0].headers["Content-Length"], "11")
+        self.assertNotIn("Transfer-Encoding", completed[0].headers)
+
+    def test_bodies_are_spooled_as_they_arrive(self):
+        parser = RequestParser(spool_threshold=64 * 1024)
+        piece = b"x" * 16 * 1024
+        for encoding, framed in ((b"Content-Length: 1048576", piece), (b"Transfer-Encoding: chunked", b"4000\r\n" + piece + b"\r\n")):
+            with self.subTest(encoding=encoding):
+                self.assertEqual(parser.feed(b"POST / HTTP/1.1\r\n" + encoding + b"\r\n\r\n"), [])
+                for _ in range(63):
+                    self.assertEqual(parser.feed(framed), [])
+                    # what has arrived of the body doesn't stay in the parser's buffer
+                    self.assertLess(len(parser._buffer), 16)
+                completed = parser.feed(framed + b"0\r\n\r\n" if b"chunked" in encoding else framed)
+                self.assertEqual(len(completed), 1)
+                self.assertTrue(completed[0].body._rolled)  # type: ignore[union-attr]
+                self.assertEqual(read_body(completed[0]), piece * 64)
+
+    def test_small_bodies_stay_in_memory(self):
+        completed = RequestParser(spool_threshold=1024).feed(b"POST / HTTP/1.1\r\nContent-Length: 5\r\n\r\nhello")
+        self.assertFalse(completed[0].body._rolled)  # type: ignore[union-attr]
+        self.assertEqual(read_body(completed[0]), b"hello")
+
+    def assertParseError(self, parser: RequestParser, data: bytes, status: int) -> HttpParseError:
+        with self.assertRaises(HttpParseError) as raised:
+            parser.feed(data)
+        self.assertEqual(raised.exception.status, status)
+        return raised.exception
+
+    def test_limits(self):
+        self.assertParseError(RequestParser(max_header_size=64), b"GET / HTTP/1.1\r\nX: " + b"a" * 100, 431)
+        self.assertParseError(RequestParser(max_body_size=4), b"POST / HTTP/1.1\r\nContent-Length: 5\r\n\r\n", 413)
+        self.assertParseError(RequestParser(max_body_size=4), b"POST / HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n3\r\nabc\r\n2\r\n", 413)
+        self.assertParseError(RequestParser(), b"GET / HTTP/2.0\r\n\r\n", 505)
+        self.assertParseError(RequestParser(), b"POST / HTTP/1.1\r\nTransfer-Encoding: gzip\r\n\r\n", 501)
+        self.assertParseError(RequestParser(), b"POST / HTTP/1.1\r\nContent-Length: x\r\n\r\n", 400)
+
+    def test_chunk_size_line_without_crlf_is_bounded(self):
+        parser = RequestParser()
+        self.assertEqual(parser.feed(b"POST / HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n" + b"1" * 100), [])
+        self.assertParseError(parser, b"1" * 4096, 400)
+
+    def test_trailers_are_bounded(self):
+        head = b"POST / HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n0\r\n"
+        parser = RequestParser()
+        self.assertEqual(parser.feed(head), [])
+        self.assertParseError(parser, b"X-Trailer: " + b"a" * 16 * 1024, 431)
+        # many short trailer lines count against max_header_size
+        parser = RequestParser(max_header_size=1024)
+        self.assertParseError(parser, head + b"X-Trailer: 1\r\n" * 100, 431)
+
+    def test_error_keeps_the_requests_completed_before_it(self):
+        parser = RequestParser()
+        error = self.assertParseError(parser, b"GET /1 HTTP/1.1\r\n\r\nGET /2 HTTP/1.1\r\n\r\nBAD\r\n\r\n", 400)
+        self.assertEqual([request.path for request in error.completed], ["/1", "/2"])
+
+
+class AsyncParseErrorTest(unittest.TestCase):
+    def test_pipelined_responses_come_before_the_error(self):
+        app = AsyncPyserve("127.0.0.1", 0, access_log=False)
+        app.post("/echo", Echo())
+        host, port, stop = start_async(app)
+        try:
+            conn = socket.create_connection((host, port), timeout=5)
+            conn.sendall(b"POST /echo HTTP/1.1\r\nContent-Length: 3\r\n\r\none" + b"POST /echo HTTP/1.1\r\nContent-Length: 3\r\n\r\ntwo" + b"BAD\r\n\r\n")
+            data = read_until_closed(conn)
+            conn.close()
+            self.assertEqual(data.count(b"HTTP/1.1 200 OK"), 2)
+            self.assertLess(data.index(b"one"), data.index(b"two"))
+            self.assertIn(b"HTTP/1.1 400 Bad Request", data)
+        finally:
+            stop()
+
+
+if __name__ == "__main__":
+    unittest.main()
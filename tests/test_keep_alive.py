@@ -0,0 +1,79 @@
+import socket
+import unittest
+
+from src import AsyncPyserve, RequestHandler
+from src.bench.server import make_server, start, start_async
+
+
+class Ok(RequestHandler):
+    def __call__(self, request, response):
+        response.send_raw(b"ok")
+
+
+class Close(RequestHandler):
+    def __call__(self, request, response):
+        response.header("Connection", "close")
+        response.send_raw(b"bye")
+
+
+class Unframed(RequestHandler):
+    def __call__(self, request, response):
+        response.send_stream(iter([b"a", b"b"]))
+
+
+def read_until_closed(conn: socket.socket) -> bytes:
+    data = b""
+    while True:
+        chunk = conn.recv(65536)
+        if not chunk:
+            return data
+        data += chunk
+
+
+class KeepAliveTest(unittest.TestCase):
+    def exchange(self, host: str, port: int, raw: bytes) -> bytes:
+        conn = socket.create_connection((host, port), timeout=5)
+        try:
+            conn.sendall(raw)
+            return read_until_closed(conn)
+        finally:
+            conn.close()
+
+    def check(self, host: str, port: int):
+        # the connection closes after a response with Connection: close; the pipelined request isn't answered
+        data = self.exchange(host, port, b"GET /close HTTP/1.1\r\nHost: x\r\n\r\nGET /ok HTTP/1.1\r\nHost: x\r\n\r\n")
+        self.assertEqual(data.count(b"HTTP/1.1 "), 1)
+        self.assertEqual(data.lower().count(b"connection: close"), 1)
+        self.assertTrue(data.endswith(b"bye"))
+        # a stream to an HTTP/1.0 client ends with the connection
+        data = self.exchange(host, port, b"GET /unframed HTTP/1.0\r\nConnection: keep-alive\r\n\r\nGET /ok HTTP/1.0\r\n\r\n")
+        self.assertEqual(data.count(b"HTTP/1.1 "), 1)
+        self.assertTrue(data.endswith(b"ab"))
+        # an HTTP/1.0 client that asked for keep-alive is told it is kept
+        data = self.exchange(host, port, b"GET /ok HTTP/1.0\r\nConnection: keep-alive\r\n\r\nGET /ok HTTP/1.0\r\n\r\n")
+        self.assertEqual(data.count(b"HTTP/1.1 200"), 2)
+        self.assertEqual(data.lower().count(b"connection: keep-alive"), 1)
+
+    def test_threaded(self):
+        server = make_server()
+        for path, handler in (("/ok", Ok()), ("/close", Close()), ("/unframed", Unframed())):
+            server.get(path, handler)
+        host, port = start(server)
+        try:
+            self.check(host, port)
+        finally:
+            server.shutdown()
+
+    def test_async(self):
+        app = AsyncPyserve("127.0.0.1", 0, access_log=False)
+        for path, handler in (("/ok", Ok()), ("/close", Close()), ("/unframed", Unframed())):
+            app.get(path, handler)
+        host, port, stop = start_async(app)
+        try:
+            self.check(host, port)
+        finally:
+            stop()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+import unittest
+from http.client import HTTPConnection
+
+from src import AsyncPyserve, RequestHandler
+from src.bench.server import make_server, start, start_async
+from src.body import RequestBodyError
+from src.multipart import MultipartForm, parse_multipart
+
+BOUNDARY = b"----pyserve-test"
+
+
+def encode(fields, files) -> bytes:
+    parts = []
+    for name, value in fields:
+        parts.append(b"--" + BOUNDARY + b'\r\nContent-Disposition: form-data; name="' + name + b'"\r\n\r\n' + value + b"\r\n")
+    for name, filename, content in files:
+        parts.append(b"--" + BOUNDARY + b'\r\nContent-Disposition: form-data; name="' + name + b'"; filename="' + filename + b'"\r\nContent-Type: application/octet-stream\r\n\r\n' + content + b"\r\n")
+    return b"".join(parts) + b"--" + BOUNDARY + b"--\r\n"
+
+
+def summary(form: MultipartForm):
+    files = {name: [(upload.filename, upload.file.read()) for upload in uploads] for name, uploads in form.files.items()}
+    return form.fields, files
+
+
+class Upload(RequestHandler):
+    def __call__(self, request, response):
+        upload = request.form().files["file"][0]
+        # AsyncPyserve has read the body before dispatch; the threaded server reads it from the socket
+        received = getattr(request.handler.rfile, "_rolled", None)
+        response.send_raw(f"{upload.size} {upload.file._rolled} {received} {request.form().fields['note'][0]}".encode())
+
+
+class MultipartParserTest(unittest.TestCase):
+    def test_boundaries_split_across_reads(self):
+        # the file content contains most of a delimiter, which must not end the part
+        content = b"a\r\n--" + BOUNDARY[:-1] + b"b" + bytes(range(256))
+        body = encode([(b"title", b"hello")], [(b"file", b"x.bin", content)])
+        expected = ({"title": ["hello"]}, {"file": [("x.bin", content)]})
+        for size in (1, 2, 3, 7, len(BOUNDARY), len(BOUNDARY) + 3):
+            with self.subTest(size=size):
+                form = parse_multipart([body[i:i + size] for i in range(0, len(body), size)], BOUNDARY)
+                self.assertEqual(summary(form), expected)
+                form.close()
+        for split in range(1, len(body)):
+            form = parse_multipart([body[:split], body[split:]], BOUNDARY)
+            self.assertEqual(summary(form), expected, split)
+            form.close()
+
+    def test_files_are_spooled_past_the_threshold(self):
+        body = encode([(b"note", b"n" * 100)], [(b"file", b"small", b"s" * 100), (b"file", b"large", b"l" * 10000)])
+        form = parse_multipart([body], BOUNDARY, spool_threshold=1024)
+        small, large = form.files["file"]
+        self.assertEqual((small.size, large.size), (100, 10000))
+        self.assertFalse(small.file._rolled)  # type: ignore[attr-defined]
+        self.assertTrue(large.file._rolled)  # type: ignore[attr-defined]
+        form.close()
+        self.assertTrue(large.file.closed)
+
+    def assertRejected(self, body: bytes, status: int, **options: int):
+        with self.assertRaises(RequestBodyError) as raised:
+            parse_multipart([body], BOUNDARY, **options)
+        self.assertEqual(raised.exception.status, status)
+
+    def test_limits(self):
+        self.assertRejected(encode([(b"a", b"1")] * 5, []), 413, max_parts=4)
+        self.assertRejected(encode([(b"a", b"x" * 2000)], []), 413, max_field_size=1000)
+        self.assertRejected(b"--" + BOUNDARY + b"\r\nX-Long: " + b"x" * 2000, 431, max_header_size=1024)
+        self.assertRejected(b"--" + BOUNDARY + b" " * 2000, 400, max_header_size=1024)
+        self.assertRejected(encode([(b"a", b"1")], [])[:-10], 400)
+        self.assertRejected(b"--" + BOUNDARY + b"\r\nContent-Type: text/plain\r\n\r\nx\r\n--" + BOUNDARY + b"--", 400)
+
+
+class MultipartServerTest(unittest.TestCase):
+    def check(self, host: str, port: int, received: str):
+        body = encode([(b"note", b"hi")], [(b"file", b"big.bin", b"z" * 256 * 1024)])
+        client = HTTPConnection(host, port, timeout=5)
+        client.request("POST", "/upload", body=body, headers={"Content-Type": "multipart/form-data; boundary=" + BOUNDARY.decode()})
+        response = client.getresponse()
+        self.assertEqual((response.status, response.read()), (200, f"{256 * 1024} True {received} hi".encode()))
+        client.close()
+
+    def test_threaded_upload(self):
+        server = make_server(spool_threshold=64 * 1024)
+        server.post("/upload", Upload())
+        host, port = start(server)
+        try:
+            self.check(host, port, "None")
+        finally:
+            server.shutdown()
+
+    def test_async_upload_is_spooled_as_it_arrives(self):
+        app = AsyncPyserve("127.0.0.1", 0, access_log=False, spool_threshold=64 * 1024)
+        app.post("/upload", Upload())
+        host, port, stop = start_async(app)
+        try:
+            self.check(host, port, "True")
+        finally:
+            stop()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+import re
+import unittest
+
+from src.path_to_regexp import Key, compile, match, parse, path_to_regex, regexp_to_function, regexp_to_regexp, string_to_regexp
+
+
+class RegexpHelpersTest(unittest.TestCase):
+    def test_regexp_to_regexp_collects_named_and_unnamed_groups(self):
+        keys: list = []
+        regexp = re.compile(r"/(?P<kind>\w+)/(\d+)(?:/(\w+))?/\(literal\)")
+        self.assertIs(regexp_to_regexp(regexp, keys), regexp)
+        self.assertEqual([key["name"] for key in keys], ["kind", 0, 1])
+        self.assertIs(regexp_to_regexp(regexp), regexp)
+
+    def test_regexp_to_function_returns_params(self):
+        keys: list = []
+        regexp = path_to_regex(re.compile(r"^/(?P<kind>\w+)/(\d+)(?:/(\w+))?$"), keys)
+        function = regexp_to_function(regexp, keys)
+        self.assertEqual(function("/posts/7/edit"), {"path": "/posts/7/edit", "index": 0, "params": {"kind": "posts", "0": "7", "1": "edit"}})
+        # unmatched optional groups are left out
+        self.assertEqual(function("/posts/7")["params"], {"kind": "posts", "0": "7"})  # type: ignore[index]
+        self.assertIsNone(function("/posts"))
+
+    def test_regexp_to_function_splits_repeated_params(self):
+        keys: list = []
+        regexp = string_to_regexp("/files/:path+", keys)
+        function = regexp_to_function(regexp, keys)
+        self.assertEqual(function("/files/a/b/c")["params"], {"path": ["a", "b", "c"]})  # type: ignore[index]
+
+    def test_match_decodes_with_decode(self):
+        class Decode:
+            def __call__(self, string, token=None):
+                return string.upper()
+
+        function = match("/users/:id", decode=Decode())  # type: ignore[arg-type]
+        self.assertEqual(function("/users/ab")["params"], {"id": "AB"})  # type: ignore[index]
+
+
+class CompileTest(unittest.TestCase):
+    def test_compiled_functions_are_cached_per_pattern_and_options(self):
+        self.assertIs(compile("/users/:id"), compile("/users/:id"))
+        self.assertIsNot(compile("/users/:id"), compile("/users/:id", sensitive=True))
+        self.assertIs(match("/users/:id"), match("/users/:id"))
+        self.assertIs(string_to_regexp("/users/:id"), string_to_regexp("/users/:id"))
+
+    def test_cached_results_are_not_shared_with_callers(self):
+        tokens = parse("/users/:id")
+        tokens.append("/extra")
+        self.assertEqual(len(parse("/users/:id")), 2)
+        first: list = []
+        second: list = []
+        string_to_regexp("/users/:id", first)
+        first.append(Key(name="extra", prefix="", suffix="", pattern="", modifier=""))
+        string_to_regexp("/users/:id", second)
+        self.assertEqual([key["name"] for key in second], ["id"])
+
+    def test_compile_validates_and_fills_params(self):
+        build = compile("/users/:id(\\d+)/:tab?")
+        self.assertEqual(build({"id": 5}), "/users/5")
+        self.assertEqual(build({"id": 5, "tab": "posts"}), "/users/5/posts")
+        with self.assertRaises(TypeError):
+            build({"id": "x"})
+        with self.assertRaises(TypeError):
+            build({})
+        self.assertEqual(compile("/files/:path*")({"path": ["a", "b"]}), "/files/a/b")
+
+    def test_malformed_patterns_raise_type_error(self):
+        with self.assertRaises(TypeError):
+            parse("/users/(\\d+")
+        with self.assertRaises(TypeError):
+            parse("/users\\")
+
+
+if __name__ == "__main__":
+    unittest.main()
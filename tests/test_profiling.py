@@ -0,0 +1,95 @@
+import unittest
+from http.client import HTTPConnection
+from threading import Thread
+from time import monotonic, sleep
+
+from src import Profiler, RequestHandler
+from src.bench.server import make_server, start
+
+
+# what spin calls; on Python 3.12 cProfile picks up the builtins called by other threads
+SUM = "<built-in method builtins.sum>"
+
+
+def spin():
+    total = 0
+    started = monotonic()
+    while monotonic() - started < 0.3:
+        total += sum(range(100))
+    return total
+
+
+def idle():
+    sleep(0.3)
+
+
+class Busy(RequestHandler):
+    def __call__(self, request, response):
+        spin()
+        response.send_raw(b"busy")
+
+
+class Idle(RequestHandler):
+    def __call__(self, request, response):
+        idle()
+        response.send_raw(b"idle")
+
+
+def get(host: str, port: int, path: str, results: list):
+    client = HTTPConnection(host, port, timeout=10)
+    client.request("GET", path)
+    response = client.getresponse()
+    results.append((response.status, response.read()))
+    client.close()
+
+
+def calls(profiler: Profiler, route) -> dict:
+    # primitive call counts by function name
+    stats = profiler.stats(route)
+    return {} if stats is None else {name: counts[0] for (_, _, name), counts in stats.stats.items()}  # type: ignore[attr-defined]
+
+
+class ProfilerTest(unittest.TestCase):
+    def test_concurrent_requests_are_not_credited_to_the_profiled_route(self):
+        server = make_server()
+        profiler = server.enable_profiling(Profiler(sample_rate=1.0), path=None)
+        server.get("/idle", Idle())
+        server.get("/busy", Busy())
+        host, port = start(server)
+        try:
+            results: list = []
+            profiled = Thread(target=get, args=(host, port, "/idle", results))
+            profiled.start()
+            sleep(0.05)
+            get(host, port, "/busy", results)
+            profiled.join()
+            self.assertEqual(sorted(results), [(200, b"busy"), (200, b"idle")])
+            self.assertNotIn(SUM, calls(profiler, "/idle"))
+            self.assertGreater(profiler.skipped, 0)
+            # a request that runs alone is profiled
+            get(host, port, "/idle", results)
+            self.assertIn("idle", calls(profiler, "/idle"))
+            self.assertEqual(profiler.requests, {"/idle": 1})
+        finally:
+            server.shutdown()
+
+    def test_stats_add_up_per_route(self):
+        server = make_server()
+        profiler = server.enable_profiling(Profiler(sample_rate=1.0), path=None)
+        server.get("/idle", Idle())
+        server.get("/busy", Busy())
+        host, port = start(server)
+        try:
+            results: list = []
+            for path in ("/idle", "/idle", "/busy"):
+                get(host, port, path, results)
+            self.assertEqual(profiler.requests, {"/idle": 2, "/busy": 1})
+            self.assertNotIn(SUM, calls(profiler, "/idle"))
+            self.assertIn(SUM, calls(profiler, None))
+            self.assertEqual(calls(profiler, "/idle")["idle"], 2)
+        finally:
+            server.shutdown()
+
+
+if __name__ == "__main__":
+    unittest.main()
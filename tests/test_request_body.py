@@ -0,0 +1,64 @@
+import unittest
+from http.client import HTTPConnection
+
+from src import AsyncPyserve, RequestHandler
+from src.bench.server import make_server, start, start_async
+
+
+class Length(RequestHandler):
+    def __call__(self, request, response):
+        response.send_raw(str(len(request.stream().read())).encode())
+
+
+class Spooled(RequestHandler):
+    def __call__(self, request, response):
+        body = request.body_file()
+        # AsyncPyserve has read the body before dispatch; the threaded server reads it from the socket
+        received = getattr(request.handler.rfile, "_rolled", None)
+        response.send_raw(f"{len(body.read())} {body._rolled} {received}".encode())
+
+
+def post(host: str, port: int, path: str, body: bytes, chunked: bool=False):
+    client = HTTPConnection(host, port, timeout=5)
+    if chunked:
+        client.request("POST", path, body=iter([body[i:i + 1000] for i in range(0, len(body), 1000)]), encode_chunked=True)
+    else:
+        client.request("POST", path, body=body)
+    response = client.getresponse()
+    result = response.status, response.read()
+    client.close()
+    return result
+
+
+class RequestBodyTest(unittest.TestCase):
+    def check(self, host: str, port: int, small_received: str, large_received: str):
+        self.assertEqual(post(host, port, "/length", b"x" * 4000), (200, b"4000"))
+        self.assertEqual(post(host, port, "/length", b"x" * 4000, chunked=True), (200, b"4000"))
+        self.assertEqual(post(host, port, "/length", b"x" * 5000)[0], 413)
+        self.assertEqual(post(host, port, "/length", b"x" * 5000, chunked=True)[0], 413)
+        self.assertEqual(post(host, port, "/spooled", b"x" * 100), (200, f"100 False {small_received}".encode()))
+        self.assertEqual(post(host, port, "/spooled", b"x" * 4000, chunked=True), (200, f"4000 True {large_received}".encode()))
+
+    def test_threaded_limits_and_spooling(self):
+        server = make_server(max_body_size=4096, spool_threshold=1024)
+        server.post("/length", Length())
+        server.post("/spooled", Spooled())
+        host, port = start(server)
+        try:
+            self.check(host, port, "None", "None")
+        finally:
+            server.shutdown()
+
+    def test_async_limits_and_spooling(self):
+        app = AsyncPyserve("127.0.0.1", 0, access_log=False, max_body_size=4096, spool_threshold=1024)
+        app.post("/length", Length())
+        app.post("/spooled", Spooled())
+        host, port, stop = start_async(app)
+        try:
+            self.check(host, port, "False", "True")
+        finally:
+            stop()
+
+
+if __name__ == "__main__":
+    unittest.main()
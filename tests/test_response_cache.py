@@ -0,0 +1,139 @@
+import unittest
+from asyncio import sleep as async_sleep
+from http.client import HTTPConnection
+from threading import Lock, Thread
+from time import monotonic, sleep
+
+from src import AsyncPyserve, AsyncResponseCache, RequestHandler, ResponseCache
+from src.body import RequestBodyError
+from src.bench.server import make_server, start, start_async
+
+
+class RejectFirst(RequestHandler):
+    # the first request fails after a while without a response, so the after-handler hooks never run
+    def __init__(self):
+        self.calls = 0
+        self.lock = Lock()
+
+    def __call__(self, request, response):
+        with self.lock:
+            self.calls += 1
+            first = self.calls == 1
+        if first:
+            sleep(0.5)
+            raise RequestBodyError(400, "rejected")
+        response.send_raw(b"ok")
+
+
+class Slow(RequestHandler):
+    def __init__(self):
+        self.calls = 0
+        self.lock = Lock()
+
+    def __call__(self, request, response):
+        with self.lock:
+            self.calls += 1
+        sleep(0.2)
+        response.send_raw(b"slow")
+
+
+class AsyncSlow:
+    def __init__(self):
+        self.calls = 0
+
+    async def __call__(self, request, response):
+        self.calls += 1
+        await async_sleep(0.2)
+        response.send_raw(b"slow")
+
+
+def get(host: str, port: int, path: str, results: list):
+    client = HTTPConnection(host, port, timeout=10)
+    client.request("GET", path)
+    response = client.getresponse()
+    results.append((response.status, response.read()))
+    client.close()
+
+
+class ResponseCacheTest(unittest.TestCase):
+    def test_waiters_stop_waiting_when_the_first_miss_skips_store(self):
+        cache = ResponseCache(flight_timeout=5.0)
+        server = make_server()
+        server.use("*", cache)
+        server.get("/item", RejectFirst())
+        server.after(cache.store)
+        host, port = start(server)
+        try:
+            first: list = []
+            leader = Thread(target=get, args=(host, port, "/item", first))
+            leader.start()
+            sleep(0.2)
+            started = monotonic()
+            second: list = []
+            get(host, port, "/item", second)
+            elapsed = monotonic() - started
+            leader.join()
+            self.assertEqual(first, [(400, b"rejected")])
+            self.assertEqual(second, [(200, b"ok")])
+            self.assertLess(elapsed, 2.0)
+            self.assertEqual(cache.stats()["coalesced"], 1)
+            # the response of the request that ran the handler after waiting is cached
+            results: list = []
+            get(host, port, "/item", results)
+            self.assertEqual(results, [(200, b"ok")])
+            self.assertEqual(cache.stats()["entries"], 1)
+        finally:
+            server.shutdown()
+
+
+    def coalesce(self, app: AsyncPyserve, cache: AsyncResponseCache) -> float:
+        # six concurrent misses for one key, more than the handler pool has threads
+        host, port, stop = start_async(app)
+        try:
+            results: list = []
+            threads = [Thread(target=get, args=(host, port, "/slow", results)) for _ in range(6)]
+            started = monotonic()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = monotonic() - started
+        finally:
+            stop()
+        self.assertEqual(results, [(200, b"slow")] * 6)
+        stats = cache.stats()
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["hits"], 5)
+        self.assertGreater(stats["coalesced"], 0)
+        return elapsed
+
+    def test_async_waiters_do_not_hold_pool_threads(self):
+        cache = AsyncResponseCache(flight_timeout=5.0)
+        app = AsyncPyserve("127.0.0.1", 0, access_log=False, max_workers=2)
+        handler = Slow()
+        app.use("*", cache)
+        app.get("/slow", handler)
+        app.after(cache.store)
+        self.assertLess(self.coalesce(app, cache), 2.0)
+        self.assertEqual(handler.calls, 1)
+
+    def test_async_waiters_do_not_block_the_event_loop(self):
+        cache = AsyncResponseCache(flight_timeout=5.0)
+        app = AsyncPyserve("127.0.0.1", 0, access_log=False, offload_sync_handlers=False)
+        handler = AsyncSlow()
+        app.use("*", cache)
+        app.get("/slow", handler)
+        app.after(cache.store)
+        self.assertLess(self.coalesce(app, cache), 2.0)
+        self.assertEqual(handler.calls, 1)
+
+    def test_async_server_refuses_the_blocking_cache(self):
+        app = AsyncPyserve("127.0.0.1", 0, access_log=False)
+        with self.assertRaises(TypeError):
+            app.use("*", ResponseCache())
+        with self.assertRaises(TypeError):
+            make_server().use("*", AsyncResponseCache())
+
+
+if __name__ == "__main__":
+    unittest.main()
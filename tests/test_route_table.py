@@ -0,0 +1,70 @@
+import unittest
+
+from src import RequestHandler, Router
+from src.path_to_regexp import path_to_regex
+from src.route_table import RouteTable
+
+PATTERNS = [
+    "*", "/*", "/", "/api", "/api/*", "/api/*/x", "/api/:id", "/api/:id?", "/:id?",
+    "/files/:path*", "/files/:path+", "/a/(\\d+)", "/users/:id/posts", "/:name.:ext",
+]
+PATHS = [
+    "/", "/api", "/api/", "/api/1", "/api/1/", "/api/q/x", "/x", "/x/", "/files", "/files/",
+    "/files/a/b", "/a/12", "/a/x", "/users/3/posts", "/users/3/posts/", "/f.txt",
+]
+
+
+def _regex(pattern: str):
+    return path_to_regex("/".join("(.*)" if segment == "*" else segment for segment in pattern.split("/")), sensitive=True)
+
+
+class Noop(RequestHandler):
+    def __call__(self, request, response):
+        pass
+
+
+class RouteTableTest(unittest.TestCase):
+    def test_trie_matches_like_path_to_regex(self):
+        for pattern in PATTERNS:
+            table: RouteTable[int] = RouteTable()
+            table[pattern] = 1
+            regex = _regex(pattern)
+            for path in PATHS:
+                with self.subTest(pattern=pattern, path=path):
+                    expected = regex.match(path)
+                    found = table.match(path)
+                    self.assertEqual(found is not None, expected is not None)
+                    if expected is not None and found is not None:
+                        self.assertEqual(list(found.params.values()), [g for g in expected.groups() if g is not None])
+
+    def test_match_all_returns_every_matching_pattern_in_order(self):
+        table: RouteTable[int] = RouteTable()
+        for i, pattern in enumerate(PATTERNS):
+            table[pattern] = i
+        for path in PATHS:
+            with self.subTest(path=path):
+                expected = [pattern for pattern in PATTERNS if _regex(pattern).match(path)]
+                self.assertEqual([m.pattern for m in table.match_all(path)], expected)
+
+    def test_wildcard_middleware_runs_for_root(self):
+        mw = Noop()
+        router = Router()
+        router.use("*", mw)
+        dispatch = router._lookup("/", "get")
+        self.assertIsNotNone(dispatch)
+        self.assertEqual(dispatch.chain, [mw])
+
+    def test_mounted_wildcard_middleware_runs_for_mount_prefix(self):
+        auth, handler = Noop(), Noop()
+        api = Router()
+        api.use("/*", auth)
+        api.get("/", handler)
+        router = Router()
+        router.mount("/api/v1", api)
+        dispatch = router._lookup("/api/v1", "get")
+        self.assertIsNotNone(dispatch)
+        self.assertEqual(dispatch.chain, [auth, handler])
+
+
+if __name__ == "__main__":
+    unittest.main()
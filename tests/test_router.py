@@ -0,0 +1,121 @@
+import unittest
+
+from src import AsyncPyserve, AsyncRequestHandler, RequestHandler, Router
+from src.bench.server import make_server
+
+
+class Sync(RequestHandler):
+    def __call__(self, request, response):
+        response.send_raw(b"sync")
+
+
+class Async(AsyncRequestHandler):
+    async def __call__(self, request, response):
+        response.send_raw(b"async")
+
+
+class CoroutineHandlerTest(unittest.TestCase):
+    def test_threaded_server_refuses_coroutine_handlers(self):
+        server = make_server()
+        with self.assertRaises(TypeError):
+            server.get("/", Async())
+        with self.assertRaises(TypeError):
+            server.use("*", Async())
+        server.get("/", Sync())
+        self.assertEqual(server.request_handlers.get["/"].__class__, Sync)
+        self.assertEqual(len(server.pattern_middlewares), 0)
+
+    def test_threaded_server_refuses_coroutine_handlers_of_mounted_routers(self):
+        server = make_server()
+        api = Router()
+        api.get("/a", Async())
+        with self.assertRaises(TypeError):
+            server.mount("/api", api)
+        self.assertEqual(server.mounts, {})
+        self.assertEqual(api._parents, [])
+        # registered after mounting
+        api = Router()
+        server.mount("/api", api)
+        with self.assertRaises(TypeError):
+            api.post("/b", Async())
+        nested = Router()
+        api.mount("/v1", nested)
+        with self.assertRaises(TypeError):
+            nested.use("*", Async())
+
+    def test_async_server_accepts_coroutine_handlers(self):
+        app = AsyncPyserve("127.0.0.1", 0, access_log=False)
+        api = Router()
+        api.get("/a", Async())
+        app.mount("/api", api)
+        app.get("/", Async())
+        self.assertIsNotNone(app._resolve("/api/a", "get"))
+
+
+class MountTest(unittest.TestCase):
+    def test_mount_refuses_cycles(self):
+        a, b, c = Router(), Router(), Router()
+        with self.assertRaises(ValueError):
+            a.mount("/a", a)
+        a.mount("/b", b)
+        b.mount("/c", c)
+        with self.assertRaises(ValueError):
+            b.mount("/a", a)
+        with self.assertRaises(ValueError):
+            c.mount("/a", a)
+        self.assertEqual(b.mounts, {"/c": c})
+        self.assertEqual(c.mounts, {})
+        self.assertIsNone(a._resolve("/b/c/x", "get"))
+
+    def test_a_router_may_be_mounted_twice(self):
+        api = Router()
+        api.get("/x", Sync())
+        app = Router()
+        app.mount("/v1", api)
+        app.mount("/v2", api)
+        self.assertEqual(app._resolve("/v2/x", "get").pattern, "/v2/x")
+
+
+class UrlForTest(unittest.TestCase):
+    def round_trip(self, router: Router, name: str, params: dict, path: str):
+        built = router.url_for(name, **params)
+        self.assertEqual(built, path)
+        dispatch = router._resolve(built, "get")
+        self.assertIsNotNone(dispatch)
+        self.assertEqual(dict(dispatch.params), {key: str(value) for key, value in params.items()})
+
+    def test_params_are_encoded_and_matched_decoded(self):
+        app = Router()
+        app.get("/users/:id", Sync(), name="user")
+        app.get("/users/:id/posts/:post(\\d+)", Sync(), name="post")
+        self.round_trip(app, "user", {"id": 5}, "/users/5")
+        self.round_trip(app, "user", {"id": "a b/c?d"}, "/users/a%20b%2Fc%3Fd")
+        self.round_trip(app, "user", {"id": "100%"}, "/users/100%25")
+        self.round_trip(app, "post", {"id": "é", "post": 7}, "/users/%C3%A9/posts/7")
+        with self.assertRaises(TypeError):
+            app.url_for("post", id=1, post="x")
+        with self.assertRaises(KeyError):
+            app.url_for("missing")
+
+    def test_star_segments_keep_their_slashes(self):
+        app = Router()
+        app.get("/files/*", Sync(), name="file")
+        self.round_trip(app, "file", {"0": "docs/a b.txt"}, "/files/docs/a%20b.txt")
+
+    def test_mounted_routes_get_their_prefix(self):
+        api = Router()
+        api.get("/users/:id", Sync(), name="user")
+        api.get("/", Sync(), name="index")
+        nested = Router()
+        nested.get("/files/*", Sync(), name="file")
+        api.mount("/v1", nested)
+        app = Router()
+        app.mount("/api", api)
+        self.round_trip(app, "user", {"id": "x y"}, "/api/users/x%20y")
+        self.round_trip(app, "file", {"0": "a/b c"}, "/api/v1/files/a/b%20c")
+        self.assertEqual(app.url_for("index"), "/api")
+        self.assertEqual(api.url_for("file", **{"0": "a"}), "/v1/files/a")
+
+
+if __name__ == "__main__":
+    unittest.main()
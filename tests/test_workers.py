@@ -0,0 +1,98 @@
+import json
+import os
+import unittest
+from http.client import HTTPConnection
+from http.server import HTTPServer, ThreadingHTTPServer
+from threading import Thread
+from time import monotonic, sleep
+from typing import Any, List
+
+from src import Pyserve, RequestHandler
+from src.bench.server import free_port, start_workers
+from src.workers import Supervisor
+
+
+class Pid(RequestHandler):
+    def __call__(self, request, response):
+        response.send_json({"pid": os.getpid()})
+
+
+class Slow(RequestHandler):
+    def __call__(self, request, response):
+        sleep(1.5)
+        response.send_json({"pid": os.getpid()})
+
+
+def get(host: str, port: int, path: str, results: List[Any]):
+    try:
+        client = HTTPConnection(host, port, timeout=10)
+        client.request("GET", path)
+        response = client.getresponse()
+        results.append((response.status, json.loads(response.read())))
+        client.close()
+    except Exception as e:
+        results.append(e)
+
+
+def gone(pid: int, timeout: float) -> bool:
+    deadline = monotonic() + timeout
+    while monotonic() < deadline:
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return True
+        sleep(0.05)
+    return False
+
+
+@unittest.skipUnless(hasattr(os, "fork"), "worker processes need fork")
+class WorkerShutdownTest(unittest.TestCase):
+    def test_sigterm_lets_the_in_flight_request_finish(self):
+        app = Pyserve("127.0.0.1", free_port(), server_class=HTTPServer, access_log=False, workers=2, shutdown_timeout=10)
+        app.get("/slow", Slow())
+        host, port, _, stop = start_workers(app)
+        results: List[Any] = []
+        client = Thread(target=get, args=(host, port, "/slow", results))
+        client.start()
+        sleep(0.5)
+        started = monotonic()
+        stop()
+        client.join()
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0][0], 200)
+        # the worker exited once its request was done, well before it would have been killed
+        self.assertLess(monotonic() - started, 5)
+        self.assertTrue(gone(results[0][1]["pid"], 1))
+
+    def test_recycled_worker_finishes_its_request_and_exits(self):
+        # the forked supervisor and workers inherit these
+        for name, value in (("check_interval", 0.5), ("poll_interval", 0.05)):
+            self.addCleanup(setattr, Supervisor, name, getattr(Supervisor, name))
+            setattr(Supervisor, name, value)
+        app = Pyserve("127.0.0.1", free_port(), server_class=ThreadingHTTPServer, access_log=False, max_requests=1, shutdown_timeout=10)
+        app.get("/", Pid())
+        app.get("/slow", Slow())
+        app.enable_metrics()
+        host, port, _, stop = start_workers(app)
+        try:
+            first: List[Any] = []
+            get(host, port, "/", first)
+            # in flight when the worker reaches max_requests and its replacement becomes ready
+            slow: List[Any] = []
+            get(host, port, "/slow", slow)
+            self.assertEqual(slow[0][0], 200)
+            old = slow[0][1]["pid"]
+            self.assertEqual(old, first[0][1]["pid"])
+            self.assertTrue(gone(old, 3), "the recycled worker did not exit on its own")
+            metrics = HTTPConnection(host, port, timeout=5)
+            metrics.request("GET", "/metrics")
+            text = metrics.getresponse().read().decode()
+            metrics.close()
+            self.assertIn('pyserve_worker_events_total{event="recycled_requests"} 1', text)
+            self.assertIn('pyserve_worker_events_total{event="drain_killed"} 0', text)
+        finally:
+            stop()
+
+
+if __name__ == "__main__":
+    unittest.main()